@@ -0,0 +1,305 @@
+#COSA FA: Processa in background le immagini di 'immagini_piante' con processed=False
+# (upload e import massivi), con inferenza CNN a batch e scrittura con bulk_write.
+#
+# - Riprendibile: checkpoint dell'ultimo _id processato in 'cnn_batch_state'.
+# - Una passata alla volta: lease sul documento di checkpoint (job in background,
+#   endpoint e riga di comando non si sovrascrivono il checkpoint).
+# - Immagini in errore ritentate al più CNN_BATCH_MAX_ATTEMPTS volte (contatore 'cnnattempts').
+# - Limitato: CNN_BATCH_MAX_IPS immagini/secondo (0 = nessun limite).
+# - Report: immagini/secondo, processate, errori.
+#
+# Uso da riga di comando:
+#   python ai/batch_processor.py --limit 5000
+
+import asyncio
+import logging
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional, Dict, Any, Callable, List
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from ai.embedding_store import embedding_store, REF_IMAGE
+
+logger = logging.getLogger(__name__)
+
+# Configurazione da ENV
+CNN_BATCH_SIZE = int(os.getenv("CNN_BATCH_SIZE", "32"))
+CNN_BATCH_MAX_IPS = float(os.getenv("CNN_BATCH_MAX_IPS", "0"))            # throttling (immagini/s)
+CNN_BATCH_ENABLED = os.getenv("CNN_BATCH_ENABLED", "0").strip().lower() in ("1", "true", "yes", "on")
+CNN_BATCH_INTERVAL = int(os.getenv("CNN_BATCH_INTERVAL", "300"))          # pausa tra due passate (s)
+CNN_BATCH_MAX_ATTEMPTS = int(os.getenv("CNN_BATCH_MAX_ATTEMPTS", "3"))    # tentativi per immagine in errore
+CNN_BATCH_LEASE_SECONDS = int(os.getenv("CNN_BATCH_LEASE_SECONDS", "600"))  # lease della passata (rinnovato a ogni batch)
+
+STATE_COLLECTION = "cnn_batch_state"
+
+
+class BatchAlreadyRunningError(Exception):
+    """Un'altra passata sulla stessa collection è in corso."""
+    pass
+
+
+class ImageBatchProcessor:
+    """
+    Scorre le immagini non processate in ordine di _id con un cursore,
+    esegue l'inferenza a batch e scrive i risultati con bulk_write.
+    """
+
+    def __init__(
+        self,
+        collection,
+        predict_batch: Callable[[List[bytes], List[Optional[str]]], List[dict]],
+        model_version: Callable[[], str],
+        batch_size: int = CNN_BATCH_SIZE,
+        max_ips: float = CNN_BATCH_MAX_IPS,
+        embedding_store=None,
+        max_attempts: int = CNN_BATCH_MAX_ATTEMPTS,
+    ):
+        self.collection = collection
+        self.state = collection.database[STATE_COLLECTION]
+        self.predict_batch = predict_batch
+        self.model_version = model_version
+        self.batch_size = max(1, batch_size)
+        self.max_ips = max_ips
+        self.embedding_store = embedding_store  # opzionale: archivio embedding per i casi simili
+        self.max_attempts = max(1, max_attempts)
+        self._lease_owner: Optional[str] = None
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    def ensure_indexes(self):
+        try:
+            self.collection.create_index([("processed", ASCENDING), ("_id", ASCENDING)], name="idx_processed_id")
+        except Exception as e:
+            print(f"[WARN] batch processor indexes: {e}")
+
+    # --- Checkpoint ---
+    def _load_checkpoint(self):
+        doc = self.state.find_one({"_id": self.collection.name})
+        return doc.get("lastId") if doc else None
+
+    def _save_checkpoint(self, last_id):
+        now = datetime.utcnow()
+        update = {"lastId": last_id, "updatedAt": now}
+        if self._lease_owner:
+            update["leaseUntil"] = now + timedelta(seconds=CNN_BATCH_LEASE_SECONDS)   # rinnovo
+        self.state.update_one({"_id": self.collection.name}, {"$set": update}, upsert=True)
+
+    # --- Lease: una passata alla volta ---
+    def _acquire_lease(self):
+        """Prende il lease della passata; BatchAlreadyRunningError se un'altra passata lo tiene."""
+        now = datetime.utcnow()
+        owner = uuid.uuid4().hex
+        try:
+            # Documento assente -> upsert; lease scaduto -> update; lease attivo -> DuplicateKeyError
+            self.state.update_one(
+                {"_id": self.collection.name, "$or": [{"leaseUntil": None}, {"leaseUntil": {"$lt": now}}]},
+                {"$set": {"leaseOwner": owner, "leaseUntil": now + timedelta(seconds=CNN_BATCH_LEASE_SECONDS)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            raise BatchAlreadyRunningError("Elaborazione batch già in corso, riprovare più tardi")
+        self._lease_owner = owner
+
+    def _release_lease(self):
+        if not self._lease_owner:
+            return
+        try:
+            self.state.update_one(
+                {"_id": self.collection.name, "leaseOwner": self._lease_owner},
+                {"$set": {"leaseUntil": None}},
+            )
+        except Exception as e:
+            logger.warning(f"[CNN BATCH] Rilascio lease: {e}")
+        self._lease_owner = None
+
+    def _failed(self, oid, error: str) -> UpdateOne:
+        # Resta processed=False: ritentata alle passate successive fino a max_attempts
+        return UpdateOne({"_id": oid}, {"$set": {"cnnerror": error}, "$inc": {"cnnattempts": 1}})
+
+    # --- Singolo batch ---
+    def _process_batch(self, docs: List[dict]) -> Dict[str, int]:
+        images, contexts, ids = [], [], []
+        ops = []
+        now = datetime.utcnow()
+
+        for doc in docs:
+            path = doc.get("filepathfull")
+            try:
+                with open(path, "rb") as f:
+                    images.append(f.read())
+                contexts.append(doc.get("planttype"))
+                ids.append(doc["_id"])
+            except Exception as e:
+                ops.append(self._failed(doc["_id"], f"File non leggibile: {e}"))
+
+        results = self.predict_batch(images, contexts) if images else []
+        version = self.model_version()
+        ok = 0
+        embeddings = []
+        for oid, res in zip(ids, results):
+            if not res or "error" in res or res.get("label") == "Errore":
+                err = (res or {}).get("error") or (res or {}).get("advice") or "Errore inferenza"
+                ops.append(self._failed(oid, err))
+                continue
+            ok += 1
+            embeddings.append((REF_IMAGE, oid, res.pop("embedding", None), res["label"], res["confidence"]))
+            ops.append(UpdateOne(
+                {"_id": oid, "processed": False},
+                {
+                    "$set": {
+                        "processed": True,
+                        "processed_timestamp": now,
+                        "cnnresults": {
+                            "disease_detected": res["label"],
+                            "confidence": res["confidence"],
+                            "recommendations": [res["advice"]],
+                            "processed_at": now,
+                            "model_version": version,
+                        },
+                    },
+                    "$unset": {"cnnerror": "", "cnnattempts": ""},
+                },
+            ))
+
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+        if self.embedding_store is not None and embeddings:
+            self.embedding_store.add_many(embeddings, version)
+        return {"processed": ok, "errors": len(docs) - ok}
+
+    # --- Passata completa ---
+    def run_once(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Processa fino a 'limit' immagini (None = tutte) e ritorna il report.
+        Riparte dal checkpoint; a fine passata il checkpoint viene azzerato
+        così le immagini fallite vengono ritentate alla passata successiva
+        (al più max_attempts volte, poi restano con 'cnnerror').
+        BatchAlreadyRunningError se un'altra passata è in corso.
+        """
+        self._acquire_lease()
+        try:
+            return self._run_pass(limit)
+        finally:
+            self._release_lease()
+
+    def _run_pass(self, limit: Optional[int]) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        last_id = self._load_checkpoint()
+        query = {"processed": False, "cnnattempts": {"$not": {"$gte": self.max_attempts}}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+
+        projection = {"_id": 1, "filepathfull": 1, "planttype": 1}
+        cursor = (
+            self.collection.find(query, projection)
+            .sort("_id", ASCENDING)
+            .batch_size(self.batch_size)
+        )
+        if limit:
+            cursor = cursor.limit(limit)
+
+        totals = {"processed": 0, "errors": 0, "batches": 0}
+        batch: List[dict] = []
+        exhausted = True
+
+        def flush():
+            res = self._process_batch(batch)
+            totals["processed"] += res["processed"]
+            totals["errors"] += res["errors"]
+            totals["batches"] += 1
+            self._save_checkpoint(batch[-1]["_id"])
+            seen = totals["processed"] + totals["errors"]
+            elapsed = time.perf_counter() - t0
+            logger.info(f"[CNN BATCH] {seen} immagini, {seen / elapsed:.1f} img/s")
+            # Throttling: non superare max_ips immagini/secondo
+            if self.max_ips > 0:
+                min_elapsed = seen / self.max_ips
+                if elapsed < min_elapsed:
+                    time.sleep(min_elapsed - elapsed)
+
+        for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                flush()
+                batch = []
+        if batch:
+            flush()
+
+        if limit and totals["processed"] + totals["errors"] >= limit:
+            exhausted = False
+        if exhausted:
+            self._save_checkpoint(None)
+
+        elapsed = time.perf_counter() - t0
+        seen = totals["processed"] + totals["errors"]
+        self.last_report = {
+            **totals,
+            "images": seen,
+            "elapsed_s": round(elapsed, 2),
+            "images_per_sec": round(seen / elapsed, 2) if elapsed > 0 else None,
+            "completed_pass": exhausted,
+            "finished_at": datetime.utcnow().isoformat(),
+        }
+        return self.last_report
+
+    async def run_forever(self, interval: int = CNN_BATCH_INTERVAL):
+        """Loop in background (thread dedicato per ogni passata)."""
+        while True:
+            try:
+                report = await asyncio.to_thread(self.run_once)
+                if report["images"]:
+                    logger.info(f"[CNN BATCH] Passata completata: {report}")
+            except BatchAlreadyRunningError:
+                logger.info("[CNN BATCH] Passata già in corso altrove, salto")
+            except Exception as e:
+                logger.error(f"[CNN BATCH] Errore: {e}")
+            await asyncio.sleep(interval)
+
+
+def get_batch_processor() -> ImageBatchProcessor:
+    """Processor che usa il pool di inferenza dell'app (worker separati)."""
+    from database import db
+    from ai.cnn_service import cnn_classifier
+    from ai.inference_pool import inference_pool
+    return ImageBatchProcessor(
+        db["immagini_piante"], inference_pool.predict_batch_sync, cnn_classifier.model_version,
+        embedding_store=embedding_store,
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import db
+    from ai.cnn_service import cnn_classifier
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Processa le immagini non ancora analizzate dalla CNN")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=CNN_BATCH_SIZE)
+    parser.add_argument("--max-ips", type=float, default=CNN_BATCH_MAX_IPS)
+    args = parser.parse_args()
+
+    # Da riga di comando l'inferenza gira in-process
+    processor = ImageBatchProcessor(
+        db["immagini_piante"], cnn_classifier.predict_health_batch, cnn_classifier.model_version,
+        batch_size=args.batch_size, max_ips=args.max_ips, embedding_store=embedding_store,
+    )
+    processor.ensure_indexes()
+    try:
+        report = processor.run_once(limit=args.limit)
+    except BatchAlreadyRunningError as e:
+        print(f"[CNN BATCH] {e}")
+        sys.exit(1)
+
+    print(f"\n{'='*60}")
+    print(f"   ✓ Processate: {report['processed']}")
+    print(f"   ✗ Errori: {report['errors']}")
+    print(f"   Tempo: {report['elapsed_s']}s | Throughput: {report['images_per_sec']} img/s")
+    print(f"{'='*60}\n")
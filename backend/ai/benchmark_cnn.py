@@ -0,0 +1,214 @@
+#COSA FA: Benchmark della CNN.
+#  --mode backends:   latenza e memoria dei backend di inferenza (Keras vs TFLite float16/int8,
+#                     cascata modello veloce -> completo con frazione di immagini inoltrate).
+#                     Ogni backend gira in un processo separato, così tempo di caricamento e
+#                     picco di memoria (RSS) non si influenzano a vicenda.
+#  --mode preprocess: preprocessing legacy (decode completo + float64) vs fast path
+#                     (JPEG draft + buffer uint8) su foto realistiche da 12MP.
+#
+# Uso:
+#   python ai/benchmark_cnn.py --images /path/cartella_immagini --runs 100
+#   python ai/benchmark_cnn.py --mode preprocess --images /path/foto_12mp
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+BACKENDS = {
+    "keras": {"CNN_BACKEND": "keras"},
+    "tflite-float16": {"CNN_BACKEND": "tflite", "CNN_TFLITE_VARIANT": "float16"},
+    "tflite-int8": {"CNN_BACKEND": "tflite", "CNN_TFLITE_VARIANT": "int8"},
+    "cascade": {"CNN_BACKEND": "keras", "CNN_CASCADE": "1"},
+}
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss è in KB su Linux, in byte su macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _load_corpus(images_dir: str, limit: int):
+    files = sorted(p for p in Path(images_dir).rglob("*") if p.suffix.lower() in IMAGE_EXTS)[:limit]
+    return [f.read_bytes() for f in files]
+
+
+def _synthetic_corpus(n: int):
+    from io import BytesIO
+    from PIL import Image
+    rnd = np.random.default_rng(0)
+    out = []
+    for _ in range(n):
+        arr = rnd.integers(0, 255, size=(1024, 768, 3), dtype=np.uint8)
+        buf = BytesIO()
+        Image.fromarray(arr).save(buf, format="JPEG", quality=90)
+        out.append(buf.getvalue())
+    return out
+
+
+def _synthetic_photos(n: int, size=(4032, 3024)):
+    """
+    JPEG 12MP "realistici": gradiente + texture + rumore, qualità 90
+    (dimensione del file e costo di decodifica simili a una foto da smartphone).
+    """
+    from io import BytesIO
+    from PIL import Image
+    rnd = np.random.default_rng(1)
+    w, h = size
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    out = []
+    for i in range(n):
+        base = np.stack([
+            120 + 60 * np.sin(xx / (180 + 40 * i)),
+            140 + 50 * np.cos(yy / (150 + 30 * i)),
+            80 + 40 * np.sin((xx + yy) / 300),
+        ], axis=-1)
+        base += rnd.normal(0, 12, size=base.shape).astype(np.float32)
+        arr = np.clip(base, 0, 255).astype(np.uint8)
+        buf = BytesIO()
+        Image.fromarray(arr).save(buf, format="JPEG", quality=90)
+        out.append(buf.getvalue())
+    return out
+
+
+def _legacy_preprocess(image_bytes: bytes) -> np.ndarray:
+    """Preprocessing originale: decode completo, resize, float32 -> /255 (float64)."""
+    from io import BytesIO
+    from PIL import Image
+    img = Image.open(BytesIO(image_bytes))
+    if img.mode != 'RGB': img = img.convert('RGB')
+    img = img.resize((224, 224))
+    arr = np.expand_dims(np.asarray(img, dtype=np.float32), axis=0)
+    return arr / np.float64(255.0)
+
+
+def run_preprocess(images_dir: str = None, runs: int = 20, limit: int = 20):
+    from ai.cnn_service import cnn_classifier
+
+    corpus = _load_corpus(images_dir, limit) if images_dir else _synthetic_photos(min(limit, 5))
+    if not corpus:
+        print(" ERRORE: nessuna immagine trovata")
+        return {}
+    avg_mb = sum(len(c) for c in corpus) / len(corpus) / 1e6
+    print(f"\n Benchmark preprocessing: {len(corpus)} immagini (media {avg_mb:.1f} MB), {runs} iterazioni\n")
+
+    results = {}
+    for name, fn in (("legacy", _legacy_preprocess), ("fast", cnn_classifier.preprocess_image)):
+        lat = []
+        for i in range(runs):
+            data = corpus[i % len(corpus)]
+            t = time.perf_counter()
+            fn(data)
+            lat.append((time.perf_counter() - t) * 1000)
+        lat = np.array(lat)
+        results[name] = {
+            "p50_ms": round(float(np.percentile(lat, 50)), 2),
+            "p95_ms": round(float(np.percentile(lat, 95)), 2),
+        }
+
+    # Differenza numerica dell'input al modello (draft riduce prima del resize)
+    diff = float(np.mean(np.abs(
+        _legacy_preprocess(corpus[0]) - cnn_classifier.preprocess_image(corpus[0]) / 255.0
+    )))
+    results["mean_abs_input_diff"] = round(diff, 4)
+
+    print(f"{'percorso':<10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name in ("legacy", "fast"):
+        print(f"{name:<10}{results[name]['p50_ms']:>10}{results[name]['p95_ms']:>10}")
+    speedup = results["legacy"]["p50_ms"] / max(results["fast"]["p50_ms"], 1e-6)
+    print(f"\n Speed-up p50: x{speedup:.1f} | differenza media input: {diff:.4f}")
+    return results
+
+
+def _bench_backend(name: str, env: dict, corpus, runs: int, queue):
+    os.environ.update(env)
+    from ai.cnn_service import PlantClassifierCNN
+
+    rss_before = _peak_rss_mb()
+    clf = PlantClassifierCNN()
+    t0 = time.perf_counter()
+    ok = clf.ensure_loaded()
+    load_s = time.perf_counter() - t0
+    backend = getattr(clf._model, "name", None)
+    if not ok or (env["CNN_BACKEND"] == "tflite" and backend != "tflite") or (
+        env.get("CNN_CASCADE") == "1" and clf._fast_model is None
+    ):
+        queue.put({"backend": name, "error": "modello non disponibile"})
+        return
+
+    # Warm-up (prima invocazione esclusa dalle misure)
+    clf.predict_health(corpus[0])
+
+    latencies = []
+    for i in range(runs):
+        data = corpus[i % len(corpus)]
+        t = time.perf_counter()
+        clf.predict_health(data)
+        latencies.append((time.perf_counter() - t) * 1000)
+
+    lat = np.array(latencies)
+    cascade = clf.status().get("cascade")
+    queue.put({
+        "backend": name,
+        "escalation_rate": cascade["escalation_rate"] if cascade else None,
+        "load_s": round(load_s, 2),
+        "p50_ms": round(float(np.percentile(lat, 50)), 2),
+        "p95_ms": round(float(np.percentile(lat, 95)), 2),
+        "mean_ms": round(float(lat.mean()), 2),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "rss_delta_mb": round(_peak_rss_mb() - rss_before, 1),
+    })
+
+
+def run(images_dir: str = None, runs: int = 100, limit: int = 50, backends=None):
+    corpus = _load_corpus(images_dir, limit) if images_dir else _synthetic_corpus(10)
+    if not corpus:
+        print(" ERRORE: nessuna immagine trovata")
+        return []
+
+    print(f"\n Benchmark CNN: {len(corpus)} immagini, {runs} inferenze per backend\n")
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for name in (backends or BACKENDS):
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_bench_backend, args=(name, BACKENDS[name], corpus, runs, queue))
+        proc.start()
+        proc.join()
+        results.append(queue.get() if not queue.empty() else {"backend": name, "error": "processo terminato"})
+
+    print(f"{'backend':<16}{'load s':>8}{'p50 ms':>10}{'p95 ms':>10}{'RSS MB':>10}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['backend']:<16}  {r['error']}")
+        else:
+            print(f"{r['backend']:<16}{r['load_s']:>8}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['peak_rss_mb']:>10}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark backend CNN")
+    parser.add_argument("--mode", choices=["backends", "preprocess"], default="backends")
+    parser.add_argument("--images", help="Cartella con immagini reali (default: immagini sintetiche)")
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=50, help="Numero massimo di immagini caricate")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS))
+    parser.add_argument("--json", help="Salva i risultati in un file JSON")
+    args = parser.parse_args()
+
+    if args.mode == "preprocess":
+        res = run_preprocess(args.images, args.runs, args.limit)
+    else:
+        res = run(args.images, args.runs, args.limit, args.backends)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(res, f, indent=2)
@@ -1,17 +1,214 @@
 import logging
 import numpy as np
 from PIL import Image
-import tensorflow as tf
 from io import BytesIO
 import os
 import json
+import threading
+import time
+from functools import lru_cache
+from typing import Optional, List
 
 logger = logging.getLogger(__name__)
 
+# TensorFlow NON viene importato a livello di modulo: il solo import costa
+# secondi e centinaia di MB per worker. Viene caricato al primo utilizzo
+# (o dal warm-up in background avviato in main.py).
+CNN_ENABLED = os.getenv("CNN_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off")
+CNN_WARMUP = os.getenv("CNN_WARMUP", "1").strip().lower() not in ("0", "false", "no", "off")
+
+# Backend di inferenza: "keras" (.h5) oppure "tflite" (vedi ai/convert_tflite.py)
+CNN_BACKEND = os.getenv("CNN_BACKEND", "keras").strip().lower()
+CNN_TFLITE_VARIANT = os.getenv("CNN_TFLITE_VARIANT", "float16").strip().lower()   # float16 | int8
+CNN_TFLITE_THREADS = int(os.getenv("CNN_TFLITE_THREADS", "2"))
+
+# Cascata: un classificatore veloce (es. MobileNetV3-small, vedi train_health.py --arch fast)
+# analizza prima l'immagine; il modello completo gira solo se la confidenza è sotto soglia.
+CNN_CASCADE = os.getenv("CNN_CASCADE", "0").strip().lower() in ("1", "true", "yes", "on")
+CNN_CASCADE_MODEL_PATH = os.getenv(
+    "CNN_CASCADE_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "models/plant_disease_model_fast.h5"),
+)
+CNN_CASCADE_THRESHOLD = float(os.getenv("CNN_CASCADE_THRESHOLD", "0.9"))
+
+# Sinonimi (italiano / varianti) -> specie canonica delle etichette PlantVillage.
+# Controllati in ordine: in caso di più corrispondenze vince la prima (come i controlli
+# in sequenza originali, dove la specie canonica non contiene i sinonimi successivi).
+SPECIES_SYNONYMS = (
+    (("pomodoro",), "tomato"),
+    (("patata",), "potato"),
+    (("peperone", "pepper"), "pepper"),
+    (("pesca",), "peach"),
+    (("uva", "vite"), "grape"),
+)
+
+
+@lru_cache(maxsize=512)
+def _resolve_species(plant_context: str) -> Optional[str]:
+    """'Pomodoro San Marzano' -> 'tomato'; 'generic' -> None (nessun filtro)."""
+    target = plant_context.lower()
+    if target == "generic":
+        return None
+    for keys, species in SPECIES_SYNONYMS:
+        if any(k in target for k in keys):
+            return species
+    return target
+
+
+class _KerasBackend:
+    """Inferenza con il modello Keras completo (.h5)."""
+    name = "keras"
+
+    def __init__(self, model_path: str, num_classes: int = 0):
+        import tensorflow as tf
+        self.path = model_path
+        base = tf.keras.models.load_model(model_path)
+        # Due uscite: embedding del penultimo layer (per la ricerca di casi simili) + probabilità
+        dual = tf.keras.Model(base.input, [base.layers[-2].output, base.output])
+        # Normalizzazione fusa nel grafo: il modello riceve direttamente uint8 [0,255]
+        inp = tf.keras.Input(shape=base.input_shape[1:], dtype="uint8")
+        emb, out = dual(tf.keras.layers.Rescaling(1.0 / 255)(inp))
+        self._model = tf.keras.Model(inp, [emb, out])
+
+    def predict_with_embedding(self, batch: np.ndarray):
+        # Chiamata diretta: evita l'overhead di Model.predict() su batch piccoli
+        emb, out = self._model(batch, training=False)
+        return out.numpy(), emb.numpy()
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.predict_with_embedding(batch)[0]
+
+
+class _TFLiteBackend:
+    """
+    Inferenza con TFLite Interpreter (CPU, delegate XNNPACK di default).
+    Supporta modelli float16 e int8 (post-training quantization): se
+    l'input/output del modello è quantizzato, (de)quantizza qui.
+    Se il modello è stato convertito con l'uscita embedding (convert_tflite.py),
+    restituisce anche quella.
+    """
+    name = "tflite"
+
+    def __init__(self, model_path: str, num_threads: int = 2, num_classes: int = 0):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self.path = model_path
+        self._interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        outputs = self._interpreter.get_output_details()
+        self._output, self._embedding = outputs[-1], None
+        if len(outputs) > 1:
+            probs = [o for o in outputs if num_classes and o["shape"][-1] == num_classes]
+            self._output = probs[0] if len(probs) == 1 else outputs[-1]
+            self._embedding = next(o for o in outputs if o["index"] != self._output["index"])
+        self._lock = threading.Lock()  # l'interprete non è thread-safe
+
+    def _quantize(self, batch: np.ndarray) -> np.ndarray:
+        """uint8 [0,255] -> input del modello; normalizzazione /255 in float32 (mai float64)."""
+        dtype = self._input["dtype"]
+        x = np.multiply(batch, np.float32(1.0 / 255), dtype=np.float32)
+        if dtype == np.float32:
+            return x
+        scale, zero_point = self._input["quantization"]
+        q = np.round(x / np.float32(scale) + zero_point)
+        info = np.iinfo(dtype)
+        return np.clip(q, info.min, info.max).astype(dtype)
+
+    def _read(self, detail) -> np.ndarray:
+        out = self._interpreter.get_tensor(detail["index"])
+        if detail["dtype"] == np.float32:
+            return out[0]
+        scale, zero_point = detail["quantization"]
+        return (out[0].astype(np.float32) - zero_point) * scale
+
+    def predict_with_embedding(self, batch: np.ndarray):
+        probs, embs = [], []
+        with self._lock:
+            if tuple(self._input["shape"][1:]) != tuple(batch.shape[1:]):
+                raise ValueError(f"Input shape non compatibile: {batch.shape}")
+            # L'interprete è allocato per batch 1: eseguo riga per riga
+            for i in range(batch.shape[0]):
+                self._interpreter.set_tensor(self._input["index"], self._quantize(batch[i:i + 1]))
+                self._interpreter.invoke()
+                probs.append(self._read(self._output))
+                if self._embedding is not None:
+                    embs.append(self._read(self._embedding))
+        return np.stack(probs), (np.stack(embs) if embs else None)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.predict_with_embedding(batch)[0]
+
+
+class CascadeStats:
+    """
+    Contatori della cascata: frazione di immagini inoltrate al modello completo
+    e latenza media risparmiata rispetto all'uso del solo modello completo
+    (stimata con la latenza media misurata del modello completo).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.screened = 0
+        self.escalated = 0
+        self.fast_ms = 0.0
+        self.full_ms = 0.0
+
+    def record(self, escalated: bool, fast_ms: float, full_ms: float = 0.0):
+        with self._lock:
+            self.screened += 1
+            self.fast_ms += fast_ms
+            if escalated:
+                self.escalated += 1
+                self.full_ms += full_ms
+
+    def summary(self) -> dict:
+        with self._lock:
+            n, esc = self.screened, self.escalated
+            avg_fast = self.fast_ms / n if n else None
+            avg_full = self.full_ms / esc if esc else None
+            saved = None
+            if n and avg_full is not None:
+                # senza cascata: avg_full per immagine; con cascata: fast + quota inoltrata
+                saved = avg_full - (self.fast_ms + self.full_ms) / n
+            return {
+                "enabled": CNN_CASCADE,
+                "threshold": CNN_CASCADE_THRESHOLD,
+                "screened": n,
+                "escalated": esc,
+                "escalation_rate": round(esc / n, 4) if n else None,
+                "avg_fast_ms": round(avg_fast, 2) if avg_fast is not None else None,
+                "avg_full_ms": round(avg_full, 2) if avg_full is not None else None,
+                "avg_saved_ms": round(saved, 2) if saved is not None else None,
+            }
+
+
+def _load_backend_file(path: str, num_classes: int):
+    """Backend in base all'estensione del file (.tflite oppure Keras .h5)."""
+    if path.endswith(".tflite"):
+        return _TFLiteBackend(path, num_threads=CNN_TFLITE_THREADS, num_classes=num_classes)
+    return _KerasBackend(path, num_classes=num_classes)
+
+
 class PlantClassifierCNN:
     _instance = None
     _model = None
+    _fast_model = None             # modello veloce della cascata (CNN_CASCADE=1)
+    _cascade = CascadeStats()
+    _last_route = threading.local()  # "fast"/"full" + tempi dell'ultima predizione (per thread)
     _classes = {}
+    _loaded = False
+    _load_lock = threading.Lock()
+    _buffers = threading.local()   # buffer di input preallocati (uno per thread)
+    _labels_lower = {}
+    _species_index = {}            # specie canonica -> np.ndarray di indici classe
+
+    # Telemetria di caricamento (esposta da /api/ai/ready)
+    load_seconds = None
+    load_error = None
 
     IMG_SIZE = (224, 224) 
     
@@ -19,89 +216,319 @@ class PlantClassifierCNN:
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     MODEL_PATH = os.path.join(BASE_DIR, "models/plant_disease_model.h5")
     CLASSES_PATH = os.path.join(BASE_DIR, "models/disease_classes.json")
+    TFLITE_PATHS = {
+        "float16": os.path.join(BASE_DIR, "models/plant_disease_model_float16.tflite"),
+        "int8": os.path.join(BASE_DIR, "models/plant_disease_model_int8.tflite"),
+    }
 
     def __new__(cls):
+        # Costruzione economica: nessun import di TensorFlow, nessun caricamento modello.
         if cls._instance is None:
             cls._instance = super(PlantClassifierCNN, cls).__new__(cls)
-            cls._instance._load_resources()
         return cls._instance
 
+    def ensure_loaded(self) -> bool:
+        """
+        Carica modello e classi al primo utilizzo (thread-safe, una sola volta).
+        Ritorna True se il modello è disponibile.
+        """
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self._load_resources()
+                    self._loaded = True
+        return self._model is not None
+
+    def is_ready(self) -> bool:
+        return self._loaded and self._model is not None
+
+    def status(self) -> dict:
+        """Stato di readiness del classificatore (senza forzarne il caricamento)."""
+        if not CNN_ENABLED:
+            state = "disabled"
+        elif not self._loaded:
+            state = "loading" if self._load_lock.locked() else "not_loaded"
+        elif self._model is None:
+            state = "unavailable"
+        else:
+            state = "ready"
+        return {
+            "enabled": CNN_ENABLED,
+            "state": state,
+            "ready": state == "ready",
+            "classes": len(self._classes),
+            "backend": getattr(self._model, "name", None),
+            "model_version": self.model_version(),
+            "load_seconds": self.load_seconds,
+            "error": self.load_error,
+            "cascade": self._cascade.summary() if self._fast_model is not None else None,
+        }
+
     def _load_resources(self):
+        if not CNN_ENABLED:
+            logger.info("CNN disabilitata (CNN_ENABLED=0): modello non caricato.")
+            return
         if self._model is None:
+            t0 = time.perf_counter()
             try:
                 if os.path.exists(self.CLASSES_PATH):
                     with open(self.CLASSES_PATH, 'r') as f:
                         self._classes = {int(k): v for k, v in json.load(f).items()}
                 
-                if os.path.exists(self.MODEL_PATH):
-                    self._model = tf.keras.models.load_model(self.MODEL_PATH)
-                    logger.info(f"Modello caricato ({len(self._classes)} classi).")
+                self._build_species_index()
+                self._model = self._load_backend()
+                if self._model is not None:
+                    logger.info(f"Modello caricato ({len(self._classes)} classi, backend {self._model.name}).")
                 else:
                     logger.warning("Modello non trovato.")
+                if self._model is not None and CNN_CASCADE:
+                    if os.path.exists(CNN_CASCADE_MODEL_PATH):
+                        self._fast_model = _load_backend_file(CNN_CASCADE_MODEL_PATH, len(self._classes))
+                        logger.info(f"Cascata attiva: {os.path.basename(CNN_CASCADE_MODEL_PATH)} (soglia {CNN_CASCADE_THRESHOLD})")
+                    else:
+                        logger.warning(f"Modello veloce non trovato ({CNN_CASCADE_MODEL_PATH}): cascata disattivata.")
             except Exception as e:
+                self.load_error = str(e)
                 logger.error(f"Errore caricamento IA: {e}")
+            finally:
+                self.load_seconds = round(time.perf_counter() - t0, 3)
+                logger.info(f"Caricamento CNN completato in {self.load_seconds}s")
 
-    def preprocess_image(self, image_bytes: bytes) -> np.ndarray:
+    def _load_backend(self):
+        """Seleziona il backend (CNN_BACKEND); se il .tflite manca ripiega su Keras."""
+        if CNN_BACKEND == "tflite":
+            path = self.TFLITE_PATHS.get(CNN_TFLITE_VARIANT)
+            if path and os.path.exists(path):
+                return _TFLiteBackend(path, num_threads=CNN_TFLITE_THREADS, num_classes=len(self._classes))
+            logger.warning(f"Modello TFLite '{CNN_TFLITE_VARIANT}' non trovato, uso Keras.")
+        if os.path.exists(self.MODEL_PATH):
+            return _KerasBackend(self.MODEL_PATH, num_classes=len(self._classes))
+        return None
+
+    def model_version(self) -> str:
+        """
+        Identificativo del modello in uso (backend + file + mtime), calcolato
+        senza caricare TensorFlow.
+        """
+        path = getattr(self._model, "path", None)
+        if path is None:
+            if CNN_BACKEND == "tflite" and os.path.exists(self.TFLITE_PATHS.get(CNN_TFLITE_VARIANT, "")):
+                path = self.TFLITE_PATHS[CNN_TFLITE_VARIANT]
+            else:
+                path = self.MODEL_PATH
+        try:
+            mtime = int(os.path.getmtime(path))
+        except OSError:
+            mtime = 0
+        return f"{os.path.basename(path)}@{mtime}"
+
+    def prediction_version(self) -> str:
+        """
+        Come model_version(), ma include il modello veloce quando la cascata è attiva
+        (i risultati possono differire): usato come chiave della cache predizioni.
+        """
+        version = self.model_version()
+        if CNN_CASCADE and os.path.exists(CNN_CASCADE_MODEL_PATH):
+            mtime = int(os.path.getmtime(CNN_CASCADE_MODEL_PATH))
+            version += f"+{os.path.basename(CNN_CASCADE_MODEL_PATH)}@{mtime}:{CNN_CASCADE_THRESHOLD}"
+        return version
+
+    def last_route(self) -> Optional[dict]:
+        """Percorso della cascata usato dall'ultima predict_health nel thread corrente."""
+        return getattr(self._last_route, "info", None)
+
+    def _decode_into(self, image_bytes: bytes, out: np.ndarray) -> np.ndarray:
+        """
+        Decodifica + resize direttamente in 'out' (uint8, 224x224x3).
+        Per i JPEG usa draft(): il decoder lavora già a scala ridotta (1/2, 1/4, 1/8),
+        evitando di decodificare tutti i 12MP di una foto da smartphone.
+        """
         img = Image.open(BytesIO(image_bytes))
+        if img.format == "JPEG":
+            img.draft("RGB", self.IMG_SIZE)
         if img.mode != 'RGB': img = img.convert('RGB')
         img = img.resize(self.IMG_SIZE)
-        img_array = tf.keras.preprocessing.image.img_to_array(img)
-        img_array = np.expand_dims(img_array, axis=0)
-        return img_array / 255.0
+        out[...] = np.asarray(img)
+        return out
+
+    def preprocess_image(self, image_bytes: bytes) -> np.ndarray:
+        """
+        Ritorna un batch uint8 (1, 224, 224, 3). La normalizzazione /255 è fusa
+        nell'input del backend. Il buffer è preallocato per thread: resta valido
+        fino alla chiamata successiva nello stesso thread.
+        """
+        buf = getattr(self._buffers, "single", None)
+        if buf is None:
+            buf = np.empty((1, *self.IMG_SIZE, 3), dtype=np.uint8)
+            self._buffers.single = buf
+        self._decode_into(image_bytes, buf[0])
+        return buf
 
-    def predict_health(self, image_bytes: bytes, plant_context: str = None):
+    def predict_health(self, image_bytes: bytes, plant_context: str = None, top_k: int = 0, return_embedding: bool = False):
         """
         Analizza l'immagine. 
         Se 'plant_context' è fornito (es. 'tomato'), filtra i risultati per considerare SOLO quella specie.
+        Con top_k > 0 aggiunge al risultato le k classi più probabili (dopo il filtro).
+        Con return_embedding=True aggiunge "embedding" (penultimo layer, lista di float):
+        l'embedding esiste solo nello spazio del modello completo, quindi la cascata
+        viene saltata.
         """
-        if self._model is None:
+        if not self.ensure_loaded():
             return {"label": "Errore", "confidence": 0.0, "advice": "Modello non disponibile."}
 
         try:
             processed = self.preprocess_image(image_bytes)
-            predictions = self._model.predict(processed)[0] # Array di probabilità
-            
-            #LOGICA DI FILTRO (MASKING)
-            if plant_context and plant_context.lower() != "generic":
-                # Cerchiamo quali indici corrispondono alla pianta selezionata (es. "tomato")
-                target = plant_context.lower()
-                
-                # Mappatura manuale se i nomi non coincidono perfettamente (opzionale)
-                if "pomodoro" in target: target = "tomato"
-                if "patata" in target: target = "potato"
-                if "peperone" in target or "pepper" in target: target = "pepper"
-                if "pesca" in target: target = "peach"
-                if "uva" in target or "vite" in target: target = "grape"
-
-                # Crea una maschera: metti a -1 (o 0) tutte le probabilità delle piante diverse
-                filtered_preds = np.copy(predictions)
-                
-                for idx, label_name in self._classes.items():
-                    if target not in label_name.lower():
-                        filtered_preds[idx] = -1.0 
+            self._last_route.info = None
+            use_cascade = self._fast_model is not None and not return_embedding
+            if use_cascade:
+                # Cascata: se il modello veloce è abbastanza sicuro, il modello completo non gira
+                t0 = time.perf_counter()
+                fast = self._postprocess(self._fast_model.predict(processed)[0], plant_context, top_k)
+                fast_ms = (time.perf_counter() - t0) * 1000
+                if fast["confidence"] >= CNN_CASCADE_THRESHOLD:
+                    self._cascade.record(False, fast_ms)
+                    self._last_route.info = {"route": "fast", "fast_ms": round(fast_ms, 2)}
+                    return fast
 
-                
-                if np.max(filtered_preds) > -0.5:
-                    predictions = filtered_preds
-                    logger.info(f"🔍 Filtro IA applicato per: {target}")
-
-            # Trova la classe vincente (tra quelle rimaste)
-            idx = np.argmax(predictions)
-            confidence = float(predictions[idx])
-            raw_label = self._classes.get(idx, "Sconosciuto")
-            advice = self._get_advice(raw_label)
-            clean_label = raw_label.replace("___", " - ").replace("_", " ")
-
-            return {
-                "label": clean_label,
-                "confidence": confidence,
-                "advice": advice
-            }
+            t1 = time.perf_counter()
+            predictions, embeddings = self._model.predict_with_embedding(processed)
+            result = self._postprocess(predictions[0], plant_context, top_k) # Array di probabilità
+            if use_cascade:
+                full_ms = (time.perf_counter() - t1) * 1000
+                self._cascade.record(True, fast_ms, full_ms)
+                self._last_route.info = {"route": "full", "fast_ms": round(fast_ms, 2), "full_ms": round(full_ms, 2)}
+            if return_embedding and embeddings is not None:
+                result["embedding"] = embeddings[0].astype(np.float32).tolist()
+            return result
             
         except Exception as e:
             logger.error(f"Errore predizione: {e}")
             raise e
 
+    def predict_health_batch(
+        self, images: List[bytes], plant_contexts: List[Optional[str]] = None, return_embedding: bool = True
+    ) -> List[dict]:
+        """
+        Inferenza batch: un solo forward pass per N immagini.
+        Con return_embedding=True (default, serve al batch processor) ogni risultato ha
+        "embedding" e la cascata viene saltata; altrimenti il modello completo gira
+        solo sulle immagini incerte.
+        Le immagini non decodificabili ricevono {"error": ...} senza bloccare le altre.
+        """
+        if not self.ensure_loaded():
+            return [{"label": "Errore", "confidence": 0.0, "advice": "Modello non disponibile."} for _ in images]
+        plant_contexts = plant_contexts or [None] * len(images)
+
+        batch = np.empty((len(images), *self.IMG_SIZE, 3), dtype=np.uint8)
+        valid, results = [], [None] * len(images)
+        for i, data in enumerate(images):
+            try:
+                self._decode_into(data, batch[len(valid)])
+                valid.append(i)
+            except Exception as e:
+                results[i] = {"error": f"Immagine non valida: {e}"}
+
+        if not valid:
+            return results
+
+        rows = np.arange(len(valid))
+        use_cascade = self._fast_model is not None and not return_embedding
+        if use_cascade:
+            # Cascata: il modello completo gira solo sulle righe con confidenza sotto soglia
+            t0 = time.perf_counter()
+            fast = self._fast_model.predict(batch[:len(valid)])
+            fast_ms = (time.perf_counter() - t0) * 1000 / len(valid)
+            escalate = []
+            for row, i in enumerate(valid):
+                res = self._postprocess(fast[row], plant_contexts[i])
+                if res["confidence"] >= CNN_CASCADE_THRESHOLD:
+                    results[i] = res
+                    self._cascade.record(False, fast_ms)
+                else:
+                    escalate.append(row)
+            rows = np.asarray(escalate, dtype=np.int64)
+            if rows.size == 0:
+                return results
+
+        full_batch = batch[rows] if use_cascade else batch[:len(valid)]
+        t1 = time.perf_counter()
+        predictions, embeddings = self._model.predict_with_embedding(full_batch)
+        full_ms = (time.perf_counter() - t1) * 1000 / rows.size
+        for j, row in enumerate(rows):
+            i = valid[row]
+            results[i] = self._postprocess(predictions[j], plant_contexts[i])
+            if return_embedding and embeddings is not None:
+                results[i]["embedding"] = embeddings[j].astype(np.float32).tolist()
+            if use_cascade:
+                self._cascade.record(True, fast_ms, full_ms)
+        return results
+
+    def _build_species_index(self):
+        """
+        Precalcola (al caricamento del modello) gli indici delle classi per specie,
+        così il filtro per specie diventa un singolo gather + argmax NumPy.
+        """
+        self._labels_lower = {idx: name.lower() for idx, name in self._classes.items()}
+        species = {name.split("_")[0] for name in self._labels_lower.values()}
+        species.update(sp for _, sp in SPECIES_SYNONYMS)
+        self._species_index = {}
+        for sp in species:
+            idx = self._match_indices(sp)
+            if idx.size:
+                self._species_index[sp] = idx
+
+    def _match_indices(self, target: str) -> np.ndarray:
+        return np.array(sorted(i for i, name in self._labels_lower.items() if target in name), dtype=np.intp)
+
+    def species_indices(self, plant_context: Optional[str]) -> Optional[np.ndarray]:
+        """Indici delle classi ammesse per il contesto (None = nessun filtro)."""
+        if not plant_context:
+            return None
+        target = _resolve_species(plant_context)
+        if target is None:
+            return None
+        idx = self._species_index.get(target)
+        if idx is None:
+            # Specie non canonica: stessa semantica "sottostringa" dell'etichetta
+            idx = self._match_indices(target)
+        return idx if idx.size else None
+
+    def _postprocess(self, predictions: np.ndarray, plant_context: Optional[str] = None, top_k: int = 0) -> dict:
+        #LOGICA DI FILTRO (MASKING): solo le classi della specie selezionata
+        candidates = self.species_indices(plant_context)
+        if candidates is not None:
+            logger.info(f"🔍 Filtro IA applicato per: {_resolve_species(plant_context)}")
+            scores = predictions[candidates]
+        else:
+            candidates = np.arange(predictions.shape[0])
+            scores = predictions
+
+        # Trova la classe vincente (tra quelle rimaste)
+        idx = int(candidates[np.argmax(scores)])
+        confidence = float(predictions[idx])
+        raw_label = self._classes.get(idx, "Sconosciuto")
+        advice = self._get_advice(raw_label)
+        clean_label = raw_label.replace("___", " - ").replace("_", " ")
+
+        result = {
+            "label": clean_label,
+            "confidence": confidence,
+            "advice": advice
+        }
+
+        if top_k and top_k > 0:
+            k = min(top_k, scores.shape[0])
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            result["top_k"] = [
+                {
+                    "label": self._classes.get(int(candidates[j]), "Sconosciuto").replace("___", " - ").replace("_", " "),
+                    "confidence": float(scores[j]),
+                }
+                for j in top
+            ]
+        return result
+
     def _get_advice(self, raw_label):
         """Traduce le etichette in consigli."""
         l = raw_label.lower()
@@ -139,4 +566,5 @@ class PlantClassifierCNN:
 
         return "Patologia rilevata. Controllare manualmente."
 
+# Istanza globale (leggera: il modello viene caricato con ensure_loaded)
 cnn_classifier = PlantClassifierCNN()
\ No newline at end of file
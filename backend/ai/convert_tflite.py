@@ -0,0 +1,177 @@
+#COSA FA: Converte il modello Keras (.h5) in TFLite (float16 e int8 post-training quantization)
+# e produce un report di parità di accuratezza rispetto al modello Keras originale.
+#
+# Uso:
+#   python ai/convert_tflite.py --calib-dir /path/PlantVillage --eval-dir /path/PlantVillage_val
+#
+# I file prodotti (in ai/models/) vengono usati dal backend con CNN_BACKEND=tflite
+# e CNN_TFLITE_VARIANT=float16|int8.
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(BASE_DIR, "models")
+MODEL_PATH = os.path.join(MODEL_DIR, "plant_disease_model.h5")
+CLASSES_PATH = os.path.join(MODEL_DIR, "disease_classes.json")
+REPORT_NAME = "tflite_parity_report.json"
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def _load_image(path: Path) -> np.ndarray:
+    """Stesso preprocessing del backend: batch uint8 (1, 224, 224, 3)."""
+    from ai.cnn_service import cnn_classifier
+    return cnn_classifier.preprocess_image(path.read_bytes()).copy()
+
+
+def _list_images(root: str, per_class: int = None, seed: int = 42):
+    """Ritorna [(path, class_name)] dalle sottocartelle di 'root' (una per classe)."""
+    rnd = random.Random(seed)
+    items = []
+    for class_dir in sorted(p for p in Path(root).iterdir() if p.is_dir()):
+        files = sorted(p for p in class_dir.rglob("*") if p.suffix.lower() in IMAGE_EXTS)
+        rnd.shuffle(files)
+        if per_class:
+            files = files[:per_class]
+        items.extend((f, class_dir.name) for f in files)
+    return items
+
+
+def convert(calib_dir: str, variants, calib_samples: int = 200):
+    import tensorflow as tf
+
+    base = tf.keras.models.load_model(MODEL_PATH)
+    # Due uscite: embedding del penultimo layer (ricerca casi simili) + probabilità
+    model = tf.keras.Model(base.input, [base.layers[-2].output, base.output])
+    outputs = {}
+
+    for variant in variants:
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+        if variant == "float16":
+            converter.target_spec.supported_types = [tf.float16]
+        elif variant == "int8":
+            if not calib_dir:
+                print(" ERRORE: la quantizzazione int8 richiede --calib-dir (immagini rappresentative).")
+                continue
+            calib = _list_images(calib_dir)
+            random.Random(0).shuffle(calib)
+            calib = calib[:calib_samples]
+
+            def representative_dataset():
+                for path, _ in calib:
+                    # Il modello .h5 si aspetta input float [0,1]
+                    yield [_load_image(path).astype(np.float32) / 255.0]
+
+            converter.representative_dataset = representative_dataset
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+            # I/O restano float32: il backend non deve cambiare preprocessing
+        else:
+            print(f" Variante sconosciuta: {variant}")
+            continue
+
+        t0 = time.perf_counter()
+        tflite_model = converter.convert()
+        out_path = os.path.join(MODEL_DIR, f"plant_disease_model_{variant}.tflite")
+        with open(out_path, "wb") as f:
+            f.write(tflite_model)
+        outputs[variant] = out_path
+        print(f" ✓ {variant}: {out_path} ({len(tflite_model) / 1e6:.1f} MB, {time.perf_counter() - t0:.1f}s)")
+
+    print(f"   Keras .h5: {os.path.getsize(MODEL_PATH) / 1e6:.1f} MB")
+    return outputs
+
+
+def parity_report(eval_dir: str, variants, per_class: int = 50):
+    """
+    Confronta Keras e TFLite sullo stesso set etichettato:
+    accuratezza top-1, accordo top-1 con Keras, differenza massima delle probabilità.
+    """
+    import tensorflow as tf
+    from ai.cnn_service import _TFLiteBackend
+
+    with open(CLASSES_PATH) as f:
+        class_to_idx = {v: int(k) for k, v in json.load(f).items()}
+
+    items = [(p, c) for p, c in _list_images(eval_dir, per_class=per_class) if c in class_to_idx]
+    if not items:
+        print(" ERRORE: nessuna immagine con classe nota in --eval-dir")
+        return None
+
+    keras_model = tf.keras.models.load_model(MODEL_PATH)
+    backends = {}
+    for variant in variants:
+        path = os.path.join(MODEL_DIR, f"plant_disease_model_{variant}.tflite")
+        if os.path.exists(path):
+            backends[variant] = _TFLiteBackend(path, num_classes=len(class_to_idx))
+
+    stats = {name: {"correct": 0, "agree": 0, "max_abs_diff": 0.0} for name in ["keras", *backends]}
+    for path, class_name in items:
+        x = _load_image(path)
+        label = class_to_idx[class_name]
+        ref = keras_model(x.astype(np.float32) / 255.0, training=False).numpy()[0]
+        ref_top = int(np.argmax(ref))
+        stats["keras"]["correct"] += int(ref_top == label)
+        stats["keras"]["agree"] += 1
+        for name, backend in backends.items():
+            pred = backend.predict(x)[0]
+            top = int(np.argmax(pred))
+            stats[name]["correct"] += int(top == label)
+            stats[name]["agree"] += int(top == ref_top)
+            stats[name]["max_abs_diff"] = max(stats[name]["max_abs_diff"], float(np.max(np.abs(pred - ref))))
+
+    n = len(items)
+    report = {
+        "images": n,
+        "eval_dir": eval_dir,
+        "results": {
+            name: {
+                "top1_accuracy": round(s["correct"] / n, 4),
+                "top1_agreement_with_keras": round(s["agree"] / n, 4),
+                "max_abs_prob_diff": round(s["max_abs_diff"], 4),
+            }
+            for name, s in stats.items()
+        },
+    }
+
+    print(f"\n{'='*60}\n REPORT PARITÀ ({n} immagini)\n{'='*60}")
+    print(f"{'backend':<10}{'acc top-1':>12}{'accordo':>12}{'max |Δp|':>12}")
+    for name, r in report["results"].items():
+        print(f"{name:<10}{r['top1_accuracy']:>12.4f}{r['top1_agreement_with_keras']:>12.4f}{r['max_abs_prob_diff']:>12.4f}")
+
+    out = os.path.join(MODEL_DIR, REPORT_NAME)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n Report salvato in: {out}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Conversione TFLite + report di parità")
+    parser.add_argument("--variants", nargs="+", default=["float16", "int8"], choices=["float16", "int8"])
+    parser.add_argument("--calib-dir", help="Cartella immagini (sottocartelle per classe) per la calibrazione int8")
+    parser.add_argument("--calib-samples", type=int, default=200)
+    parser.add_argument("--eval-dir", help="Cartella etichettata per il report di parità")
+    parser.add_argument("--per-class", type=int, default=50, help="Immagini per classe nel report")
+    parser.add_argument("--skip-convert", action="store_true", help="Esegue solo il report")
+    args = parser.parse_args()
+
+    if not os.path.exists(MODEL_PATH):
+        print(f" ERRORE: modello non trovato in {MODEL_PATH}")
+        sys.exit(1)
+
+    if not args.skip_convert:
+        convert(args.calib_dir, args.variants, args.calib_samples)
+    if args.eval_dir:
+        parity_report(args.eval_dir, args.variants, args.per_class)
@@ -0,0 +1,330 @@
+#COSA FA: Archivio degli embedding CNN (penultimo layer) per la ricerca di "casi simili".
+#
+# - Persistenza: collection 'cnn_embeddings', un documento per immagine
+#   (_id = "<refType>:<refId>", vettore float16 in binario, etichetta e versione modello).
+# - In memoria: matrice float16 compatta (righe normalizzate L2) + mappa id -> riga.
+# - Ricerca (prodotto scalare = similarità coseno, BLAS in float32):
+#     * esatta brute-force a blocchi finché l'archivio è piccolo;
+#     * oltre CNN_EMBEDDINGS_IVF_MIN vettori, indice partizionato IVF (k-means, ~sqrt(N) liste)
+#       costruito in background: si scansionano solo le CNN_EMBEDDINGS_NPROBE liste più vicine
+#       alla query, così anche con 100k+ immagini la risposta resta nell'ordine dei millisecondi.
+#
+# Gli embedding di versioni diverse del modello non sono confrontabili:
+# viene caricata solo la versione corrente.
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Configurazione da ENV
+CNN_EMBEDDINGS_ENABLED = os.getenv("CNN_EMBEDDINGS_ENABLED", "1").strip().lower() in ("1", "true", "yes", "on")
+CNN_EMBEDDINGS_CHUNK = int(os.getenv("CNN_EMBEDDINGS_CHUNK", "16384"))   # righe per blocco di ricerca
+CNN_EMBEDDINGS_IVF_MIN = int(os.getenv("CNN_EMBEDDINGS_IVF_MIN", "20000"))  # sotto questa soglia: ricerca esatta
+CNN_EMBEDDINGS_NPROBE = int(os.getenv("CNN_EMBEDDINGS_NPROBE", "8"))      # liste IVF scansionate per query
+EMBEDDINGS_COLLECTION = "cnn_embeddings"
+
+REF_PLANT = "plant"          # foto principale di una pianta (piante.imageUrl)
+REF_IMAGE = "immagine"       # documento di 'immagini_piante'
+
+
+def _normalize(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32).ravel()
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm > 0 else v
+
+
+def _kmeans(sample: np.ndarray, n_lists: int, iterations: int = 6, seed: int = 0) -> np.ndarray:
+    """K-means sferico (centroidi normalizzati) su un campione float32 di righe normalizzate."""
+    rnd = np.random.default_rng(seed)
+    centroids = sample[rnd.choice(sample.shape[0], n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(n_lists):
+            members = sample[assign == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids
+
+
+class EmbeddingStore:
+    """
+    Matrice float16 in memoria con crescita a raddoppio (append O(1) ammortizzato),
+    ricerca esatta per archivi piccoli e indice IVF per quelli grandi. Thread-safe.
+    """
+
+    def __init__(self, chunk_size: int = CNN_EMBEDDINGS_CHUNK,
+                 ivf_min: int = CNN_EMBEDDINGS_IVF_MIN, nprobe: int = CNN_EMBEDDINGS_NPROBE):
+        self.chunk_size = max(1024, chunk_size)
+        self.ivf_min = ivf_min
+        self.nprobe = max(1, nprobe)
+        self._lock = threading.Lock()
+        self._collection = None
+        self._version: Optional[str] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        self._keys: List[str] = []
+        self._meta: List[Dict[str, Any]] = []
+        self._pos: Dict[str, int] = {}
+        # Indice IVF: centroidi (liste) e lista assegnata a ogni riga (-1 = da assegnare)
+        self._centroids: Optional[np.ndarray] = None
+        self._assign: Optional[np.ndarray] = None
+        self._indexed_size = 0
+        self._building = False
+        self._stats = {"searches": 0, "total_search_ms": 0.0, "load_seconds": None, "index_seconds": None}
+
+    @staticmethod
+    def make_id(ref_type: str, ref_id: str) -> str:
+        return f"{ref_type}:{ref_id}"
+
+    def _get_collection(self):
+        if self._collection is None:
+            from database import db
+            self._collection = db[EMBEDDINGS_COLLECTION]
+        return self._collection
+
+    def ensure_indexes(self):
+        try:
+            self._get_collection().create_index("modelVersion", name="idx_emb_model_version")
+        except Exception as e:
+            print(f"[WARN] cnn embeddings indexes: {e}")
+
+    # --- Matrice in memoria ---
+    def _reset(self, version: Optional[str], dim: int = 0, capacity: int = 0):
+        self._version = version
+        self._matrix = np.empty((max(capacity, 1024), dim), dtype=np.float16) if dim else None
+        self._size = 0
+        self._keys, self._meta, self._pos = [], [], {}
+        self._centroids, self._assign, self._indexed_size = None, None, 0
+
+    def _append(self, key: str, vector: np.ndarray, meta: Dict[str, Any]):
+        if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+            self._reset(self._version, dim=vector.shape[0])
+        row = self._pos.get(key)
+        if row is None:
+            if self._size == self._matrix.shape[0]:
+                grown = np.empty((self._matrix.shape[0] * 2, self._matrix.shape[1]), dtype=np.float16)
+                grown[:self._size] = self._matrix[:self._size]
+                self._matrix = grown
+            row = self._size
+            self._size += 1
+            self._keys.append(key)
+            self._meta.append(meta)
+            self._pos[key] = row
+        else:
+            self._meta[row] = meta
+        self._matrix[row] = vector
+        if self._centroids is not None:
+            if self._assign.shape[0] <= row:
+                self._assign = np.concatenate([self._assign, np.full(self._assign.shape[0] + 1, -1, np.int32)])
+            self._assign[row] = int(np.argmax(self._centroids @ vector.astype(np.float32)))
+
+    # --- Indice IVF (costruito in background, la ricerca resta esatta nel frattempo) ---
+    def _maybe_build_index(self):
+        """Da chiamare con il lock: ricostruisce l'indice quando l'archivio è raddoppiato."""
+        if self._building or self._size < self.ivf_min:
+            return
+        if self._centroids is not None and self._size < 2 * self._indexed_size:
+            return
+        self._building = True
+        threading.Thread(target=self._build_index, args=(self._version,), daemon=True, name="cnn-ivf").start()
+
+    def _build_index(self, version: str):
+        try:
+            t0 = time.perf_counter()
+            with self._lock:
+                size = self._size
+                matrix = self._matrix  # le righe < size restano valide anche se la matrice cresce (copia)
+            n_lists = int(min(1024, max(16, np.sqrt(size))))
+            rnd = np.random.default_rng(0)
+            sample_rows = np.sort(rnd.choice(size, min(size, n_lists * 32), replace=False))
+            centroids = _kmeans(matrix[sample_rows].astype(np.float32), n_lists)
+
+            assign = np.empty(size, dtype=np.int32)
+            for start in range(0, size, self.chunk_size):
+                end = min(start + self.chunk_size, size)
+                assign[start:end] = np.argmax(matrix[start:end].astype(np.float32) @ centroids.T, axis=1)
+
+            with self._lock:
+                if self._version != version:
+                    return
+                # Righe aggiunte durante la costruzione: assegnazione immediata
+                full = np.full(self._matrix.shape[0], -1, dtype=np.int32)
+                full[:size] = assign
+                for row in range(size, self._size):
+                    full[row] = int(np.argmax(centroids @ self._matrix[row].astype(np.float32)))
+                self._centroids, self._assign, self._indexed_size = centroids, full, self._size
+            self._stats["index_seconds"] = round(time.perf_counter() - t0, 2)
+            logger.info(f"Indice IVF embedding: {size} vettori, {n_lists} liste in {self._stats['index_seconds']}s")
+        except Exception as e:
+            logger.error(f"Indice IVF embedding fallito: {e}")
+        finally:
+            self._building = False
+
+    def _load(self, model_version: str):
+        """Carica da Mongo gli embedding della versione indicata (chiamare con il lock)."""
+        t0 = time.perf_counter()
+        col = self._get_collection()
+        count = col.count_documents({"modelVersion": model_version})
+        self._reset(model_version)
+        if count:
+            cursor = col.find(
+                {"modelVersion": model_version},
+                {"vector": 1, "refType": 1, "refId": 1, "label": 1, "confidence": 1},
+            ).batch_size(2000)
+            for doc in cursor:
+                vec = np.frombuffer(doc["vector"], dtype=np.float16)
+                if self._matrix is None:
+                    self._reset(model_version, dim=vec.shape[0], capacity=count)
+                self._append(doc["_id"], vec, {
+                    "refType": doc.get("refType"), "refId": doc.get("refId"),
+                    "label": doc.get("label"), "confidence": doc.get("confidence"),
+                })
+        self._stats["load_seconds"] = round(time.perf_counter() - t0, 2)
+        logger.info(f"Embedding CNN caricati: {self._size} ({model_version}) in {self._stats['load_seconds']}s")
+
+    def _ensure_version(self, model_version: str):
+        if self._version != model_version:
+            self._load(model_version)
+
+    # --- API (sincrona: dagli endpoint async chiamare in un thread) ---
+    def add(self, ref_type: str, ref_id: str, vector, model_version: str,
+            label: Optional[str] = None, confidence: Optional[float] = None):
+        """Salva (upsert) l'embedding di un'immagine, su Mongo e nella matrice in memoria."""
+        if not CNN_EMBEDDINGS_ENABLED or vector is None:
+            return
+        self.add_many([(ref_type, ref_id, vector, label, confidence)], model_version)
+
+    def add_many(self, items, model_version: str):
+        """items: iterabile di (ref_type, ref_id, vector, label, confidence)."""
+        if not CNN_EMBEDDINGS_ENABLED:
+            return
+        from pymongo import UpdateOne
+        now = datetime.utcnow()
+        rows, ops = [], []
+        for ref_type, ref_id, vector, label, confidence in items:
+            if vector is None:
+                continue
+            key = self.make_id(ref_type, str(ref_id))
+            vec = _normalize(vector).astype(np.float16)
+            meta = {"refType": ref_type, "refId": str(ref_id), "label": label, "confidence": confidence}
+            rows.append((key, vec, meta))
+            ops.append(UpdateOne({"_id": key}, {"$set": {
+                **meta, "vector": vec.tobytes(), "dim": int(vec.shape[0]),
+                "modelVersion": model_version, "createdAt": now,
+            }}, upsert=True))
+        if not ops:
+            return
+        try:
+            self._get_collection().bulk_write(ops, ordered=False)
+        except Exception as e:
+            logger.warning(f"Embedding CNN: scrittura fallita: {e}")
+            return
+        with self._lock:
+            # Se la matrice non è ancora caricata verrà letta da Mongo alla prima ricerca
+            if self._version == model_version:
+                for key, vec, meta in rows:
+                    self._append(key, vec, meta)
+
+    def get_vector(self, ref_type: str, ref_id: str, model_version: str) -> Optional[np.ndarray]:
+        key = self.make_id(ref_type, str(ref_id))
+        with self._lock:
+            self._ensure_version(model_version)
+            row = self._pos.get(key)
+            return None if row is None else self._matrix[row].astype(np.float32)
+
+    def _candidate_rows(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """Righe da scansionare con l'indice IVF (None = ricerca esatta su tutto)."""
+        if self._centroids is None:
+            return None
+        probes = np.argsort(-(self._centroids @ query))[:self.nprobe]
+        return np.flatnonzero(np.isin(self._assign[:self._size], probes))
+
+    @staticmethod
+    def _merge_top(best_scores, best_rows, scores, rows, want):
+        if scores.shape[0] > want:
+            top = np.argpartition(-scores, want - 1)[:want]
+            scores, rows = scores[top], rows[top]
+        best_scores = np.concatenate([best_scores, scores])
+        best_rows = np.concatenate([best_rows, rows])
+        if best_scores.shape[0] > want:
+            keep = np.argpartition(-best_scores, want - 1)[:want]
+            best_scores, best_rows = best_scores[keep], best_rows[keep]
+        return best_scores, best_rows
+
+    def search(self, vector, model_version: str, k: int = 10,
+               exclude_id: Optional[str] = None, ref_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Top-k per similarità coseno. Scansione a blocchi: ogni blocco float16 viene
+        convertito in float32 e moltiplicato per la query (GEMV BLAS), poi argpartition.
+        Con l'indice IVF si scansionano solo le righe delle liste più vicine.
+        """
+        t0 = time.perf_counter()
+        query = _normalize(vector)
+        with self._lock:
+            self._ensure_version(model_version)
+            if self._size == 0 or self._matrix.shape[1] != query.shape[0]:
+                return []
+            self._maybe_build_index()
+            # Chiedo qualche candidato in più per compensare esclusioni e filtri
+            want = min(self._size, k + 1 if ref_type is None else k * 4 + 1)
+            best_scores = np.empty(0, dtype=np.float32)
+            best_rows = np.empty(0, dtype=np.int64)
+
+            candidates = self._candidate_rows(query)
+            if candidates is None:
+                for start in range(0, self._size, self.chunk_size):
+                    end = min(start + self.chunk_size, self._size)
+                    scores = self._matrix[start:end].astype(np.float32) @ query
+                    best_scores, best_rows = self._merge_top(best_scores, best_rows, scores, np.arange(start, end), want)
+            else:
+                for start in range(0, candidates.shape[0], self.chunk_size):
+                    rows = candidates[start:start + self.chunk_size]
+                    scores = self._matrix[rows].astype(np.float32) @ query
+                    best_scores, best_rows = self._merge_top(best_scores, best_rows, scores, rows, want)
+
+            order = np.argsort(-best_scores)
+            results = []
+            for i in order:
+                row = int(best_rows[i])
+                if self._keys[row] == exclude_id:
+                    continue
+                meta = self._meta[row]
+                if ref_type and meta.get("refType") != ref_type:
+                    continue
+                results.append({**meta, "score": round(float(best_scores[i]), 4)})
+                if len(results) >= k:
+                    break
+
+        elapsed = (time.perf_counter() - t0) * 1000
+        self._stats["searches"] += 1
+        self._stats["total_search_ms"] += elapsed
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        n = self._stats["searches"]
+        return {
+            "enabled": CNN_EMBEDDINGS_ENABLED,
+            "model_version": self._version,
+            "size": self._size,
+            "dim": int(self._matrix.shape[1]) if self._matrix is not None else None,
+            "memory_mb": round(self._size * self._matrix.shape[1] * 2 / 1e6, 1) if self._matrix is not None else 0,
+            "index": "ivf" if self._centroids is not None else "exact",
+            "ivf_lists": int(self._centroids.shape[0]) if self._centroids is not None else None,
+            "nprobe": self.nprobe,
+            "index_seconds": self._stats["index_seconds"],
+            "searches": n,
+            "avg_search_ms": round(self._stats["total_search_ms"] / n, 2) if n else None,
+            "load_seconds": self._stats["load_seconds"],
+        }
+
+
+# Istanza globale
+embedding_store = EmbeddingStore()
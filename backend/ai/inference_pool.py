@@ -0,0 +1,295 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Dict, Any
+
+from ai.prediction_cache import prediction_cache, image_digest
+
+logger = logging.getLogger(__name__)
+
+# Configurazione da ENV
+# CNN_WORKERS=0 -> inferenza in-process su un singolo thread (niente processi separati)
+CNN_WORKERS = int(os.getenv("CNN_WORKERS", "1"))
+CNN_INTRA_OP_THREADS = int(os.getenv("CNN_INTRA_OP_THREADS", "2"))
+CNN_INTER_OP_THREADS = int(os.getenv("CNN_INTER_OP_THREADS", "1"))
+CNN_QUEUE_MAX = int(os.getenv("CNN_QUEUE_MAX", "8"))                    # richieste in coda + in esecuzione
+CNN_QUEUE_TIMEOUT = float(os.getenv("CNN_QUEUE_TIMEOUT", "5"))          # secondi di attesa per uno slot
+CNN_MAX_TASKS_PER_CHILD = int(os.getenv("CNN_MAX_TASKS_PER_CHILD", "500"))  # riciclo worker (memoria)
+
+
+class InferenceBusyError(Exception):
+    """Coda di inferenza piena: il client deve riprovare più tardi."""
+    pass
+
+
+# --- Funzioni eseguite nei processi worker (devono essere top-level per il pickling) ---
+
+def _init_worker(intra_threads: int, inter_threads: int):
+    """
+    Inizializzatore del processo worker: limita i thread di TensorFlow
+    PRIMA dell'import e carica il modello una sola volta per processo.
+    """
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(intra_threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = str(inter_threads)
+    os.environ["OMP_NUM_THREADS"] = str(intra_threads)
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    try:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(intra_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(inter_threads)
+    except Exception as e:
+        logger.warning(f"[CNN WORKER] Impossibile configurare i thread TF: {e}")
+
+    from ai.cnn_service import cnn_classifier
+    cnn_classifier.ensure_loaded()
+
+
+def _worker_predict(
+    image_bytes: bytes, plant_context: Optional[str], top_k: int = 0, return_embedding: bool = False
+) -> Dict[str, Any]:
+    from ai.cnn_service import cnn_classifier
+    t0 = time.perf_counter()
+    # L'embedding (1280 float) torna dal worker solo se richiesto
+    result = cnn_classifier.predict_health(
+        image_bytes, plant_context=plant_context, top_k=top_k, return_embedding=return_embedding
+    )
+    result["_meta"] = {
+        "pid": os.getpid(),
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2),
+        "cascade": cnn_classifier.last_route(),
+        "status": cnn_classifier.status(),   # readiness aggiornata anche senza warm-up
+    }
+    return result
+
+
+def _worker_predict_batch(images, plant_contexts):
+    from ai.cnn_service import cnn_classifier
+    return cnn_classifier.predict_health_batch(images, plant_contexts)
+
+
+def _worker_status() -> Dict[str, Any]:
+    from ai.cnn_service import cnn_classifier
+    cnn_classifier.ensure_loaded()
+    status = cnn_classifier.status()
+    status["pid"] = os.getpid()
+    return status
+
+
+class InferencePool:
+    """
+    Esegue l'inferenza CNN fuori dall'event loop.
+
+    - CNN_WORKERS > 0: pool di processi dedicati (spawn), ognuno con il proprio
+      modello e i thread TF intra/inter-op configurati.
+    - CNN_WORKERS = 0: un singolo thread nel processo corrente.
+
+    La coda è limitata (CNN_QUEUE_MAX): oltre quella soglia le richieste
+    attendono al massimo CNN_QUEUE_TIMEOUT secondi, poi InferenceBusyError.
+    Questo limita anche la memoria (immagini in volo) per processo.
+    """
+
+    def __init__(
+        self,
+        workers: int = CNN_WORKERS,
+        queue_max: int = CNN_QUEUE_MAX,
+        queue_timeout: float = CNN_QUEUE_TIMEOUT,
+    ):
+        self.workers = max(0, workers)
+        self.queue_max = max(1, queue_max)
+        self.queue_timeout = queue_timeout
+        self._executor = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._worker_status: Optional[Dict[str, Any]] = None
+        self._warmup_error: Optional[str] = None
+        self._warming = False
+        self._stats = {"completed": 0, "failed": 0, "rejected": 0, "inflight": 0, "total_ms": 0.0}
+        self._cascade = None  # CascadeStats aggregate dai worker (se la cascata è attiva)
+
+    # --- Executor ---
+    def _get_executor(self):
+        if self._executor is None:
+            if self.workers == 0:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cnn")
+            else:
+                kwargs = {
+                    "max_workers": self.workers,
+                    "mp_context": multiprocessing.get_context("spawn"),  # TF non è fork-safe
+                    "initializer": _init_worker,
+                    "initargs": (CNN_INTRA_OP_THREADS, CNN_INTER_OP_THREADS),
+                }
+                if sys.version_info >= (3, 11) and CNN_MAX_TASKS_PER_CHILD > 0:
+                    kwargs["max_tasks_per_child"] = CNN_MAX_TASKS_PER_CHILD
+                self._executor = ProcessPoolExecutor(**kwargs)
+            logger.info(f"Pool inferenza CNN avviato (workers={self.workers}, coda={self.queue_max})")
+        return self._executor
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.queue_max)
+        return self._slots
+
+    async def _acquire_slot(self):
+        slots = self._get_slots()
+        if self.queue_timeout <= 0:
+            if slots.locked():
+                raise InferenceBusyError("Coda di inferenza piena, riprova più tardi.")
+            await slots.acquire()
+            return
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise InferenceBusyError("Coda di inferenza piena, riprova più tardi.")
+
+    def _broken(self, executor, error: BrokenProcessPool) -> InferenceBusyError:
+        # Un worker è morto (es. OOM): ricrea il pool alla prossima richiesta
+        logger.error(f"Pool inferenza CNN interrotto, verrà ricreato: {error}")
+        if self._executor is executor:
+            self._executor = None
+        return InferenceBusyError("Pool di inferenza in riavvio, riprova più tardi.")
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool as e:
+            raise self._broken(executor, e) from e
+
+    # --- Cache risultati ---
+    def _cache_key(self, digest: str, plant_context: Optional[str], top_k: int) -> str:
+        from ai.cnn_service import cnn_classifier, _resolve_species
+        species = _resolve_species(plant_context) if plant_context else None
+        return prediction_cache.make_key(digest, cnn_classifier.prediction_version(), species, top_k)
+
+    async def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        if prediction_cache.use_mongo:
+            return await asyncio.to_thread(prediction_cache.get, key)
+        return prediction_cache.get(key)
+
+    async def _cache_put(self, key: str, result: Dict[str, Any]):
+        if result.get("label") == "Errore":
+            return
+        if prediction_cache.use_mongo:
+            await asyncio.to_thread(prediction_cache.put, key, result)
+        else:
+            prediction_cache.put(key, result)
+
+    # --- API pubblica ---
+    async def predict_health(
+        self,
+        image_bytes: bytes,
+        plant_context: Optional[str] = None,
+        top_k: int = 0,
+        digest: Optional[str] = None,
+        return_embedding: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        'digest' (sha256 esadecimale) può essere passato se già calcolato
+        durante l'upload; altrimenti viene calcolato qui.
+        Con return_embedding=True il risultato contiene anche "embedding"
+        (penultimo layer), usato per l'archivio dei casi simili: la cache non
+        contiene embedding, quindi queste richieste la saltano (ma la aggiornano).
+        """
+        key = self._cache_key(digest or image_digest(image_bytes), plant_context, top_k)
+        if not return_embedding:
+            cached = await self._cache_get(key)
+            if cached is not None:
+                return cached
+
+        try:
+            await self._acquire_slot()
+        except InferenceBusyError:
+            self._stats["rejected"] += 1
+            raise
+
+        self._stats["inflight"] += 1
+        try:
+            result = await self._run(_worker_predict, image_bytes, plant_context, top_k, return_embedding)
+        except Exception:
+            self._stats["failed"] += 1
+            raise
+        finally:
+            self._stats["inflight"] -= 1
+            self._get_slots().release()
+
+        meta = result.pop("_meta", {}) or {}
+        if meta.get("status"):
+            self._worker_status = {**meta["status"], "pid": meta.get("pid")}
+        self._stats["completed"] += 1
+        self._stats["total_ms"] += meta.get("elapsed_ms", 0.0)
+        route = meta.get("cascade")
+        if route:
+            if self._cascade is None:
+                from ai.cnn_service import CascadeStats
+                self._cascade = CascadeStats()
+            self._cascade.record(route["route"] == "full", route["fast_ms"], route.get("full_ms", 0.0))
+        await self._cache_put(key, result)   # senza embedding (vedi PredictionCache.put)
+        return result
+
+    def predict_batch_sync(self, images, plant_contexts=None):
+        """
+        Inferenza batch bloccante (per job in background su thread dedicato):
+        occupa un solo worker del pool, senza passare dalla coda interattiva.
+        InferenceBusyError se un worker muore: il pool viene ricreato alla chiamata successiva.
+        """
+        executor = self._get_executor()
+        try:
+            return executor.submit(_worker_predict_batch, images, plant_contexts).result()
+        except BrokenProcessPool as e:
+            raise self._broken(executor, e) from e
+
+    async def warmup(self):
+        """Avvia il pool e carica il modello in un worker (usato allo startup)."""
+        self._warming = True
+        try:
+            self._worker_status = await self._run(_worker_status)
+            self._warmup_error = None
+        except Exception as e:
+            self._warmup_error = str(e)
+            logger.error(f"Warm-up CNN fallito: {e}")
+        finally:
+            self._warming = False
+
+    def status(self) -> Dict[str, Any]:
+        if self.workers == 0:
+            from ai.cnn_service import cnn_classifier
+            cnn = cnn_classifier.status()
+        elif self._worker_status is not None:
+            cnn = dict(self._worker_status)
+        else:
+            # Nessun worker ha ancora risposto: "loading" solo durante il warm-up
+            from ai.cnn_service import CNN_ENABLED
+            if not CNN_ENABLED:
+                state = "disabled"
+            else:
+                state = "loading" if self._warming else "not_loaded"
+            cnn = {"enabled": CNN_ENABLED, "state": state, "ready": False, "error": self._warmup_error}
+
+        done = self._stats["completed"]
+        cnn["pool"] = {
+            "workers": self.workers,
+            "queue_max": self.queue_max,
+            "inflight": self._stats["inflight"],
+            "completed": done,
+            "failed": self._stats["failed"],
+            "rejected": self._stats["rejected"],
+            "avg_inference_ms": round(self._stats["total_ms"] / done, 2) if done else None,
+        }
+        if self._cascade is not None:
+            cnn["cascade"] = self._cascade.summary()
+        cnn["cache"] = prediction_cache.stats()
+        return cnn
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Istanza globale
+inference_pool = InferencePool()
@@ -0,0 +1,132 @@
+import copy
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# Configurazione da ENV
+CNN_CACHE_SIZE = int(os.getenv("CNN_CACHE_SIZE", "2048"))                 # voci LRU in memoria (0 = disattivata)
+CNN_CACHE_MONGO = os.getenv("CNN_CACHE_MONGO", "0").strip().lower() in ("1", "true", "yes", "on")
+CNN_CACHE_TTL_DAYS = int(os.getenv("CNN_CACHE_TTL_DAYS", "30"))           # scadenza tier Mongo
+CNN_CACHE_COLLECTION = "cnn_prediction_cache"
+
+
+def image_digest(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class PredictionCache:
+    """
+    Cache dei risultati CNN indicizzata per contenuto:
+    chiave = sha256(immagine) + versione modello + contesto specie (+ top_k).
+
+    - Tier 1: LRU in memoria (CNN_CACHE_SIZE voci), thread-safe.
+    - Tier 2 (opzionale, CNN_CACHE_MONGO=1): collection Mongo con TTL,
+      condivisa tra worker/istanze e persistente ai riavvii.
+
+    I risultati in cache non contengono l'embedding. get ritorna una copia
+    superficiale: i valori annidati (es. top_k) sono condivisi, da non modificare.
+    """
+
+    def __init__(self, max_size: int = CNN_CACHE_SIZE, use_mongo: bool = CNN_CACHE_MONGO):
+        self.max_size = max(0, max_size)
+        self.use_mongo = use_mongo
+        self._lru: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._collection = None
+        self._stats = {"hits_memory": 0, "hits_mongo": 0, "misses": 0}
+
+    @staticmethod
+    def make_key(digest: str, model_version: str, species: Optional[str], top_k: int = 0) -> str:
+        return f"{digest}:{model_version}:{species or '*'}:{top_k}"
+
+    def _get_collection(self):
+        if self._collection is None:
+            from database import db
+            self._collection = db[CNN_CACHE_COLLECTION]
+        return self._collection
+
+    def ensure_indexes(self):
+        if not self.use_mongo:
+            return
+        try:
+            self._get_collection().create_index(
+                "createdAt", expireAfterSeconds=CNN_CACHE_TTL_DAYS * 24 * 3600, name="ttl_cnn_cache"
+            )
+        except Exception as e:
+            print(f"[WARN] cnn cache indexes: {e}")
+
+    # --- Tier memoria ---
+    def _get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            value = self._lru.get(key)
+            if value is not None:
+                self._lru.move_to_end(key)
+            return value
+
+    def _put_memory(self, key: str, value: Dict[str, Any]):
+        if self.max_size == 0:
+            return
+        with self._lock:
+            self._lru[key] = value
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+
+    # --- API (sincrona: chiamare da thread se si usa il tier Mongo) ---
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._get_memory(key)
+        if value is not None:
+            self._stats["hits_memory"] += 1
+            return dict(value)
+
+        if self.use_mongo:
+            try:
+                doc = self._get_collection().find_one({"_id": key}, {"result": 1})
+                if doc and doc.get("result"):
+                    self._stats["hits_mongo"] += 1
+                    self._put_memory(key, doc["result"])
+                    return dict(doc["result"])
+            except Exception as e:
+                logger.warning(f"Cache CNN (Mongo) non disponibile: {e}")
+
+        self._stats["misses"] += 1
+        return None
+
+    def put(self, key: str, result: Dict[str, Any]):
+        # Copia una tantum (risultato piccolo, senza embedding): il chiamante può modificare il suo
+        value = copy.deepcopy({k: v for k, v in result.items() if k != "embedding"})
+        self._put_memory(key, value)
+        if self.use_mongo:
+            try:
+                self._get_collection().update_one(
+                    {"_id": key},
+                    {"$set": {"result": value, "createdAt": datetime.utcnow()}},
+                    upsert=True,
+                )
+            except Exception as e:
+                logger.warning(f"Cache CNN (Mongo) scrittura fallita: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self._stats["hits_memory"] + self._stats["hits_mongo"]
+        total = hits + self._stats["misses"]
+        return {
+            **self._stats,
+            "size": len(self._lru),
+            "max_size": self.max_size,
+            "mongo": self.use_mongo,
+            "hit_rate": round(hits / total, 4) if total else None,
+        }
+
+
+# Istanza globale
+prediction_cache = PredictionCache()
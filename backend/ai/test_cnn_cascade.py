@@ -0,0 +1,89 @@
+"""
+Test della cascata modello veloce -> modello completo di PlantClassifierCNN,
+con modelli finti al posto di TensorFlow.
+Esecuzione: python -m pytest ai/test_cnn_cascade.py  (da backend/)
+oppure:     python ai/test_cnn_cascade.py
+"""
+
+import sys
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from ai.cnn_service import CascadeStats, PlantClassifierCNN
+
+CLASSES = {0: "Tomato___healthy", 1: "Tomato___Late_blight"}
+
+
+class FakeFast:
+    """Modello veloce sempre sicuro: senza embedding la cascata si fermerebbe qui."""
+
+    def predict(self, batch):
+        return np.tile(np.array([0.99, 0.01], dtype=np.float32), (len(batch), 1))
+
+
+class FakeFull:
+    def __init__(self):
+        self.calls = 0
+
+    def predict_with_embedding(self, batch):
+        self.calls += 1
+        n = len(batch)
+        return np.tile(np.array([0.2, 0.8], dtype=np.float32), (n, 1)), np.ones((n, 4), dtype=np.float32)
+
+
+def _classifier():
+    # Istanza fuori dal singleton: non tocca il cnn_classifier globale
+    clf = object.__new__(PlantClassifierCNN)
+    clf._loaded = True
+    clf._classes = CLASSES
+    clf._labels_lower = {i: name.lower() for i, name in CLASSES.items()}
+    clf._species_index = {}
+    clf._cascade = CascadeStats()
+    clf._fast_model = FakeFast()
+    clf._model = FakeFull()
+    return clf
+
+
+def _jpeg() -> bytes:
+    buf = BytesIO()
+    Image.new("RGB", (32, 32), (40, 120, 40)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def test_embedding_always_present_with_cascade():
+    clf = _classifier()
+    result = clf.predict_health(_jpeg(), return_embedding=True)
+    assert result["embedding"] == [1.0] * 4
+    assert clf._model.calls == 1
+    assert clf.last_route() is None        # cascata saltata
+
+
+def test_fast_route_without_embedding():
+    clf = _classifier()
+    result = clf.predict_health(_jpeg())
+    assert "embedding" not in result
+    assert clf._model.calls == 0
+    assert clf.last_route()["route"] == "fast"
+
+
+def test_batch_embedding_always_present_with_cascade():
+    clf = _classifier()
+    results = clf.predict_health_batch([_jpeg(), b"non-una-immagine", _jpeg()])
+    assert [r.get("embedding") for r in (results[0], results[2])] == [[1.0] * 4] * 2
+    assert "error" in results[1]
+    # Senza embedding la cascata resta attiva e il modello completo non gira
+    results = clf.predict_health_batch([_jpeg()], return_embedding=False)
+    assert "embedding" not in results[0]
+    assert clf._model.calls == 1
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"  ✔︎ {name}")
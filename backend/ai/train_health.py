@@ -1,117 +1,298 @@
 #ATTENZIONE, COSA FA: Legge le immagini dal nostro Desktop, impara a riconoscerle e salva il "cervello" (.h5) dentro la cartella del tuo progetto backend.
+#
+# Due modalità:
+#   --mode augment (default): pipeline tf.data (decode parallelo, cache(), augmentation, prefetch()) e
+#       training end-to-end con la base congelata, come la versione originale con ImageDataGenerator.
+#   --mode embeddings (opzionale, veloce su CPU): la base MobileNetV2 congelata viene eseguita UNA sola
+#       volta su tutte le immagini; gli embedding (1280 float16) finiscono in un array memory-mapped
+#       e ad ogni epoca si addestra solo la testa Dense. Niente data augmentation.
+#
+# In entrambi i casi il modello salvato ha la stessa architettura (MobileNetV2 + GAP + Dense 128 + Dropout + softmax).
+#
+# --arch fast addestra invece il classificatore veloce della cascata (MobileNetV3-small, stessa testa,
+# stesse classi, input [0,1]) e lo salva come plant_disease_model_fast.h5 (vedi CNN_CASCADE in cnn_service.py).
 
+import argparse
 import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
-from tensorflow.keras.applications import MobileNetV2
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout
+from tensorflow.keras.applications import MobileNetV2, MobileNetV3Small
+from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout, Input
 from tensorflow.keras.models import Model
 from tensorflow.keras.optimizers import Adam
+import numpy as np
+import hashlib
 import os
 import json
+import random
+import time
 
 # --- 1. CONFIGURAZIONE PERCORSI ---
 DATASET_DIR = "/Users/maure/Desktop/PROGETTO MONGIELLO /PlantVillage"
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_DIR = os.path.join(BASE_DIR, "models")
+CACHE_DIR = os.path.join(MODEL_DIR, "cache")
 MODEL_NAME = "plant_disease_model.h5"
+FAST_MODEL_NAME = "plant_disease_model_fast.h5"
 CLASS_MAP_NAME = "disease_classes.json"
 
 IMG_SIZE = (224, 224)
 BATCH_SIZE = 32
-EPOCHS = 10  
+EPOCHS = 10
+VALIDATION_SPLIT = 0.3
+SEED = 123
+ARCH = "mobilenetv2"  # oppure "fast" (MobileNetV3-small)
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".gif"}
 
-def train():
+AUTOTUNE = tf.data.AUTOTUNE
+
+
+def _check_dataset():
     # Verifica che il dataset esista
     if not os.path.exists(DATASET_DIR):
         print(f" ERRORE CRITICO: Il percorso del dataset non esiste!")
         print(f"   Path cercato: {DATASET_DIR}")
-        return
+        return None
 
-    # Verifica che ci siano cartelle dentro
-    subdirs = [d for d in os.listdir(DATASET_DIR) if os.path.isdir(os.path.join(DATASET_DIR, d))]
+    # Verifica che ci siano cartelle dentro (ordinate come flow_from_directory)
+    subdirs = sorted(d for d in os.listdir(DATASET_DIR) if os.path.isdir(os.path.join(DATASET_DIR, d)))
     if not subdirs:
         print(f"ERRORE: La cartella sembra vuota o non contiene le sottocartelle delle piante.")
-        return
-    
+        return None
+
     print(f"Dataset trovato! Rilevate {len(subdirs)} classi.")
     print(f"   Esempio classi: {subdirs[:3]}...")
+    return subdirs
 
-    # 2. Preparazione Dati (Data Augmentation)
-    print(" Preparazione generatori di immagini...")
-    train_datagen = ImageDataGenerator(
-        rescale=1./255,         # Normalizza i pixel (0-1)
-        rotation_range=25,      # Ruota leggermente le immagini
-        width_shift_range=0.2,
-        height_shift_range=0.2,
-        zoom_range=0.2,
-        horizontal_flip=True,
-        validation_split=0.3    # Usa il 20% delle foto per testare la precisione
-    )
 
-    # Caricamento Training Set
-    train_generator = train_datagen.flow_from_directory(
-        DATASET_DIR,
-        target_size=IMG_SIZE,
-        batch_size=BATCH_SIZE,
-        class_mode='categorical',
-        subset='training'
-    )
+def _list_files(class_names):
+    """Lista (path, label) con split train/validation deterministico per classe."""
+    train, val = [], []
+    rnd = random.Random(SEED)
+    for label, name in enumerate(class_names):
+        folder = os.path.join(DATASET_DIR, name)
+        files = sorted(
+            os.path.join(folder, f) for f in os.listdir(folder)
+            if os.path.splitext(f)[1].lower() in IMAGE_EXTS
+        )
+        rnd.shuffle(files)
+        n_val = int(len(files) * VALIDATION_SPLIT)
+        val.extend((f, label) for f in files[:n_val])
+        train.extend((f, label) for f in files[n_val:])
+    return train, val
 
-    # Caricamento Validation Set
-    validation_generator = train_datagen.flow_from_directory(
-        DATASET_DIR,
-        target_size=IMG_SIZE,
-        batch_size=BATCH_SIZE,
-        class_mode='categorical',
-        subset='validation'
-    )
 
-    # 3. Salvataggio Mappa Classi
+def _save_class_map(class_names):
     # Questo serve al backend per sapere che "Indice 0" significa "Apple___Black_rot"
-    class_indices = train_generator.class_indices
-    idx_to_class = {v: k for k, v in class_indices.items()}
-    
+    idx_to_class = {i: name for i, name in enumerate(class_names)}
     os.makedirs(MODEL_DIR, exist_ok=True)
     with open(os.path.join(MODEL_DIR, CLASS_MAP_NAME), 'w') as f:
         json.dump(idx_to_class, f)
     print(f" Mappa classi salvata in: {CLASS_MAP_NAME}")
 
-    num_classes = len(class_indices)
 
-    # 4. Creazione Modello (MobileNetV2)
+def _decode(path, label):
+    img = tf.io.read_file(path)
+    img = tf.io.decode_image(img, channels=3, expand_animations=False)
+    img = tf.image.resize(img, IMG_SIZE)
+    return tf.cast(img, tf.float32) / 255.0, label  # Normalizza i pixel (0-1)
+
+
+def _dataset(items, num_classes, training: bool, cache_file: str = ""):
+    """
+    tf.data: decode parallelo -> cache() (immagini già ridimensionate) -> augmentation -> batch -> prefetch().
+    cache_file="" tiene la cache in memoria; un path la scrive su disco.
+    """
+    paths = [p for p, _ in items]
+    labels = [l for _, l in items]
+    ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+    ds = ds.map(_decode, num_parallel_calls=AUTOTUNE).cache(cache_file)
+
+    if training:
+        augment = tf.keras.Sequential([
+            tf.keras.layers.RandomRotation(25 / 360),       # Ruota leggermente le immagini
+            tf.keras.layers.RandomTranslation(0.2, 0.2),
+            tf.keras.layers.RandomZoom(0.2),
+            tf.keras.layers.RandomFlip("horizontal"),
+        ])
+        ds = ds.shuffle(2048, seed=SEED)
+        ds = ds.map(lambda x, y: (augment(x, training=True), y), num_parallel_calls=AUTOTUNE)
+
+    ds = ds.map(lambda x, y: (x, tf.one_hot(y, num_classes)), num_parallel_calls=AUTOTUNE)
+    return ds.batch(BATCH_SIZE).prefetch(AUTOTUNE)
+
+
+def _build_base():
+    if ARCH == "fast":
+        # MobileNetV3-small si aspetta input in [-1,1]: lo riscalo così il modello
+        # riceve [0,1] come quello completo (stesso preprocessing nel backend)
+        backbone = MobileNetV3Small(weights='imagenet', include_top=False, input_shape=(224, 224, 3),
+                                    include_preprocessing=False)
+        backbone.trainable = False
+        inp = Input(shape=(224, 224, 3))
+        return Model(inp, backbone(tf.keras.layers.Rescaling(2.0, offset=-1.0)(inp)))
+
     # Scarica la struttura di una rete neurale potente ma leggera
     base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=(224, 224, 3))
     base_model.trainable = False # Congela la base per non distruggerla subito
+    return base_model
+
 
+def _attach_head(base_model, num_classes):
     # Aggiunge la "testa" personalizzata per le tue piante
     x = base_model.output
     x = GlobalAveragePooling2D()(x)
     x = Dense(128, activation='relu')(x)
     x = Dropout(0.5)(x)
     predictions = Dense(num_classes, activation='softmax')(x)
+    return Model(inputs=base_model.input, outputs=predictions)
 
-    model = Model(inputs=base_model.input, outputs=predictions)
 
-    # Compilazione
+def _compile(model):
     model.compile(optimizer=Adam(learning_rate=0.0001),
                   loss='categorical_crossentropy',
                   metrics=['accuracy'])
+    return model
 
-    # 5. Avvio Addestramento
-    print("\n AVVIO TRAINING (Questo processo richiederà tempo)...")
-    model.fit(
-        train_generator,
-        steps_per_epoch=train_generator.samples // BATCH_SIZE,
-        validation_data=validation_generator,
-        validation_steps=validation_generator.samples // BATCH_SIZE,
-        epochs=EPOCHS
+
+# --- MODALITÀ EMBEDDINGS ---
+
+def _embeddings_signature(items, dim: int) -> dict:
+    """
+    Firma della cache embedding: elenco completo dei file (percorso, etichetta, mtime,
+    dimensione) + backbone e versione di TensorFlow/Keras che ha prodotto i pesi.
+    """
+    h = hashlib.sha256()
+    for path, label in items:
+        st = os.stat(path)
+        h.update(f"{path}\0{label}\0{st.st_mtime_ns}\0{st.st_size}\n".encode())
+    return {"n": len(items), "dim": dim, "arch": ARCH, "img_size": list(IMG_SIZE),
+            "tf": tf.__version__, "keras": getattr(tf.keras, "__version__", ""), "files": h.hexdigest()}
+
+
+def _compute_embeddings(extractor, items, name: str) -> np.memmap:
+    """
+    Esegue la base congelata una sola volta e salva gli embedding in un memmap float16.
+    Il file viene riutilizzato solo se la firma (tutti i file + backbone) è invariata.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    dim = int(extractor.output_shape[-1])  # 1280 per MobileNetV2, 576 per MobileNetV3-small
+    data_path = os.path.join(CACHE_DIR, f"embeddings_{ARCH}_{name}.f16")
+    meta_path = os.path.join(CACHE_DIR, f"embeddings_{ARCH}_{name}.json")
+    signature = _embeddings_signature(items, dim)
+
+    if os.path.exists(data_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) == signature:
+                print(f"   ✓ Embedding '{name}' riutilizzati dalla cache")
+                return np.memmap(data_path, dtype=np.float16, mode="r", shape=(len(items), dim))
+
+    print(f"   Calcolo embedding '{name}' ({len(items)} immagini)...")
+    t0 = time.perf_counter()
+    out = np.memmap(data_path, dtype=np.float16, mode="w+", shape=(len(items), dim))
+    ds = tf.data.Dataset.from_tensor_slices([p for p, _ in items])
+    ds = ds.map(lambda p: _decode(p, 0)[0], num_parallel_calls=AUTOTUNE).batch(BATCH_SIZE).prefetch(AUTOTUNE)
+
+    pos = 0
+    for batch in ds:
+        feats = extractor(batch, training=False).numpy()
+        out[pos:pos + len(feats)] = feats.astype(np.float16)
+        pos += len(feats)
+    out.flush()
+    with open(meta_path, "w") as f:
+        json.dump(signature, f)
+    print(f"   ✓ Embedding '{name}' calcolati in {time.perf_counter() - t0:.1f}s")
+    return out
+
+
+def train_embeddings(class_names, train_items, val_items):
+    num_classes = len(class_names)
+    base_model = _build_base()
+    extractor = Model(base_model.input, GlobalAveragePooling2D()(base_model.output))
+
+    x_train = _compute_embeddings(extractor, train_items, "train")
+    x_val = _compute_embeddings(extractor, val_items, "validation")
+    y_train = tf.keras.utils.to_categorical([l for _, l in train_items], num_classes)
+    y_val = tf.keras.utils.to_categorical([l for _, l in val_items], num_classes)
+
+    # Solo la testa Dense viene addestrata: ogni epoca costa millisecondi, non minuti
+    inp = Input(shape=(x_train.shape[1],))
+    h = Dense(128, activation='relu')(inp)
+    h = Dropout(0.5)(h)
+    out = Dense(num_classes, activation='softmax')(h)
+    head = _compile(Model(inp, out))
+
+    print("\n AVVIO TRAINING TESTA (embedding precalcolati)...")
+    head.fit(
+        np.asarray(x_train, dtype=np.float32), y_train,
+        validation_data=(np.asarray(x_val, dtype=np.float32), y_val),
+        batch_size=BATCH_SIZE,
+        epochs=EPOCHS,
+        shuffle=True,
     )
 
+    # Ricompone il modello completo con la stessa architettura della modalità originale
+    model = _attach_head(base_model, num_classes)
+    trained = [l for l in head.layers if l.weights]
+    target = [l for l in model.layers[-3:] if l.weights]
+    for src, dst in zip(trained, target):
+        dst.set_weights(src.get_weights())
+    return _compile(model)
+
+
+# --- MODALITÀ AUGMENTATION (tf.data) ---
+
+def train_augment(class_names, train_items, val_items, cache_to_disk: bool):
+    num_classes = len(class_names)
+    cache_train = os.path.join(CACHE_DIR, "tfdata_train") if cache_to_disk else ""
+    cache_val = os.path.join(CACHE_DIR, "tfdata_val") if cache_to_disk else ""
+    if cache_to_disk:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+
+    print(" Preparazione pipeline tf.data...")
+    train_ds = _dataset(train_items, num_classes, training=True, cache_file=cache_train)
+    val_ds = _dataset(val_items, num_classes, training=False, cache_file=cache_val)
+
+    model = _compile(_attach_head(_build_base(), num_classes))
+
+    print("\n AVVIO TRAINING (Questo processo richiederà tempo)...")
+    model.fit(train_ds, validation_data=val_ds, epochs=EPOCHS)
+    return model
+
+
+def train(mode: str = "augment", cache_to_disk: bool = False):
+    class_names = _check_dataset()
+    if not class_names:
+        return
+
+    train_items, val_items = _list_files(class_names)
+    print(f"   Training: {len(train_items)} immagini | Validazione: {len(val_items)} immagini")
+    _save_class_map(class_names)
+
+    t0 = time.perf_counter()
+    if mode == "embeddings":
+        model = train_embeddings(class_names, train_items, val_items)
+    else:
+        model = train_augment(class_names, train_items, val_items, cache_to_disk)
+    print(f"\n Tempo totale di training: {time.perf_counter() - t0:.1f}s (modalità {mode})")
+
     # 6. Salvataggio Finale
-    save_path = os.path.join(MODEL_DIR, MODEL_NAME)
+    save_path = os.path.join(MODEL_DIR, FAST_MODEL_NAME if ARCH == "fast" else MODEL_NAME)
     model.save(save_path)
     print(f"\n COMPLETATO! Modello salvato in: {save_path}")
     print(" Ora puoi riavviare il backend per caricare il nuovo modello.")
 
 if __name__ == "__main__":
-    train()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Training CNN malattie piante")
+    parser.add_argument("--mode", choices=["augment", "embeddings"], default="augment",
+                        help="embeddings = solo la testa Dense su embedding precalcolati (senza augmentation)")
+    parser.add_argument("--dataset", default=None, help="Cartella PlantVillage (sottocartelle per classe)")
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--cache-to-disk", action="store_true", help="tf.data cache() su file invece che in RAM")
+    parser.add_argument("--arch", choices=["mobilenetv2", "fast"], default=ARCH,
+                        help="fast = MobileNetV3-small per la cascata (plant_disease_model_fast.h5)")
+    args = parser.parse_args()
+
+    if args.dataset:
+        DATASET_DIR = args.dataset
+    EPOCHS = args.epochs
+    ARCH = args.arch
+    train(args.mode, args.cache_to_disk)
@@ -0,0 +1,149 @@
+#COSA FA: Benchmark della pipeline di salvataggio immagini (save_image_bytes) per profilo di encoding.
+#  - legacy: pipeline originale (due resize LANCZOS dall'originale, WEBP method=6)
+#  - fast / balanced / best: pipeline attuale (decode unico, thumbnail dalla main) con sforzo crescente
+# Per ogni profilo: latenza p50/p95 di un upload, dimensione media dei file prodotti e
+# throughput con N upload concorrenti attraverso il pool immagini (come negli handler async).
+#
+# Uso:
+#   python benchmark_uploads.py --images /path/foto --runs 20 --concurrency 8
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+
+# Salva in una cartella temporanea, non in uploads/
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="bench_uploads_"))
+sys.path.append(str(Path(__file__).parent))
+
+from utils import images
+from utils.images import save_image_bytes, save_image_bytes_async, ENCODE_PROFILES
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def _load_corpus(images_dir: str, limit: int):
+    files = sorted(p for p in Path(images_dir).rglob("*") if p.suffix.lower() in IMAGE_EXTS)[:limit]
+    return [f.read_bytes() for f in files]
+
+
+def _synthetic_photos(n: int, size=(4032, 3024)):
+    """JPEG 12MP con gradiente + rumore (costo di decodifica simile a una foto da smartphone)."""
+    from PIL import Image
+    rnd = np.random.default_rng(1)
+    w, h = size
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    out = []
+    for i in range(n):
+        base = np.stack([
+            120 + 60 * np.sin(xx / (180 + 40 * i)),
+            140 + 50 * np.cos(yy / (150 + 30 * i)),
+            80 + 40 * np.sin((xx + yy) / 300),
+        ], axis=-1)
+        base += rnd.normal(0, 12, size=base.shape).astype(np.float32)
+        buf = BytesIO()
+        Image.fromarray(np.clip(base, 0, 255).astype(np.uint8)).save(buf, format="JPEG", quality=90)
+        out.append(buf.getvalue())
+    return out
+
+
+def _legacy_save(data: bytes, subdir: str, max_side: int = 1280, thumb_side: int = 384, webp_quality: int = 82):
+    """Pipeline originale: decode completo, due resize dall'originale, method=6."""
+    from PIL import Image, ImageOps
+    from uuid import uuid4
+    target = Path(os.environ["UPLOAD_DIR"]) / subdir
+    target.mkdir(parents=True, exist_ok=True)
+    img = Image.open(BytesIO(data))
+    img.load()
+    img = ImageOps.exif_transpose(img).convert("RGB")
+
+    def resize(im, side):
+        w, h = im.size
+        if max(w, h) <= side:
+            return im
+        scale = side / float(max(w, h))
+        return im.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
+
+    uid = uuid4().hex[:10]
+    main_path, thumb_path = target / f"{uid}.webp", target / f"{uid}_sm.webp"
+    resize(img, max_side).save(main_path, format="WEBP", quality=webp_quality, method=6)
+    resize(img, thumb_side).save(thumb_path, format="WEBP", quality=webp_quality, method=6)
+    return {"abs": str(main_path), "absThumb": str(thumb_path)}
+
+
+def _save_fn(profile: str):
+    if profile == "legacy":
+        return _legacy_save
+    return lambda data, subdir: save_image_bytes(data=data, subdir=subdir, profile=profile)
+
+
+async def _concurrent(profile: str, corpus, concurrency: int) -> float:
+    """Upload concorrenti nel pool immagini: immagini/secondo."""
+    fn = _save_fn(profile)
+    t0 = time.perf_counter()
+    if profile == "legacy":
+        await asyncio.gather(*(
+            images.run_in_image_pool(fn, corpus[i % len(corpus)], f"bench/{profile}") for i in range(concurrency)
+        ))
+    else:
+        await asyncio.gather(*(
+            save_image_bytes_async(corpus[i % len(corpus)], f"bench/{profile}", profile=profile)
+            for i in range(concurrency)
+        ))
+    return concurrency / (time.perf_counter() - t0)
+
+
+def run(images_dir: str = None, runs: int = 20, limit: int = 20, concurrency: int = 8, profiles=None):
+    corpus = _load_corpus(images_dir, limit) if images_dir else _synthetic_photos(min(limit, 3))
+    if not corpus:
+        print(" ERRORE: nessuna immagine trovata")
+        return {}
+    avg_mb = sum(len(c) for c in corpus) / len(corpus) / 1e6
+    print(f"\n Benchmark upload: {len(corpus)} immagini (media {avg_mb:.1f} MB), {runs} upload per profilo")
+    print(f" Pool immagini: {images.IMAGE_ENCODE_WORKERS} thread | concorrenza: {concurrency}\n")
+
+    results = {}
+    for profile in (profiles or ["legacy", *ENCODE_PROFILES]):
+        fn = _save_fn(profile)
+        lat, sizes = [], []
+        for i in range(runs):
+            t = time.perf_counter()
+            saved = fn(corpus[i % len(corpus)], f"bench/{profile}")
+            lat.append((time.perf_counter() - t) * 1000)
+            sizes.append(os.path.getsize(saved["abs"]) + os.path.getsize(saved["absThumb"]))
+        lat = np.array(lat)
+        results[profile] = {
+            "p50_ms": round(float(np.percentile(lat, 50)), 1),
+            "p95_ms": round(float(np.percentile(lat, 95)), 1),
+            "avg_kb": round(float(np.mean(sizes)) / 1024, 1),
+            "concurrent_ips": round(asyncio.run(_concurrent(profile, corpus, concurrency)), 2),
+        }
+
+    print(f"{'profilo':<10}{'p50 ms':>10}{'p95 ms':>10}{'KB':>10}{'img/s':>10}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['avg_kb']:>10}{r['concurrent_ips']:>10}")
+    images.shutdown_image_pool()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark latenza upload per profilo di encoding")
+    parser.add_argument("--images", help="Cartella con immagini reali (default: JPEG 12MP sintetici)")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20, help="Numero massimo di immagini caricate")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--profiles", nargs="+", choices=["legacy", *ENCODE_PROFILES])
+    parser.add_argument("--json", help="Salva i risultati in un file JSON")
+    args = parser.parse_args()
+
+    res = run(args.images, args.runs, args.limit, args.concurrency, args.profiles)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(res, f, indent=2)
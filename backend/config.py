@@ -16,6 +16,9 @@ settings = Settings()
 BASE_DIR = Path(__file__).resolve().parent
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", str(BASE_DIR / "uploads"))
 MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", 5))
+# Foto da analizzare/archiviare (analyze-health, similar, /api/images/upload): una JPEG
+# da 12MP di uno smartphone supera spesso i 5MB
+IMAGE_UPLOAD_MAX_MB = float(os.getenv("IMAGE_UPLOAD_MAX_MB", 20))
 ALLOWED_IMAGE_MIME = {"image/jpeg", "image/png", "image/webp"}
 
 # CONFIGURAZIONE GENERALE
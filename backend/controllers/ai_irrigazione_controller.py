@@ -1,3 +1,4 @@
+import asyncio
 import os
 from datetime import datetime, timedelta
 from typing import List, Dict, Any
@@ -96,7 +97,8 @@ def _check_recent_fertilization(plant_id_str: str, plant_oid=None) -> str:
 
 # --- CORE LOGIC ---
 
-async def compute_for_plant(plant: dict) -> Dict[str, Any]:
+async def compute_for_plant(plant: dict, prefetched_wx: dict = None) -> Dict[str, Any]:
+    """'prefetched_wx': meteo già scaricato (compute_batch); se vuoto viene richiesto qui."""
     try:
         # Recupero ID Robusto
         raw_id = plant.get("_id") or plant.get("id")
@@ -112,11 +114,13 @@ async def compute_for_plant(plant: dict) -> Dict[str, Any]:
         # 1. METEO REALE
         real_wx = {}
         # Logica recupero meteo
-        db_lat = plant.get("geoLat")
-        db_lon = plant.get("geoLng")
         db_city = plant.get("location") or plant.get("addressLocality")
         try:
-            if db_lat and db_lon:
+            # geoLat/geoLng dal DB, altrimenti geocoding (cache) salvato nella pianta
+            db_lat, db_lon = await weatherController.resolve_coordinates(plant)
+            if prefetched_wx:
+                real_wx = prefetched_wx
+            elif db_lat and db_lon:
                 real_wx = await weatherController.get_weather_data(lat=db_lat, lon=db_lon)
             elif db_city:
                 real_wx = await weatherController.get_weather_data(city=db_city)
@@ -253,10 +257,19 @@ async def compute_for_plant(plant: dict) -> Dict[str, Any]:
         return {"recommendation": "SKIP", "reason": f"Errore: {str(e)}", "liters": 0}
 
 async def compute_batch(plants: list):
+    plants = plants or []
+    # Meteo di tutte le piante in poche richieste multi-località (celle di griglia deduplicate)
+    coords = await asyncio.gather(*(weatherController.resolve_coordinates(p) for p in plants))
+    try:
+        weather = await weatherController.get_weather_batch(list(coords))
+    except Exception as e:
+        print(f"[ERR METEO BATCH] {e}")
+        weather = [{}] * len(plants)
+
     results = []
-    for p in (plants or []):
+    for p, wx in zip(plants, weather):
         try:
-            res = await compute_for_plant(p)
+            res = await compute_for_plant(p, prefetched_wx=wx)
             pid = str(p.get("_id") or p.get("id"))
             res["id"] = pid
             results.append(res)
@@ -1,21 +1,32 @@
 from typing import Optional, Dict, Any, List, Tuple
 from fastapi import UploadFile, HTTPException
 from pymongo.collection import Collection
-from pymongo import DESCENDING
+from pymongo import ASCENDING, DESCENDING
 from bson import ObjectId
 from bson.errors import InvalidId
 from datetime import datetime, timedelta
 from PIL import Image
 from io import BytesIO
+import base64
+import json
 import os
 import random
 import dateutil.parser 
 
-from utils.images import save_image_bytes
-from config import settings
+from utils.images import run_in_image_pool
+from utils.image_store import store_image_bytes, release_image_files
+from utils.uploads import read_upload
+from config import settings, IMAGE_UPLOAD_MAX_MB
 from utils.ai_explainer_service import explain_irrigation_async
 from controllers.weather_controller import weatherController
 
+# Campi restituiti dalla lista in modalità "summary"
+LIST_SUMMARY_FIELDS = {
+    "originalfilename": 1, "urlfull": 1, "urlthumb": 1, "planttype": 1, "location": 1,
+    "uploadtimestamp": 1, "processed": 1, "cnnresults.disease_detected": 1, "cnnresults.confidence": 1,
+}
+
+
 class ImageController:
     
     def __init__(self, collection: Collection):
@@ -82,9 +93,8 @@ class ImageController:
             # 1. METEO
             real_wx = {}
             try:
-                lat = plant.get("geoLat")
-                lon = plant.get("geoLng")
                 city = plant.get("location")
+                lat, lon = await weatherController.resolve_coordinates(plant, self.collection)
                 if lat and lon:
                     real_wx = await weatherController.get_weather_data(lat=lat, lon=lon)
                 elif city:
@@ -185,10 +195,11 @@ class ImageController:
     
     # --- CRUD STANDARD 
     async def upload_image(self, file: UploadFile, planttype: str = None, location: str = None, sensorid: str = None, notes: str = None) -> dict:
-        if not file.content_type.startswith("image/"): raise HTTPException(400, "File non valido")
-        imagedata = await file.read()
+        upload = await read_upload(file, max_mb=IMAGE_UPLOAD_MAX_MB)  # 400 se non è un'immagine, 413 oltre IMAGE_UPLOAD_MAX_MB
+        imagedata = upload.data
         metadata = self.extract_image_metadata(imagedata, file.filename)
-        saved_paths = self.save_image_to_filesystem(imagedata)
+        # Storage per contenuto: un duplicato non viene ricodificato né riscritto su disco
+        saved_paths = await run_in_image_pool(self.save_image_to_filesystem, imagedata, upload.sha256)
         wx = self._get_weather_context_fallback()
         doc = {
             "filename": os.path.basename(saved_paths["abs"]),
@@ -201,6 +212,7 @@ class ImageController:
             "location": location,
             "sensorid": sensorid,
             "uploadtimestamp": datetime.utcnow(),
+            "sha256": saved_paths["sha256"],
             "processed": False,
             "notes": notes,
             "metadata": metadata,
@@ -212,13 +224,93 @@ class ImageController:
         doc["_id"] = res.inserted_id
         return {"status": "success", "image": self._enrich_image_for_frontend(doc)}
 
-    def list_images(self, limit: int = 100, processed: bool = None, planttype: str = None, location: str = None) -> dict:
+    def ensure_indexes(self):
+        # Ordinamento (uploadtimestamp, _id) + filtri in uguaglianza davanti (keyset pagination)
+        try:
+            sort_keys = [("uploadtimestamp", DESCENDING), ("_id", DESCENDING)]
+            self.collection.create_index(sort_keys, name="idx_upload_id")
+            self.collection.create_index([("processed", ASCENDING), *sort_keys], name="idx_processed_upload_id")
+            self.collection.create_index([("planttype", ASCENDING), *sort_keys], name="idx_planttype_upload_id")
+            self.collection.create_index([("location", ASCENDING), *sort_keys], name="idx_location_upload_id")
+            self.collection.create_index(
+                [("planttype", ASCENDING), ("processed", ASCENDING), *sort_keys], name="idx_planttype_processed_upload_id"
+            )
+        except Exception as e:
+            print(f"[WARN] images indexes: {e}")
+
+    def backfill_upload_timestamps(self) -> int:
+        """
+        Documenti legacy senza uploadtimestamp (o non di tipo data): data ricavata dal
+        valore esistente se convertibile, altrimenti dall'_id. Senza, la paginazione keyset
+        li metterebbe in fondo senza poterli raggiungere con il cursore.
+        Migrazione una tantum (scansione completa, non indicizzabile): non gira allo
+        startup, si lancia con 'python import_images.py --backfill-timestamps'.
+        """
+        try:
+            res = self.collection.update_many(
+                {"uploadtimestamp": {"$not": {"$type": "date"}}},
+                [{"$set": {"uploadtimestamp": {"$ifNull": [
+                    {"$convert": {"input": "$uploadtimestamp", "to": "date", "onError": None, "onNull": None}},
+                    {"$toDate": "$_id"},
+                ]}}}],
+            )
+            if res.modified_count:
+                print(f"[INFO] uploadtimestamp impostato su {res.modified_count} immagini legacy")
+            return res.modified_count
+        except Exception as e:
+            print(f"[WARN] images uploadtimestamp backfill: {e}")
+            return 0
+
+    @staticmethod
+    def _encode_cursor(doc: dict) -> str:
+        ts = doc.get("uploadtimestamp")
+        if not isinstance(ts, datetime):
+            # Non dovrebbe più accadere dopo il backfill: data di creazione dell'_id
+            ts = doc["_id"].generation_time.replace(tzinfo=None)
+        raw = json.dumps({"t": ts.isoformat(), "id": str(doc["_id"])})
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            return datetime.fromisoformat(raw["t"]), ObjectId(raw["id"])
+        except Exception:
+            raise HTTPException(400, "Cursore non valido")
+
+    def list_images(self, limit: int = 100, processed: bool = None, planttype: str = None, location: str = None,
+                    cursor: str = None, view: str = "full") -> dict:
+        """
+        Paginazione keyset su (uploadtimestamp, _id) decrescenti: 'cursor' è il
+        'nextCursor' della pagina precedente (costo costante anche a milioni di immagini).
+        view="summary" restituisce solo i campi della lista (senza meteo/profilo/metadata).
+        """
         q = {}
         if processed is not None: q["processed"] = processed
         if planttype: q["planttype"] = planttype
         if location: q["location"] = location
-        raw = list(self.collection.find(q).limit(limit).sort("uploadtimestamp", DESCENDING))
-        return {"status": "success", "images": [self._enrich_image_for_frontend(i) for i in raw], "count": len(raw)}
+        if cursor:
+            ts, oid = self._decode_cursor(cursor)
+            # Range comune in cima: una sola scansione dell'indice limitata a <= ts
+            q["uploadtimestamp"] = {"$lte": ts}
+            q["$or"] = [{"uploadtimestamp": {"$lt": ts}}, {"uploadtimestamp": ts, "_id": {"$lt": oid}}]
+
+        projection = LIST_SUMMARY_FIELDS if view == "summary" else None
+        raw = list(
+            self.collection.find(q, projection)
+            .sort([("uploadtimestamp", DESCENDING), ("_id", DESCENDING)])
+            .limit(limit)
+        )
+        next_cursor = self._encode_cursor(raw[-1]) if len(raw) == limit else None
+
+        if view == "summary":
+            images = []
+            for i in raw:
+                i["id"] = str(i.pop("_id"))
+                images.append(i)
+        else:
+            images = [self._enrich_image_for_frontend(i) for i in raw]
+        return {"status": "success", "images": images, "count": len(raw), "nextCursor": next_cursor}
 
     def get_image_details(self, imageid: str) -> dict:
         oid = self.validate_objectid(imageid)
@@ -240,11 +332,9 @@ class ImageController:
             return {"width": img.width, "height": img.height, "format": img.format}
         except: return {}
 
-    def save_image_to_filesystem(self, imagedata):
-        datesubdir = datetime.utcnow().strftime("%Y%m%d")
-        subdir = f"plant_images/{datesubdir}"
-        return save_image_bytes(data=imagedata, subdir=subdir, basename=None, maxside=1280, thumbside=384, webpquality=82)
+    def save_image_to_filesystem(self, imagedata, digest: str = None):
+        return store_image_bytes(data=imagedata, digest=digest, max_side=1280, thumb_side=384, webp_quality=82)
 
     def delete_image_files(self, f1, f2):
-        for f in [f1, f2]:
-            if f and os.path.exists(f): os.remove(f)
\ No newline at end of file
+        # Elimina i file solo quando nessun'altra immagine vi fa riferimento
+        release_image_files(f1, f2)
\ No newline at end of file
@@ -112,12 +112,14 @@ def delete_plant(user_id: str, plant_id: str) -> bool:
     res = plants_collection.delete_one({"_id": _oid(plant_id), "userId": _oid(user_id)})
     return res.deleted_count == 1
 
-def save_plant_image(user_id: str, plant_id: str, file_bytes: bytes) -> Optional[dict]:
+def save_plant_image(user_id: str, plant_id: str, file_bytes: bytes, health_result: Optional[dict] = None) -> Optional[dict]:
     plant = plants_collection.find_one({"_id": _oid(plant_id), "userId": _oid(user_id)})
     if not plant: return None
     saved = save_image_bytes(data=file_bytes, subdir=f"plants/{user_id}/{plant_id}")
-    plant_species = plant.get("species", "generic")
-    health_result = cnn_classifier.predict_health(file_bytes, plant_context=plant_species)
+    if health_result is None:
+        # Uso sincrono (script): inferenza in-process
+        plant_species = plant.get("species", "generic")
+        health_result = cnn_classifier.predict_health(file_bytes, plant_context=plant_species)
     update_payload = {
         "imageUrl": saved["url"],
         "imageThumbUrl": saved["thumbUrl"],
@@ -157,11 +159,11 @@ async def calculate_irrigation_for_plant(user_id: str, plant_id: str) -> Dict[st
 
         # 1. METEO REALE
         real_wx = {}
-        db_lat = plant.get("geoLat")
-        db_lon = plant.get("geoLng")
         db_city = plant.get("location") or plant.get("addressLocality")
 
         try:
+            # geoLat/geoLng dal DB, altrimenti geocoding (cache) salvato nella pianta
+            db_lat, db_lon = await weatherController.resolve_coordinates(plant)
             if db_lat and db_lon:
                 print(f"[AI] Uso GPS DB: {db_lat}, {db_lon}")
                 real_wx = await weatherController.get_weather_data(lat=db_lat, lon=db_lon)
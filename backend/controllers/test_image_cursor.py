@@ -0,0 +1,43 @@
+"""
+Test del cursore della paginazione keyset di ImageController (nessuna query a MongoDB).
+Esecuzione: python -m pytest controllers/test_image_cursor.py  (da backend/)
+"""
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+pytest.importorskip("fastapi")
+pytest.importorskip("pymongo")
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+from controllers.imageController import ImageController
+
+
+def test_cursor_round_trip():
+    doc = {"_id": ObjectId(), "uploadtimestamp": datetime(2026, 10, 19, 8, 30, 15, 123000)}
+    cursor = ImageController._encode_cursor(doc)
+    assert "=" not in cursor                       # base64 url-safe senza padding
+    ts, oid = ImageController._decode_cursor(cursor)
+    assert ts == doc["uploadtimestamp"]
+    assert oid == doc["_id"]
+
+
+def test_cursor_without_timestamp_uses_id_time():
+    oid = ObjectId.from_datetime(datetime(2024, 5, 1, 12, 0, 0))
+    ts, decoded = ImageController._decode_cursor(ImageController._encode_cursor({"_id": oid, "uploadtimestamp": None}))
+    assert ts == datetime(2024, 5, 1, 12, 0, 0)
+    assert decoded == oid
+
+
+@pytest.mark.parametrize("cursor", ["", "non-un-cursore", "eyJ0IjogMX0"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as exc:
+        ImageController._decode_cursor(cursor)
+    assert exc.value.status_code == 400
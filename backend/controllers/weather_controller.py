@@ -1,50 +1,114 @@
-import httpx
+import asyncio
+import os
+from utils.http_clients import get_async_client
+from utils.async_cache import AsyncTTLCache
+from utils.weather_grid import grid_key
+from utils.geocode_cache import geocode_cache
+from utils.geocoding import nominatim_slot
+from utils.open_meteo_forecast import forecast_bundles, has_forecast_data
+from database import db
+from bson import ObjectId
 from datetime import datetime, timedelta
 
+# Cache di get_weather_data per cella di griglia (WEATHER_GRID_PRECISION, come weather_service)
+WEATHER_DATA_TTL = int(os.getenv("WEATHER_DATA_TTL_SECONDS", "1800"))
+WEATHER_DATA_STALE = int(os.getenv("WEATHER_DATA_STALE_SECONDS", "3600"))   # stale-while-revalidate
+WEATHER_DATA_MAX_ENTRIES = int(os.getenv("WEATHER_DATA_MAX_ENTRIES", "5000"))
+# Chiamate upstream parallele: scadenza complessiva e attesa extra dopo le previsioni (s)
+WEATHER_FETCH_DEADLINE = float(os.getenv("WEATHER_FETCH_DEADLINE", "8"))
+WEATHER_SECONDARY_GRACE = float(os.getenv("WEATHER_SECONDARY_GRACE", "1.0"))
+# Meteo a blocchi per più coordinate: località per richiesta, richieste parallele, scadenza (s)
+WEATHER_BATCH_CHUNK = int(os.getenv("WEATHER_BATCH_CHUNK", "100"))
+WEATHER_BATCH_CONCURRENCY = int(os.getenv("WEATHER_BATCH_CONCURRENCY", "4"))
+WEATHER_BATCH_DEADLINE = float(os.getenv("WEATHER_BATCH_DEADLINE", "20"))
+
 class WeatherController:
     def __init__(self):
         self.base_url_forecast = "https://api.open-meteo.com/v1/forecast"
         self.base_url_history = "https://archive-api.open-meteo.com/v1/archive"
         self.base_url_geocoding = "https://geocoding-api.open-meteo.com/v1/search"
         self.base_url_reverse = "https://nominatim.openstreetmap.org/reverse"
+        self.cache = AsyncTTLCache(
+            "weather_data",
+            ttl=WEATHER_DATA_TTL,
+            stale_ttl=WEATHER_DATA_STALE,
+            max_entries=WEATHER_DATA_MAX_ENTRIES,
+            # Risposte senza previsioni (valori di default) non vanno in cache
+            cache_if=lambda v: bool(v) and "forecast" not in v.get("meta", {}).get("missing", []),
+        )
 
     async def get_coordinates(self, city: str):
-        print(f"   >>> [METEO CHECK] Sto chiedendo a Open-Meteo dove si trova: '{city}'...")
+        """Coordinate di una città (cache geocoding in memoria + Mongo). Ritorna (lat, lon) o (None, None)."""
         try:
-            params = {"name": city, "count": 1, "language": "it", "format": "json"}
-            async with httpx.AsyncClient() as client:
-                r = await client.get(self.base_url_geocoding, params=params)
-                data = r.json()
-                if "results" in data and len(data["results"]) > 0:
-                    lat = data["results"][0]["latitude"]
-                    lon = data["results"][0]["longitude"]
-                    name_found = data["results"][0]["name"]
-                    country = data["results"][0].get("country", "")
-                    print(f"   >>> [METEO SUCCESS] Trovato! {name_found} ({country}) -> Lat: {lat}, Lon: {lon}")
-                    return lat, lon
-                else:
-                    print(f"   >>> [METEO FAIL] Nessuna città trovata con nome: '{city}'")
+            return await geocode_cache.forward(city, lambda: self._geocode_upstream(city))
         except Exception as e:
             print(f"[GEOCODING ERROR] {e}")
         return None, None
 
+    async def _geocode_upstream(self, city: str):
+        print(f"   >>> [METEO CHECK] Sto chiedendo a Open-Meteo dove si trova: '{city}'...")
+        params = {"name": city, "count": 1, "language": "it", "format": "json"}
+        client = get_async_client("open_meteo")
+        r = await client.get(self.base_url_geocoding, params=params)
+        r.raise_for_status()
+        data = r.json()
+        if "results" in data and len(data["results"]) > 0:
+            lat = data["results"][0]["latitude"]
+            lon = data["results"][0]["longitude"]
+            name_found = data["results"][0]["name"]
+            country = data["results"][0].get("country", "")
+            print(f"   >>> [METEO SUCCESS] Trovato! {name_found} ({country}) -> Lat: {lat}, Lon: {lon}")
+            return lat, lon
+        print(f"   >>> [METEO FAIL] Nessuna città trovata con nome: '{city}'")
+        return None
+
     async def _get_city_name_from_coords(self, lat, lon):
         try:
-            headers = {'User-Agent': 'GreenfieldAdvisorApp/1.0'}
-            async with httpx.AsyncClient() as client:
-                resp = await client.get(
-                    f"{self.base_url_reverse}?lat={lat}&lon={lon}&format=json",
-                    headers=headers,
-                    timeout=5.0
-                )
-                if resp.status_code == 200:
-                    data = resp.json()
-                    addr = data.get("address", {})
-                    return addr.get("city") or addr.get("town") or addr.get("village") or addr.get("municipality")
+            return await geocode_cache.reverse(lat, lon, lambda: self._reverse_upstream(lat, lon))
         except Exception as e:
             print(f"[REVERSE GEO ERROR] {e}")
         return None
 
+    async def _reverse_upstream(self, lat, lon):
+        await nominatim_slot()
+        # User-Agent e timeout (5s) sono quelli del client condiviso "nominatim"
+        client = get_async_client("nominatim")
+        resp = await client.get(f"{self.base_url_reverse}?lat={lat}&lon={lon}&format=json")
+        resp.raise_for_status()
+        addr = resp.json().get("address", {})
+        return addr.get("city") or addr.get("town") or addr.get("village") or addr.get("municipality")
+
+    async def resolve_coordinates(self, doc: dict, collection=None):
+        """
+        Coordinate di una pianta (o di un documento con gli stessi campi):
+        geoLat/geoLng se presenti, altrimenti geocoding di location/addressLocality.
+        Le coordinate trovate vengono salvate una sola volta nel documento
+        (default: collection 'piante'), così le analisi successive non geocodificano più.
+        """
+        lat, lon = doc.get("geoLat"), doc.get("geoLng")
+        if lat and lon:
+            return lat, lon
+        city = doc.get("location") or doc.get("addressLocality")
+        if not city:
+            return None, None
+
+        lat, lon = await self.get_coordinates(city)
+        doc_id = doc.get("_id") or doc.get("id")
+        if isinstance(doc_id, str) and ObjectId.is_valid(doc_id):
+            doc_id = ObjectId(doc_id)
+        if lat and lon and doc_id is not None:
+            coll = collection if collection is not None else db["piante"]
+            try:
+                await asyncio.to_thread(
+                    coll.update_one,
+                    {"_id": doc_id, "$or": [{"geoLat": None}, {"geoLng": None}]},
+                    {"$set": {"geoLat": lat, "geoLng": lon, "geoSource": "geocoded"}},
+                )
+                doc["geoLat"], doc["geoLng"] = lat, lon
+            except Exception as e:
+                print(f"[WARN] salvataggio coordinate: {e}")
+        return lat, lon
+
     # FUNZIONE PER CALCOLARE LA LUCE
     def _estimate_lux(self, radiation_mj):
         """
@@ -62,7 +126,201 @@ class WeatherController:
         return round(lux, 2)
     # -----------------------------------------------------------
 
+    async def _fetch_history(self, lat, lon):
+        """Precipitazioni giornaliere degli ultimi 6 giorni (archivio Open-Meteo)."""
+        end_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        start_date = (datetime.now() - timedelta(days=6)).strftime("%Y-%m-%d")
+        r_hist = await get_async_client("open_meteo").get(self.base_url_history, params={
+            "latitude": lat, "longitude": lon,
+            "start_date": start_date, "end_date": end_date,
+            "daily": "precipitation_sum", "timezone": "auto"
+        })
+        return r_hist.json() if r_hist.status_code == 200 else None
+
+    async def _fetch_forecast(self, lat, lon):
+        """Previsioni giornaliere dalla richiesta /v1/forecast condivisa con meteo orario e suolo."""
+        return await forecast_bundles.get_async(lat, lon)
+
+    async def _gather_upstreams(self, calls: dict, deadline_s: float = None):
+        """
+        Esegue in parallelo le chiamate upstream indipendenti ({nome: coroutine}).
+        - scadenza complessiva 'deadline_s' (default WEATHER_FETCH_DEADLINE);
+        - appena arrivano le previsioni, le altre chiamate hanno al massimo
+          WEATHER_SECONDARY_GRACE secondi in più (storico o geocoder lenti non
+          ritardano la risposta);
+        - risultati parziali: le chiamate fallite o scadute mancano da 'results'.
+        Ritorna (results, meta) con la latenza di ogni upstream in ms.
+        """
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        latency = {}
+
+        async def timed(name, coro):
+            try:
+                return await coro
+            finally:
+                latency[name] = round((loop.time() - t0) * 1000, 1)
+
+        tasks = {name: asyncio.ensure_future(timed(name, coro)) for name, coro in calls.items()}
+        deadline_s = WEATHER_FETCH_DEADLINE if deadline_s is None else deadline_s
+        deadline = t0 + deadline_s
+
+        primary = tasks.get("forecast")
+        if primary is not None:
+            await asyncio.wait([primary], timeout=deadline_s)
+            deadline = min(deadline, loop.time() + WEATHER_SECONDARY_GRACE)
+        pending = [t for t in tasks.values() if not t.done()]
+        if pending:
+            await asyncio.wait(pending, timeout=max(0.0, deadline - loop.time()))
+
+        results, missing = {}, []
+        for name, task in tasks.items():
+            if not task.done():
+                task.cancel()
+                missing.append(name)
+                print(f"   >>> [METEO TIMEOUT] {name} oltre la scadenza, risposta parziale")
+            elif task.exception() is not None:
+                missing.append(name)
+                print(f"[WEATHER ERROR] {name}: {task.exception()}")
+            elif task.result() is None and name != "reverse":
+                missing.append(name)
+            else:
+                results[name] = task.result()
+
+        meta = {
+            "latency_ms": latency,
+            "total_ms": round((loop.time() - t0) * 1000, 1),
+            "missing": missing,
+            "partial": bool(missing),
+        }
+        return results, meta
+
     async def get_weather_data(self, lat: float = None, lon: float = None, city: str = None):
+        """
+        Meteo per coordinate (o città), servito dalla cache per cella di griglia.
+        Richieste concorrenti sulla stessa cella producono un solo fetch upstream;
+        i dati scaduti da poco sono serviti subito e aggiornati in background.
+        """
+        if lat and lon:
+            key = ("grid", grid_key(lat, lon), city or "")
+        elif city:
+            key = ("city", city.strip().lower())
+        else:
+            key = ("default",)
+
+        data = await self.cache.get_or_fetch(key, lambda: self._fetch_weather_data(lat, lon, city))
+        if data and lat and lon:
+            # La cella è condivisa: la posizione restituita è quella richiesta
+            data = {**data, "location": {**data["location"], "lat": lat, "lon": lon}}
+        return data
+
+    async def get_weather_batch(self, coords: list) -> list:
+        """
+        Meteo per N coordinate [(lat, lon), ...] (es. tutte le piante di un'azienda) con poche richieste:
+        - coordinate raggruppate per cella di griglia (come get_weather_data);
+        - celle già in cache servite senza chiamate upstream;
+        - le altre scaricate a blocchi di WEATHER_BATCH_CHUNK località per richiesta
+          (Open-Meteo accetta liste di latitudini/longitudini separate da virgola),
+          previsioni e storico in parallelo.
+        Ritorna una lista allineata a 'coords' ({} per coordinate mancanti o dati non disponibili).
+        Nessun reverse geocoding: il nome località è quello generico.
+        """
+        cells = {}          # cella -> coordinate rappresentative (prima occorrenza)
+        keys = []
+        for lat, lon in coords:
+            if not lat or not lon:
+                keys.append(None)
+                continue
+            key = grid_key(lat, lon)
+            keys.append(key)
+            cells.setdefault(key, (lat, lon))
+
+        data, missing = {}, []
+        for key in cells:
+            cached = self.cache.peek(("grid", key, "")) or self.cache.peek(("batch", key))
+            if cached:
+                data[key] = cached
+            else:
+                missing.append(key)
+
+        if missing:
+            sem = asyncio.Semaphore(WEATHER_BATCH_CONCURRENCY)
+
+            async def run(chunk):
+                async with sem:
+                    await self._fetch_weather_chunk(chunk, cells, data)
+
+            chunks = [missing[i:i + WEATHER_BATCH_CHUNK] for i in range(0, len(missing), WEATHER_BATCH_CHUNK)]
+            await asyncio.gather(*(run(c) for c in chunks))
+            print(f"   >>> [METEO BATCH] {len(coords)} coordinate, {len(cells)} celle, "
+                  f"{len(missing)} scaricate in {len(chunks)} blocchi")
+
+        out = []
+        for (lat, lon), key in zip(coords, keys):
+            value = data.get(key) if key else None
+            out.append({**value, "location": {**value["location"], "lat": lat, "lon": lon}} if value else {})
+        return out
+
+    async def refresh_cells(self, cells: dict) -> int:
+        """
+        Aggiorna in cache il meteo di un blocco di celle {cella: (lat, lon)} (prefetch),
+        con le stesse chiavi di get_weather_data: le analisi successive sono cache hit.
+        Il nome località viene solo dalla cache di reverse geocoding (nessuna raffica di
+        richieste a Nominatim): in assenza, "Posizione Rilevata". Ritorna le celle aggiornate.
+        """
+        names = {}
+        for key, (lat, lon) in cells.items():
+            try:
+                names[key] = await geocode_cache.reverse_cached(lat, lon) or "Posizione Rilevata"
+            except Exception as e:
+                print(f"[REVERSE GEO ERROR] {e}")
+                names[key] = "Posizione Rilevata"
+        data = {}
+        await self._fetch_weather_chunk(
+            list(cells), cells, data, cache_key=lambda k: ("grid", k, ""), names=names
+        )
+        return len(data)
+
+    def ttl_left(self, lat: float, lon: float) -> float:
+        """Secondi di validità rimasti per la cella di (lat, lon) in cache (0 = da scaricare)."""
+        return self.cache.ttl_left(("grid", grid_key(lat, lon), ""))
+
+    async def _fetch_weather_chunk(self, chunk: list, cells: dict, data: dict, cache_key=None, names: dict = None):
+        """
+        Previsioni + storico per un blocco di celle con una richiesta multi-località per tipo.
+        Risultati in 'data' e in cache con chiave cache_key(cella) (default: ("batch", cella)).
+        """
+        points = [cells[k] for k in chunk]
+        lats = ",".join(str(p[0]) for p in points)
+        lons = ",".join(str(p[1]) for p in points)
+        results, meta = await self._gather_upstreams(
+            {"forecast": forecast_bundles.get_many_async(points), "archive": self._fetch_history(lats, lons)},
+            deadline_s=WEATHER_BATCH_DEADLINE,
+        )
+        forecasts = results.get("forecast")
+        if not forecasts:
+            return
+        history = results.get("archive") or []
+        # Con una sola località Open-Meteo risponde con un oggetto, con più località con una lista
+        if isinstance(history, dict):
+            history = [history]
+
+        meta = {**meta, "batch": len(chunk)}
+        for i, key in enumerate(chunk[:len(forecasts)]):
+            if not has_forecast_data(forecasts[i]):
+                continue  # località senza previsioni: niente valori di default in cache
+            lat, lon = cells[key]
+            hist = history[i] if i < len(history) else {}
+            try:
+                name = (names or {}).get(key) or "Posizione Rilevata"
+                value = self._build_weather(lat, lon, name, hist or {}, forecasts[i], meta)
+            except Exception as e:
+                print(f"[WEATHER ERROR] batch {key}: {e}")
+                continue
+            self.cache.put(cache_key(key) if cache_key else ("batch", key), value)
+            data[key] = value
+
+    async def _fetch_weather_data(self, lat: float = None, lon: float = None, city: str = None):
         print(f"\n--- [METEO REQUEST] Inizio richiesta meteo ---")
         
         # 1. Risoluzione Coordinate
@@ -74,113 +332,109 @@ class WeatherController:
             print("   >>> [METEO WARNING] Nè coordinate nè città valide. Uso DEFAULT (Bisceglie).")
             lat, lon = 41.24, 16.50 
 
-        # 2. Risoluzione Nome Città
+        # 2-4. Nome città (reverse geocoding), storico e previsioni in parallelo
         location_name = city if city else "Posizione Rilevata"
-        if lat and lon and not city:
-            detected = await self._get_city_name_from_coords(lat, lon)
-            if detected:
-                location_name = detected
-                print(f"   >>> [GEO] Coordinate {lat},{lon} corrispondono a: {location_name}")
+        calls = {
+            "forecast": self._fetch_forecast(lat, lon),
+            "archive": self._fetch_history(lat, lon),
+        }
+        if not city:
+            calls["reverse"] = self._get_city_name_from_coords(lat, lon)
+        results, meta = await self._gather_upstreams(calls)
+        if "forecast" not in results:
+            # Senza previsioni: valori di default come prima (stesse chiavi), non messi in cache
+            print("   >>> [METEO WARNING] Previsioni non disponibili, uso i valori di default.")
 
-        try:
-            async with httpx.AsyncClient() as client:
-                # 3. STORICO
-                end_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-                start_date = (datetime.now() - timedelta(days=6)).strftime("%Y-%m-%d")
-                
-                r_hist = await client.get(self.base_url_history, params={
-                    "latitude": lat, "longitude": lon,
-                    "start_date": start_date, "end_date": end_date,
-                    "daily": "precipitation_sum", "timezone": "auto"
-                })
-                hist_data = r_hist.json() if r_hist.status_code == 200 else {}
-
-                # 4. PREVISIONI
-                r_fore = await client.get(self.base_url_forecast, params={
-                    "latitude": lat, "longitude": lon,
-                    "daily": "temperature_2m_max,relative_humidity_2m_max,precipitation_sum,et0_fao_evapotranspiration,shortwave_radiation_sum,wind_speed_10m_max",
-                    "timezone": "auto"
-                })
-                fore_data = r_fore.json() if r_fore.status_code == 200 else {}
-
-                # 5. Parsing Dati
-                rain_trend = []
-                seen_dates = set()
-
-                if "daily" in hist_data:
-                    dates = hist_data["daily"].get("time", [])
-                    rains = hist_data["daily"].get("precipitation_sum", [])
-                    for d, r in zip(dates, rains):
-                        if d not in seen_dates:
-                            rain_trend.append({"date": d, "rain": float(r) if r is not None else 0.0})
-                            seen_dates.add(d)
-
-                current_temp = 15.0
-                current_hum = 60.0
-                current_et0 = 2.0
-                current_rad_mj = 0.0 
-                current_wind = 10.0
-                rain_next_24h = 0.0
-                
-                if "daily" in fore_data:
-                    daily = fore_data["daily"]
-                    dates = daily.get("time", [])
-                    rains = daily.get("precipitation_sum", [])
-                    temps = daily.get("temperature_2m_max", [])
-                    hums = daily.get("relative_humidity_2m_max", [])
-                    et0s = daily.get("et0_fao_evapotranspiration", [])
-                    rads = daily.get("shortwave_radiation_sum", []) # <--- MJ/m2
-                    winds = daily.get("wind_speed_10m_max", [])
-
-                    if len(temps) > 0:
-                        current_temp = temps[0]
-                        current_hum = hums[0]
-                        current_et0 = et0s[0]
-                        # Recupero Radiazione MJ
-                        current_rad_mj = rads[0] if rads and rads[0] is not None else 0.0
-                        current_wind = winds[0] if winds and winds[0] is not None else 10.0
-                        rain_next_24h = rains[0] if rains and rains[0] is not None else 0.0
-
-                    for i, d in enumerate(dates):
-                        if d not in seen_dates:
-                            r = rains[i]
-                            rain_trend.append({"date": d, "rain": float(r) if r is not None else 0.0})
-                            seen_dates.add(d)
-
-                rain_trend.sort(key=lambda x: x['date'])
-
-                # --- CALCOLO LUX (FIX per il grafico) ---
-                lux_val = self._estimate_lux(current_rad_mj)
-                klux_val = round(lux_val / 1000, 1) 
-                # ----------------------------------------
-
-                print(f"   >>> [METEO DATA] Scaricati dati per Lat:{lat}, Lon:{lon}. Temp: {current_temp}°C, Lux: {lux_val}")
-
-                return {
-                    "location": {
-                        "name": location_name,
-                        "lat": lat,
-                        "lon": lon
-                    },
-                    "temp": current_temp,
-                    "humidity": current_hum,
-                    "et0": current_et0,
-                    "rainNext24h": rain_next_24h,
-                    "solar_rad": round(current_rad_mj, 1), 
-                    "wind": current_wind,
-                    "soil_moisture": 50.0,
-                    
-                    
-                    "light": lux_val,  
-                    "lux": lux_val,     
-                    "klux": klux_val,   
-                    
-
-                    "rain_trend": rain_trend
-                }
+        detected = results.get("reverse")
+        if detected:
+            location_name = detected
+            print(f"   >>> [GEO] Coordinate {lat},{lon} corrispondono a: {location_name}")
 
+        try:
+            data = self._build_weather(
+                lat, lon, location_name, results.get("archive") or {}, results.get("forecast") or {}, meta
+            )
+            print(f"   >>> [METEO DATA] Scaricati dati per Lat:{lat}, Lon:{lon}. Temp: {data['temp']}°C, Lux: {data['lux']}")
+            return data
         except Exception as e:
             print(f"[WEATHER ERROR] {e}")
             return {}
 
+    def _build_weather(self, lat, lon, location_name, hist_data: dict, fore_data: dict, meta: dict) -> dict:
+        """Risposta di get_weather_data a partire dai JSON Open-Meteo (storico + previsioni)."""
+        # 5. Parsing Dati
+        rain_trend = []
+        seen_dates = set()
+
+        if "daily" in hist_data:
+            dates = hist_data["daily"].get("time", [])
+            rains = hist_data["daily"].get("precipitation_sum", [])
+            for d, r in zip(dates, rains):
+                if d not in seen_dates:
+                    rain_trend.append({"date": d, "rain": float(r) if r is not None else 0.0})
+                    seen_dates.add(d)
+
+        current_temp = 15.0
+        current_hum = 60.0
+        current_et0 = 2.0
+        current_rad_mj = 0.0 
+        current_wind = 10.0
+        rain_next_24h = 0.0
+        
+        if "daily" in fore_data:
+            daily = fore_data["daily"]
+            dates = daily.get("time", [])
+            rains = daily.get("precipitation_sum", [])
+            temps = daily.get("temperature_2m_max", [])
+            hums = daily.get("relative_humidity_2m_max", [])
+            et0s = daily.get("et0_fao_evapotranspiration", [])
+            rads = daily.get("shortwave_radiation_sum", []) # <--- MJ/m2
+            winds = daily.get("wind_speed_10m_max", [])
+
+            if len(temps) > 0:
+                current_temp = temps[0]
+                current_hum = hums[0]
+                current_et0 = et0s[0]
+                # Recupero Radiazione MJ
+                current_rad_mj = rads[0] if rads and rads[0] is not None else 0.0
+                current_wind = winds[0] if winds and winds[0] is not None else 10.0
+                rain_next_24h = rains[0] if rains and rains[0] is not None else 0.0
+
+            for i, d in enumerate(dates):
+                if d not in seen_dates:
+                    r = rains[i]
+                    rain_trend.append({"date": d, "rain": float(r) if r is not None else 0.0})
+                    seen_dates.add(d)
+
+        rain_trend.sort(key=lambda x: x['date'])
+
+        # --- CALCOLO LUX (FIX per il grafico) ---
+        lux_val = self._estimate_lux(current_rad_mj)
+        klux_val = round(lux_val / 1000, 1) 
+        # ----------------------------------------
+
+        return {
+            "location": {
+                "name": location_name,
+                "lat": lat,
+                "lon": lon
+            },
+            "temp": current_temp,
+            "humidity": current_hum,
+            "et0": current_et0,
+            "rainNext24h": rain_next_24h,
+            "solar_rad": round(current_rad_mj, 1), 
+            "wind": current_wind,
+            "soil_moisture": 50.0,
+            
+            
+            "light": lux_val,  
+            "lux": lux_val,     
+            "klux": klux_val,   
+            
+
+            "rain_trend": rain_trend,
+            "meta": meta
+        }
+
 weatherController = WeatherController()
\ No newline at end of file
@@ -1,5 +1,9 @@
+import hashlib
+import json
 import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 from datetime import datetime
 from PIL import Image
@@ -13,6 +17,7 @@ sys.path.append(str(Path(__file__).parent.parent))
 from config import settings
 from database import db
 from utils.images import save_image_bytes
+from pymongo.errors import BulkWriteError, PyMongoError
 
 
 # Collection MongoDB 
@@ -44,6 +49,57 @@ def extract_metadata_from_path(filepath: Path) -> dict:
     return metadata
 
 
+def _image_metadata(image_data: bytes, filename: str) -> dict:
+    """Metadati dell'immagine (solo header: PIL non decodifica i pixel)."""
+    try:
+        img = Image.open(BytesIO(image_data))
+        image_metadata = {
+            "filesizebytes": len(image_data),  
+            "filesizemb": round(len(image_data) / (1024 * 1024), 2),  
+            "imagewidth": img.width,  
+            "imageheight": img.height,  
+            "format": img.format or "UNKNOWN",
+            "mode": img.mode,
+            "originalfilename": filename  
+        }
+        img.close()
+        return image_metadata
+    except Exception as e:
+        return {
+            "filesizebytes": len(image_data),
+            "filesizemb": round(len(image_data) / (1024 * 1024), 2),
+            "imagewidth": 0,
+            "imageheight": 0,
+            "format": "UNKNOWN",
+            "mode": "UNKNOWN",
+            "originalfilename": filename,
+            "error": str(e)
+        }
+
+
+def _build_image_doc(image_path: Path, saved_paths: dict, path_metadata: dict, image_metadata: dict) -> dict:
+    return {
+        "filename": os.path.basename(saved_paths["abs"]),
+        "originalfilename": image_path.name,  
+        "filepathfull": saved_paths["abs"],  
+        "filepaththumb": saved_paths["absThumb"],  
+        "urlfull": saved_paths["url"],  
+        "urlthumb": saved_paths["thumbUrl"],  
+        "relpathfull": saved_paths["rel"],  
+        "relpaththumb": saved_paths["relThumb"],  
+        "planttype": path_metadata["plant_type"],  
+        "location": path_metadata["location"],
+        "sensorid": None,  
+        "uploadtimestamp": datetime.utcnow(),  
+        "processed": False,
+        "cnnresults": None,  
+        "notes": path_metadata["notes"],
+        "tags": [],
+        "metadata": image_metadata,
+        "importsource": str(image_path)  
+    }
+
+
 def import_image(image_path: Path) -> dict:
     """
     Importa una singola immagine:
@@ -68,31 +124,11 @@ def import_image(image_path: Path) -> dict:
     print(f"   ✓ Path metadata: plant_type={path_metadata['plant_type']}, location={path_metadata['location']}")
     
     # STEP 3: Estrai metadati immagine
-    try:
-        img = Image.open(BytesIO(image_data))
-        image_metadata = {
-            "filesizebytes": len(image_data),  
-            "filesizemb": round(len(image_data) / (1024 * 1024), 2),  
-            "imagewidth": img.width,  
-            "imageheight": img.height,  
-            "format": img.format or "UNKNOWN",
-            "mode": img.mode,
-            "originalfilename": image_path.name  
-        }
-        img.close()
-        print(f"   ✓ Immagine: {img.width}x{img.height}, formato: {image_metadata['format']}")
-    except Exception as e:
-        print(f"Impossibile estrarre metadati immagine: {e}")
-        image_metadata = {
-            "filesizebytes": len(image_data),
-            "filesizemb": round(len(image_data) / (1024 * 1024), 2),
-            "imagewidth": 0,
-            "imageheight": 0,
-            "format": "UNKNOWN",
-            "mode": "UNKNOWN",
-            "originalfilename": image_path.name,
-            "error": str(e)
-        }
+    image_metadata = _image_metadata(image_data, image_path.name)
+    if "error" not in image_metadata:
+        print(f"   ✓ Immagine: {image_metadata['imagewidth']}x{image_metadata['imageheight']}, formato: {image_metadata['format']}")
+    else:
+        print(f"Impossibile estrarre metadati immagine: {image_metadata['error']}")
     
     # STEP 4: Salva immagine (full + thumbnail)
     date_subdir = datetime.utcnow().strftime("%Y%m%d")
@@ -115,26 +151,7 @@ def import_image(image_path: Path) -> dict:
         return None
     
     # STEP 5: Crea documento MongoDB 
-    image_doc = {
-        "filename": os.path.basename(saved_paths["abs"]),
-        "originalfilename": image_path.name,  
-        "filepathfull": saved_paths["abs"],  
-        "filepaththumb": saved_paths["absThumb"],  
-        "urlfull": saved_paths["url"],  
-        "urlthumb": saved_paths["thumbUrl"],  
-        "relpathfull": saved_paths["rel"],  
-        "relpaththumb": saved_paths["relThumb"],  
-        "planttype": path_metadata["plant_type"],  
-        "location": path_metadata["location"],
-        "sensorid": None,  
-        "uploadtimestamp": datetime.utcnow(),  
-        "processed": False,
-        "cnnresults": None,  
-        "notes": path_metadata["notes"],
-        "tags": [],
-        "metadata": image_metadata,
-        "importsource": str(image_path)  
-    }
+    image_doc = _build_image_doc(image_path, saved_paths, path_metadata, image_metadata)
     
     # STEP 6: Salva su MongoDB
     try:
@@ -236,6 +253,188 @@ def import_images_from_directory(source_dir: str, extensions: list = None):
     print(f"{'='*60}\n")
 
 
+# --- IMPORT PARALLELO ---
+# Decode + encode WEBP (la parte costosa) girano in un pool di processi; il processo
+# principale inserisce i documenti a blocchi con insert_many e annota i file completati
+# in un manifest JSONL, così un'importazione interrotta riprende da dove si era fermata.
+
+IMPORT_BATCH_SIZE = 200          # documenti per insert_many
+IMPORT_REPORT_EVERY = 500        # file tra due report di avanzamento
+# Fuori da UPLOAD_DIR: la cartella degli upload è servita pubblicamente da /uploads
+IMPORT_MANIFEST_DIR = os.getenv("IMPORT_MANIFEST_DIR", str(Path(__file__).resolve().parent / ".cache" / "import_manifests"))
+
+
+def _manifest_path(source_path: Path) -> Path:
+    key = hashlib.sha1(str(source_path.resolve()).encode()).hexdigest()[:12]
+    folder = Path(IMPORT_MANIFEST_DIR)
+    folder.mkdir(parents=True, exist_ok=True)
+    return folder / f"{key}.jsonl"
+
+
+def _load_manifest(manifest: Path) -> set:
+    done = set()
+    if manifest.exists():
+        with open(manifest) as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["path"])
+                except (ValueError, KeyError):
+                    continue  # riga troncata da un'interruzione
+    return done
+
+
+def _prepare_image(image_path_str: str, subdir: str) -> dict:
+    """
+    Eseguita nei processi worker: lettura, metadati, salvataggio WEBP (full + thumbnail).
+    Ritorna {"path", "doc"} oppure {"path", "error"}; l'inserimento su MongoDB è nel processo principale.
+    """
+    image_path = Path(image_path_str)
+    try:
+        with open(image_path, 'rb') as f:
+            image_data = f.read()
+        image_metadata = _image_metadata(image_data, image_path.name)
+        saved_paths = save_image_bytes(data=image_data, subdir=subdir)
+    except Exception as e:
+        return {"path": image_path_str, "error": str(e)}
+    doc = _build_image_doc(image_path, saved_paths, extract_metadata_from_path(image_path), image_metadata)
+    return {"path": image_path_str, "doc": doc}
+
+
+def _flush_docs(pending: list, manifest_file) -> tuple:
+    """
+    insert_many non ordinato; i file dei documenti non inseriti vengono rimossi.
+    Errori MongoDB diversi da BulkWriteError (es. AutoReconnect, NetworkTimeout) non
+    interrompono l'importazione: il blocco è considerato fallito, tranne i documenti
+    che risultano comunque inseriti.
+    """
+    if not pending:
+        return 0, 0
+    docs = [p["doc"] for p in pending]
+    failed = set()
+    try:
+        images_collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        failed = {err["index"] for err in e.details.get("writeErrors", [])}
+        print(f"   ✗ insert_many: {len(failed)} documenti non inseriti")
+    except PyMongoError as e:
+        failed = set(range(len(docs)))
+        try:
+            # insert_many assegna gli _id prima dell'invio: alcuni documenti possono essere arrivati
+            ids = [d["_id"] for d in docs if "_id" in d]
+            inserted = {d["_id"] for d in images_collection.find({"_id": {"$in": ids}}, {"_id": 1})}
+            failed = {i for i, d in enumerate(docs) if d.get("_id") not in inserted}
+        except PyMongoError:
+            pass
+        print(f"   ✗ insert_many ({type(e).__name__}): {len(failed)} documenti non inseriti")
+
+    for idx, item in enumerate(pending):
+        if idx in failed:
+            for key in ("filepathfull", "filepaththumb"):
+                try:
+                    os.remove(item["doc"][key])
+                except OSError:
+                    pass
+            continue
+        manifest_file.write(json.dumps({"path": item["path"], "id": str(item["doc"]["_id"])}) + "\n")
+    manifest_file.flush()
+    return len(pending) - len(failed), len(failed)
+
+
+def import_images_parallel(source_dir: str, workers: int = None, batch_size: int = IMPORT_BATCH_SIZE,
+                           extensions: list = None, manifest: str = None) -> dict:
+    """
+    Importazione massiva in parallelo, riprendibile.
+
+    Args:
+        source_dir: cartella sorgente (ricorsiva)
+        workers: processi per decode/encode (default: numero di CPU)
+        batch_size: documenti per insert_many
+        manifest: file JSONL dei file completati (default: .cache/import_manifests/<hash cartella>.jsonl)
+    """
+    exts = {e.lower() for e in (extensions or ['.jpg', '.jpeg', '.png', '.webp'])}
+    source_path = Path(source_dir)
+    if not source_path.is_dir():
+        print(f"\n ERRORE: Cartella non trovata o non valida: {source_dir}")
+        return {}
+
+    manifest_path = Path(manifest) if manifest else _manifest_path(source_path)
+    done = _load_manifest(manifest_path)
+    files = sorted(str(p) for p in source_path.rglob("*") if p.suffix.lower() in exts)
+    todo = [f for f in files if f not in done]
+    workers = workers or os.cpu_count() or 1
+
+    print(f"\n{'='*60}")
+    print(f" Cartella sorgente: {source_dir}")
+    print(f"  Immagini trovate: {len(files)} | già importate: {len(files) - len(todo)} | da importare: {len(todo)}")
+    print(f"  Worker: {workers} | insert_many da {batch_size} | manifest: {manifest_path}")
+    print(f"{'='*60}\n")
+    if not todo:
+        return {"imported": 0, "errors": 0, "skipped": len(files)}
+
+    subdir = f"plant_images/{datetime.utcnow().strftime('%Y%m%d')}"
+    stats = {"imported": 0, "errors": 0, "skipped": len(files) - len(todo)}
+    pending = []
+    t0 = time.perf_counter()
+    last_report = 0
+
+    with open(manifest_path, "a") as manifest_file, ProcessPoolExecutor(max_workers=workers) as pool:
+        queue = iter(todo)
+        inflight = set()
+        max_inflight = workers * 4  # finestra limitata: memoria costante anche con 50k file
+
+        def submit_next():
+            for path in queue:
+                inflight.add(pool.submit(_prepare_image, path, subdir))
+                if len(inflight) >= max_inflight:
+                    break
+
+        submit_next()
+        while inflight:
+            completed, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            inflight.difference_update(completed)
+            for fut in completed:
+                try:
+                    res = fut.result()
+                except Exception as e:
+                    res = {"path": None, "error": str(e)}
+                if "error" in res:
+                    stats["errors"] += 1
+                    print(f"   ✗ {res['path']}: {res['error']}")
+                else:
+                    pending.append(res)
+            submit_next()
+
+            if len(pending) >= batch_size:
+                ok, ko = _flush_docs(pending, manifest_file)
+                stats["imported"] += ok
+                stats["errors"] += ko
+                pending = []
+
+            seen = stats["imported"] + stats["errors"] + len(pending)
+            if seen - last_report >= IMPORT_REPORT_EVERY:
+                last_report = seen
+                rate = seen / (time.perf_counter() - t0)
+                eta = (len(todo) - seen) / rate if rate else 0
+                print(f"   [{seen}/{len(todo)}] {rate:.1f} file/s | ETA {eta / 60:.1f} min")
+
+        ok, ko = _flush_docs(pending, manifest_file)
+        stats["imported"] += ok
+        stats["errors"] += ko
+
+    elapsed = time.perf_counter() - t0
+    stats["elapsed_s"] = round(elapsed, 1)
+    stats["files_per_sec"] = round((stats["imported"] + stats["errors"]) / elapsed, 1) if elapsed else None
+
+    print(f"\n{'='*60}")
+    print(f"{'IMPORTAZIONE COMPLETATA' if stats['errors'] == 0 else 'IMPORTAZIONE COMPLETATA CON ERRORI'}")
+    print(f"{'='*60}")
+    print(f"   ✓ Successi: {stats['imported']}")
+    print(f"   ✗ Errori: {stats['errors']}")
+    print(f"   Tempo: {stats['elapsed_s']}s | Throughput: {stats['files_per_sec']} file/s")
+    print(f"{'='*60}\n")
+    return stats
+
+
 def clear_database():
     """
     ATTENZIONE: Elimina tutti i record di immagini da MongoDB
@@ -253,6 +452,27 @@ def clear_database():
 
 
 if __name__ == "__main__":
+    # Modalità non interattiva: python import_images.py --parallel /path/cartella [--workers N]
+    #                          python import_images.py --backfill-timestamps
+    if len(sys.argv) > 1:
+        import argparse
+        parser = argparse.ArgumentParser(description="Import massivo immagini")
+        parser.add_argument("--parallel", metavar="DIR", help="Cartella da importare in parallelo")
+        parser.add_argument("--workers", type=int, default=None)
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument("--manifest", default=None, help="File JSONL dei file già importati")
+        parser.add_argument("--backfill-timestamps", action="store_true",
+                            help="Migrazione: uploadtimestamp di tipo data sulle immagini legacy")
+        args = parser.parse_args()
+        if not args.parallel and not args.backfill_timestamps:
+            parser.error("specificare --parallel DIR oppure --backfill-timestamps")
+        if args.backfill_timestamps:
+            from controllers.imageController import ImageController
+            print(f"Immagini aggiornate: {ImageController(images_collection).backfill_upload_timestamps()}")
+        if args.parallel:
+            import_images_parallel(args.parallel, args.workers, args.batch_size, manifest=args.manifest)
+        sys.exit(0)
+
     print("""
 ╔═══════════════════════════════════════════════════════════╗
 ║          IMPORT IMMAGINI - DATABASE LOADER                ║
@@ -267,8 +487,9 @@ if __name__ == "__main__":
     print("2. Importa da percorso personalizzato")
     print("3. Pulisci database (ELIMINA TUTTO)")
     print("4. Esci")
+    print("5. Importa in parallelo (process pool, riprendibile)")
     
-    choice = input("\n👉 Scegli opzione (1-4): ").strip()
+    choice = input("\n👉 Scegli opzione (1-5): ").strip()
     
     if choice == "1":
         # Verifica che il path esista
@@ -293,5 +514,9 @@ if __name__ == "__main__":
     elif choice == "4":
         print("Uscita...")
     
+    elif choice == "5":
+        source_dir = input(f"\n Percorso della cartella (invio = {DEFAULT_PATH}): ").strip() or DEFAULT_PATH
+        import_images_parallel(source_dir)
+    
     else:
         print("Opzione non valida!")
@@ -1,4 +1,7 @@
 # Carica .env all'avvio ---
+import time
+_STARTUP_T0 = time.perf_counter()
+
 from dotenv import load_dotenv
 import os
 
@@ -30,7 +33,20 @@ from routers import imageRouter
 from routers import aiRouter 
 from routers import userRouter, plantsRouter
 from routers import authRouter
-
+from routers import mediaRouter
+from ai.cnn_service import CNN_ENABLED, CNN_WARMUP
+from ai.inference_pool import inference_pool
+from ai.prediction_cache import prediction_cache
+from ai.embedding_store import embedding_store
+from ai.batch_processor import get_batch_processor, CNN_BATCH_ENABLED
+from utils.images import shutdown_image_pool
+from utils.uploads import limit_request_size
+from utils.image_store import ensure_image_store_indexes
+from utils.http_clients import http_clients
+from utils.geocode_cache import geocode_cache
+from utils.weather_prefetch import weather_prefetcher, WEATHER_PREFETCH_ENABLED
+
+import asyncio
 import logging
 
 # Configurazione logging dettagliato
@@ -63,6 +79,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Limite dimensione richieste (413 prima di leggere il corpo degli upload)
+app.middleware("http")(limit_request_size)
+
 # Static Files (per servire le immagini caricate)
 app.mount("/uploads", StaticFiles(directory=str(uploads_dir)), name="uploads")
 
@@ -77,6 +96,7 @@ app.include_router(imageRouter.router)
 app.include_router(pipelineRouter.router)
 app.include_router(aiRouter.router)
 app.include_router(authRouter.router, prefix="/api/auth", tags=["Authentication"])
+app.include_router(mediaRouter.router)
 
 @app.get("/health")
 def health():
@@ -116,3 +136,75 @@ def init_indexes():
         ensure_interventions_indexes()
     except Exception as e:
         print(f"[WARN] interventions indexes: {e}")
+
+    # Indici immagini (lista paginata) + storage per contenuto (riferimenti)
+    imageRouter.controller.ensure_indexes()
+    ensure_image_store_indexes()
+
+    # Indice TTL cache predizioni CNN (solo se il tier Mongo è attivo) + archivio embedding
+    prediction_cache.ensure_indexes()
+    embedding_store.ensure_indexes()
+
+    # Indice TTL cache geocoding
+    geocode_cache.ensure_indexes()
+
+
+# Task in background avviati allo startup: riferimento tenuto qui (il loop ne tiene
+# solo uno debole) e cancellati allo shutdown
+_background_tasks = {}
+
+
+async def _cancel_background_task(name: str):
+    task = _background_tasks.pop(name, None)
+    if task is None or task.done():
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        print(f"[WARN] background task {name}: {e}")
+
+
+@app.on_event("startup")
+async def start_http_clients():
+    # Client HTTP condivisi (keep-alive) per meteo, geocoding, NASA, Trefle, LLM
+    http_clients.start()
+
+    # Aggiornamento anticipato delle cache meteo per le celle delle piante (job opzionale)
+    if WEATHER_PREFETCH_ENABLED:
+        _background_tasks["weather_prefetch"] = asyncio.create_task(weather_prefetcher.run_forever())
+
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await _cancel_background_task("weather_prefetch")
+    await http_clients.aclose()
+
+
+@app.on_event("startup")
+async def warmup_cnn():
+    # Il modello CNN viene caricato in background: l'app serve subito le
+    # richieste CRUD, /api/ai/ready diventa 200 a caricamento completato.
+    logger = logging.getLogger("ai")
+    logger.info(
+        f"Startup completato in {time.perf_counter() - _STARTUP_T0:.2f}s "
+        f"(CNN {'abilitata' if CNN_ENABLED else 'disabilitata'})"
+    )
+    if CNN_ENABLED and CNN_WARMUP:
+        _background_tasks["cnn_warmup"] = asyncio.create_task(inference_pool.warmup())
+
+    # Backlog immagini non processate (immagini_piante): job in background opzionale
+    if CNN_ENABLED and CNN_BATCH_ENABLED:
+        processor = get_batch_processor()
+        processor.ensure_indexes()
+        _background_tasks["cnn_batch"] = asyncio.create_task(processor.run_forever())
+
+
+@app.on_event("shutdown")
+async def shutdown_cnn_pool():
+    await _cancel_background_task("cnn_warmup")
+    await _cancel_background_task("cnn_batch")
+    inference_pool.shutdown()
+    shutdown_image_pool()
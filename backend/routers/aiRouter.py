@@ -1,21 +1,83 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+import asyncio
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
+from fastapi.responses import JSONResponse
 from typing import Optional
+from ai.inference_pool import inference_pool, InferenceBusyError
 from ai.cnn_service import cnn_classifier
+from ai.embedding_store import embedding_store, REF_PLANT, REF_IMAGE
+from utils.uploads import read_upload
+from config import IMAGE_UPLOAD_MAX_MB
 
 router = APIRouter(prefix="/api/ai", tags=["ai"])
 
 @router.post("/analyze-health", summary="Analisi Salute Pianta")
 async def analyze_health(
     file: UploadFile = File(...),
-    plant_type: Optional[str] = Form(None) # Riceve la specie dal frontend
+    plant_type: Optional[str] = Form(None), # Riceve la specie dal frontend
+    top_k: int = Form(0, ge=0, le=10)       # Opzionale: le k classi più probabili
 ):
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File non valido")
+    # Lettura a blocchi con limite IMAGE_UPLOAD_MAX_MB e sha256 incrementale (chiave cache CNN)
+    upload = await read_upload(file, max_mb=IMAGE_UPLOAD_MAX_MB)
     
     try:
-        image_data = await file.read()
-        # Passa la specie al servizio per il filtro
-        result = cnn_classifier.predict_health(image_data, plant_context=plant_type)
+        # Passa la specie al servizio per il filtro (inferenza nel pool, fuori dall'event loop)
+        result = await inference_pool.predict_health(
+            upload.data, plant_context=plant_type, top_k=top_k, digest=upload.sha256
+        )
         return {"status": "success", "analysis": result}
+    except InferenceBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/ready", summary="Readiness del modello CNN")
+def cnn_ready():
+    """
+    Ritorna 200 quando il modello CNN è caricato, 503 finché è in caricamento
+    (warm-up in background) o non disponibile. Include lo stato del pool di inferenza.
+    """
+    status = inference_pool.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
+@router.get("/similar", summary="Casi simili (da immagine già analizzata)")
+async def similar_cases(
+    ref_type: str = Query(..., pattern=f"^({REF_PLANT}|{REF_IMAGE})$"),
+    ref_id: str = Query(...),
+    k: int = Query(10, ge=1, le=100),
+    only: Optional[str] = Query(None, pattern=f"^({REF_PLANT}|{REF_IMAGE})$"),
+):
+    """
+    Nearest-neighbour sugli embedding CNN salvati: ritorna le k immagini più simili
+    (similarità coseno) a una pianta ('plant') o a un documento di immagini_piante ('immagine').
+    """
+    version = cnn_classifier.model_version()
+    vector = await asyncio.to_thread(embedding_store.get_vector, ref_type, ref_id, version)
+    if vector is None:
+        raise HTTPException(status_code=404, detail="Embedding non trovato per questa immagine")
+    results = await asyncio.to_thread(
+        embedding_store.search, vector, version, k, embedding_store.make_id(ref_type, ref_id), only
+    )
+    return {"status": "success", "results": results}
+
+
+@router.post("/similar", summary="Casi simili (da nuova immagine)")
+async def similar_cases_upload(
+    file: UploadFile = File(...),
+    plant_type: Optional[str] = Form(None),
+    k: int = Form(10, ge=1, le=100),
+):
+    """Analizza l'immagine caricata e ritorna diagnosi + k casi passati più simili."""
+    upload = await read_upload(file, max_mb=IMAGE_UPLOAD_MAX_MB)
+    try:
+        result = await inference_pool.predict_health(
+            upload.data, plant_context=plant_type, digest=upload.sha256, return_embedding=True
+        )
+    except InferenceBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    embedding = result.pop("embedding", None)
+    if embedding is None:
+        raise HTTPException(status_code=503, detail="Embedding non disponibile per il modello in uso")
+    results = await asyncio.to_thread(embedding_store.search, embedding, cnn_classifier.model_version(), k)
+    return {"status": "success", "analysis": result, "results": results}
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
+import asyncio
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Query
 from fastapi.responses import FileResponse
 from pathlib import Path
 from typing import Optional
 from database import db
 from controllers.imageController import ImageController
 from config import settings
+from ai.batch_processor import get_batch_processor, BatchAlreadyRunningError
+from utils.image_store import CAS_SUBDIR
 
 # Inizializza router
 router = APIRouter(prefix="/api/images", tags=["images"])
@@ -25,7 +28,7 @@ async def upload_image(
     """
     Carica un'immagine, crea thumbnail WebP e salva metadata su MongoDB.
     
-    - **file**: File immagine da caricare
+    - **file**: File immagine da caricare (max IMAGE_UPLOAD_MAX_MB, default 20MB; oltre -> 413)
     - **planttype**: Tipo di pianta (opzionale)
     - **location**: Posizione nel giardino (opzionale)
     - **sensorid**: ID sensore associato (opzionale)
@@ -41,22 +44,26 @@ async def upload_image(
 
 @router.get("/list", summary="Lista immagini con filtri")
 async def list_images(
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=1000),
     processed: Optional[bool] = None,
     planttype: Optional[str] = None,
-    location: Optional[str] = None
+    location: Optional[str] = None,
+    cursor: Optional[str] = None,
+    view: str = Query("full", pattern="^(full|summary)$")
 ):
     """
-    Elenca tutte le immagini con filtri opzionali.
+    Elenca tutte le immagini con filtri opzionali (dalla più recente).
     
     - **limit**: Numero massimo di risultati (default: 100)
     - **processed**: Filtra per stato CNN (True/False/None)
     - **planttype**: Filtra per tipo di pianta
     - **location**: Filtra per location
+    - **cursor**: 'nextCursor' della pagina precedente (paginazione keyset)
+    - **view**: 'full' (documento completo) oppure 'summary' (solo i campi della lista)
     
-    Returns: Lista di immagini con metadata completi da MongoDB
+    Returns: Lista di immagini + nextCursor (null all'ultima pagina)
     """
-    return controller.list_images(limit, processed, planttype, location)
+    return controller.list_images(limit, processed, planttype, location, cursor, view)
 
 
 @router.get("/image/{imageid}", summary="Ottieni dettagli immagine")
@@ -82,6 +89,9 @@ async def download_image(date: str, filename: str):
     Returns: File immagine WebP
     """
     filepath = Path(settings.UPLOAD_DIR) / "plant_images" / date / filename
+    if not filepath.exists():
+        # Immagini nello storage per contenuto: uploads/cas/<prime 2 cifre sha256>/<file>
+        filepath = Path(settings.UPLOAD_DIR) / CAS_SUBDIR / filename[:2] / filename
     
     if not filepath.exists():
         raise HTTPException(status_code=404, detail=f"Immagine non trovata: {filename}")
@@ -133,3 +143,20 @@ async def mark_image_processed(
     Returns: Documento aggiornato
     """
     return controller.mark_image_processed(imageid, cnnresults)
+
+
+@router.post("/process-batch", summary="Analizza con la CNN le immagini non processate")
+async def process_pending_images(limit: int = Query(500, ge=1, le=100000, description="Numero massimo di immagini")):
+    """
+    Esegue una passata del processore batch sulle immagini con processed=False
+    (inferenza a batch, scrittura con bulk_write, riprendibile).
+
+    Returns: report con immagini processate, errori e throughput (img/s)
+    409 se una passata (job in background o altra richiesta) è già in corso.
+    """
+    processor = get_batch_processor()
+    try:
+        report = await asyncio.to_thread(processor.run_once, limit)
+    except BatchAlreadyRunningError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "success", "report": report}
@@ -0,0 +1,73 @@
+import os
+from typing import Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse
+
+from database import db
+from utils.images import run_in_image_pool
+from utils.media_cache import (
+    variant_cache, pick_width, make_etag, source_key, MEDIA_MAX_AGE, MEDIA_WIDTHS,
+)
+
+router = APIRouter(prefix="/media", tags=["media"])
+images_collection = db["immagini_piante"]
+
+MAIN_SIDE = 1280    # lato massimo dell'immagine principale salvata (save_image_bytes)
+THUMB_SIDE = 384    # lato massimo della thumbnail
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [t.strip() for t in header.split(",")]
+
+
+@router.get("/stats", summary="Statistiche cache varianti")
+def media_stats():
+    return variant_cache.stats()
+
+
+@router.get("/{image_id}", summary="Immagine ridimensionata su richiesta")
+async def get_media(
+    image_id: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=4096, description=f"Larghezza desiderata (arrotondata a {list(MEDIA_WIDTHS)})"),
+):
+    """
+    Serve l'immagine 'image_id' (immagini_piante) alla larghezza ammessa più vicina (>= w).
+    Le varianti sono generate alla prima richiesta e riutilizzate dalla cache su disco.
+    Risposte con ETag forte e Cache-Control; If-None-Match -> 304.
+    """
+    try:
+        oid = ObjectId(image_id)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="ID immagine non valido")
+
+    doc = images_collection.find_one({"_id": oid}, {"filepathfull": 1, "filepaththumb": 1, "sha256": 1})
+    if not doc or not doc.get("filepathfull") or not os.path.exists(doc["filepathfull"]):
+        raise HTTPException(status_code=404, detail="Immagine non trovata")
+
+    width = pick_width(w)
+    if width is not None and width >= MAIN_SIDE:
+        width = None  # la principale è già al massimo lato ammesso
+
+    # Sorgente più piccola sufficiente: thumbnail per le larghezze ridotte
+    source = doc["filepathfull"]
+    thumb = doc.get("filepaththumb")
+    if width is not None and width <= THUMB_SIDE and thumb and os.path.exists(thumb):
+        source = thumb
+
+    etag = make_etag(source_key(source, doc.get("sha256")), width)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={MEDIA_MAX_AGE}"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    path = source
+    if width is not None:
+        path, hit = await run_in_image_pool(variant_cache.get_or_create, source, width, etag)
+        headers["X-Media-Cache"] = "HIT" if hit else "MISS"
+    return FileResponse(path, media_type="image/webp", headers=headers)
@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 from typing import List
 from pydantic import BaseModel, Field
@@ -10,6 +11,11 @@ from controllers.plantsController import (
 )
 
 from controllers.ai_irrigazione_controller import compute_for_plant, compute_batch
+from ai.inference_pool import inference_pool, InferenceBusyError
+from ai.cnn_service import cnn_classifier
+from ai.embedding_store import embedding_store, REF_PLANT
+from utils.images import run_in_image_pool
+from utils.uploads import read_upload
 
 from database import db
 
@@ -57,14 +63,35 @@ async def api_upload_plant_image(
     file: UploadFile = File(...),
     current_user: dict = Depends(get_current_user)
 ):
-    data = await file.read()
-    if len(data) > 8 * 1024 * 1024:
-        raise HTTPException(status_code=413, detail="Immagine troppo grande (max 8MB)")
+    # Lettura a blocchi: oltre 8MB la richiesta viene interrotta subito
+    upload = await read_upload(file, max_mb=8, require_image=False)
+    data = upload.data
 
-    saved = save_plant_image(current_user["id"], plant_id, data)
+    plant = get_plant(current_user["id"], plant_id)
+    if not plant:
+        raise HTTPException(status_code=404, detail="Pianta non trovata")
+
+    # Inferenza CNN nel pool dedicato (non blocca l'event loop)
+    try:
+        health_result = await inference_pool.predict_health(
+            data, plant_context=plant.get("species") or "generic", digest=upload.sha256, return_embedding=True
+        )
+    except InferenceBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    embedding = health_result.pop("embedding", None)
+
+    # Encoding WEBP (main + thumbnail) nel pool immagini, fuori dall'event loop
+    saved = await run_in_image_pool(save_plant_image, current_user["id"], plant_id, data, health_result=health_result)
     if saved is None:
         raise HTTPException(status_code=404, detail="Pianta non trovata")
 
+    # Archivio embedding per la ricerca di casi simili
+    if embedding is not None and health_result.get("label") != "Errore":
+        await asyncio.to_thread(
+            embedding_store.add, REF_PLANT, plant_id, embedding, cnn_classifier.model_version(),
+            health_result["label"], health_result["confidence"],
+        )
+
     return saved
 
 
@@ -6,6 +6,8 @@ from controllers.userController import get_me, set_user_avatar
 from database import db
 from controllers import userController
 from utils.auth import get_current_user
+from utils.images import run_in_image_pool
+from utils.uploads import read_upload
 router = APIRouter()
 users_collection = db["utenti"]
 interventions_collection = db["interventi"]
@@ -66,11 +68,10 @@ async def api_upload_avatar(
     file: UploadFile = File(...),
     current_user: dict = Depends(get_current_user)
 ):
-    data = await file.read()
-    if len(data) > 5 * 1024 * 1024:
-        raise HTTPException(status_code=413, detail="Immagine troppo grande (max 5MB)")
+    upload = await read_upload(file, max_mb=5, require_image=False)
+    data = upload.data
 
-    saved = set_user_avatar(current_user["id"], data)
+    saved = await run_in_image_pool(set_user_avatar, current_user["id"], data)
     if saved is None:
         raise HTTPException(status_code=404, detail="Utente non trovato")
 
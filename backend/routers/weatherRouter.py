@@ -1,6 +1,10 @@
 from fastapi import APIRouter, HTTPException, Query
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from controllers.weather_controller import weatherController 
+from utils.geocode_cache import geocode_cache
+from utils.weather_prefetch import weather_prefetcher
+from utils.open_meteo_forecast import forecast_bundles
 
 router = APIRouter(prefix="/api/weather", tags=["weather"])
 
@@ -17,4 +21,34 @@ async def get_weather(
     if not city and (lat is None or lon is None):
         raise HTTPException(status_code=400, detail="Specifica 'city' oppure 'lat' e 'lon'")
 
-    return await weatherController.get_weather_data(city=city, lat=lat, lon=lon)
\ No newline at end of file
+    return await weatherController.get_weather_data(city=city, lat=lat, lon=lon)
+
+
+
+class WeatherPointIn(BaseModel):
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+
+
+class WeatherBatchIn(BaseModel):
+    coords: List[WeatherPointIn] = Field(..., min_length=1, max_length=5000)
+
+
+@router.post("/batch", summary="Meteo per più coordinate")
+async def get_weather_batch(payload: WeatherBatchIn):
+    """
+    Meteo per N coordinate in poche richieste (celle di griglia deduplicate,
+    richieste Open-Meteo multi-località a blocchi). Risultati nello stesso ordine.
+    """
+    coords = [(p.lat, p.lon) for p in payload.coords]
+    return {"items": await weatherController.get_weather_batch(coords)}
+
+
+@router.get("/cache-stats", summary="Statistiche cache meteo")
+def weather_cache_stats():
+    return {
+        "weather": weatherController.cache.stats(),
+        "geocode": geocode_cache.stats(),
+        "forecast": forecast_bundles.stats(),
+        "prefetch": weather_prefetcher.stats(),
+    }
@@ -3,7 +3,8 @@ import asyncio
 import logging
 from typing import Dict, Any, Optional, Tuple
 from datetime import datetime
-import httpx
+
+from utils.http_clients import get_async_client
 
 logger = logging.getLogger(__name__)
 
@@ -131,26 +132,26 @@ async def _call_hf_text_generation_async(model: str, prompt: str) -> Tuple[Optio
 
     try:
         logger.info(f"🔄 Tentativo con modello: {model}")
-        async with httpx.AsyncClient(timeout=45.0) as cli:
-            r = await cli.post(HF_API_URL, headers=headers, json=payload)
+        cli = get_async_client("llm")
+        r = await cli.post(HF_API_URL, headers=headers, json=payload)
+        
+        if r.status_code == 200:
+            j = r.json()
+            content = j.get("choices", [])[0].get("message", {}).get("content")
+            tokens = j.get("usage", {}).get("total_tokens")
             
-            if r.status_code == 200:
-                j = r.json()
-                content = j.get("choices", [])[0].get("message", {}).get("content")
-                tokens = j.get("usage", {}).get("total_tokens")
-                
-                if content:
-                    logger.info(f"✅ SUCCESSO con modello: {model} (tokens: {tokens})")
-                    return content.strip(), tokens, None
-                else:
-                    logger.warning(f"⚠️ Modello {model} - Risposta vuota")
-                    return None, None, "Empty response"
+            if content:
+                logger.info(f"✅ SUCCESSO con modello: {model} (tokens: {tokens})")
+                return content.strip(), tokens, None
             else:
-                error_msg = f"Status {r.status_code}"
-                logger.warning(f"⚠️ Modello {model} fallito: {error_msg}")
-                logger.debug(f"Response body: {r.text[:200]}")
-                return None, None, error_msg
-                
+                logger.warning(f"⚠️ Modello {model} - Risposta vuota")
+                return None, None, "Empty response"
+        else:
+            error_msg = f"Status {r.status_code}"
+            logger.warning(f"⚠️ Modello {model} fallito: {error_msg}")
+            logger.debug(f"Response body: {r.text[:200]}")
+            return None, None, error_msg
+            
     except Exception as e:
         logger.error(f"❌ Errore con {model}: {str(e)}")
         return None, None, str(e)
@@ -1,16 +1,19 @@
+import asyncio
 import os
 import time
 import math
 from typing import Optional, Dict, Any
 from datetime import datetime
 from controllers.weather_controller import weatherController
-from utils.nasa_power_service import get_daily_point, compute_et0_hargreaves
-from utils.copernicus_soil_service import get_soil_moisture
+from utils.nasa_power_service import get_daily_point_async, compute_et0_hargreaves
+from utils.copernicus_soil_service import get_soil_moisture_async
 from utils.fao_profile_service import get_profile
 
 _AGG_CACHE: Dict[str, Dict[str, Any]] = {}
 _AGG_TTL = int(os.getenv("AI_AGGR_TTL_SECONDS", "900"))  
+_AGG_PARTIAL_TTL = int(os.getenv("AI_AGGR_PARTIAL_TTL_SECONDS", "120"))   # risposte con fonti mancanti
 _GRID_PREC = int(os.getenv("AI_AGGR_GRID_PRECISION", "2"))
+_INPUTS_DEADLINE = float(os.getenv("AI_AGGR_DEADLINE_SECONDS", "8"))   # scadenza comune delle fonti esterne
 
 SENTINELS = {-999, -999.0, -9999, -9999.0}
 
@@ -61,6 +64,16 @@ def _ra_extraterrestrial(lat_deg: float, doy: int) -> Optional[float]:
     except: return None
 
 
+async def _gather_sources(calls: Dict[str, Any]) -> Dict[str, Any]:
+    """Esegue le coroutine in parallelo entro _INPUTS_DEADLINE secondi; quelle fallite o in ritardo mancano."""
+    async def bounded(coro):
+        # wait_for annulla e attende la coroutine in ritardo: nessuna eccezione lasciata non letta
+        return await asyncio.wait_for(coro, timeout=_INPUTS_DEADLINE)
+
+    outcomes = await asyncio.gather(*(bounded(c) for c in calls.values()), return_exceptions=True)
+    return {name: r for name, r in zip(calls, outcomes) if not isinstance(r, BaseException)}
+
+
 async def get_inputs(plant: Dict[str, Any], now: Optional[datetime] = None) -> Dict[str, Any]:
     """
     Aggrega profilo FAO, NASA POWER, Open-Meteo (Async) e Copernicus.
@@ -96,16 +109,24 @@ async def get_inputs(plant: Dict[str, Any], now: Optional[datetime] = None) -> D
         cached = _AGG_CACHE[key]["value"]
     else:
         # --- CHIAMATE PARALLELE ASINCRONE ---
-        # Qui chiamiamo il nuovo controller meteo che supporta i trend
-        try:
-            om = await weatherController.get_weather_data(lat=lat, lon=lng) or {}
-        except Exception:
-            om = {}
-
-        nasa = get_daily_point(lat, lng, now=now) or {}
-        soil = get_soil_moisture(lat, lng) or {}
+        # Open-Meteo (controller meteo con i trend), NASA POWER e suolo insieme,
+        # con una scadenza comune: una fonte lenta non blocca il ciclo di eventi
+        # e non ritarda le altre (i valori mancanti passano ai fallback).
+        sources = await _gather_sources({
+            "openmeteo": weatherController.get_weather_data(lat=lat, lon=lng),
+            "nasa": get_daily_point_async(lat, lng, now=now),
+            "soil": get_soil_moisture_async(lat, lng),
+        })
+        om = sources.get("openmeteo") or {}
+        nasa = sources.get("nasa") or {}
+        soil = sources.get("soil") or {}
 
         fallbacks = {}
+        missing = [name for name in ("openmeteo", "nasa", "soil") if not sources.get(name)]
+        if om and "forecast" in om.get("meta", {}).get("missing", []):
+            missing.insert(0, "openmeteo")   # solo valori di default del controller meteo
+        if missing:
+            fallbacks["missingSources"] = missing
 
         # MAPPING DATI METEO
         temp = om.get("temp") if om.get("temp") is not None else nasa.get("temp")
@@ -169,7 +190,10 @@ async def get_inputs(plant: Dict[str, Any], now: Optional[datetime] = None) -> D
             },
             "raw": { "nasa": nasa, "openmeteo": om, "soil": soil }
         }
-        _AGG_CACHE[key] = {"value": value, "expires_at": time.time() + _AGG_TTL}
+        # Risposta parziale: in cache per poco (una fonte giù a lungo non fa rifare ogni
+        # volta tutte e tre le chiamate), poi si riprovano le fonti mancanti
+        ttl = _AGG_PARTIAL_TTL if missing else _AGG_TTL
+        _AGG_CACHE[key] = {"value": value, "expires_at": time.time() + ttl}
         cached = value
 
     cached = dict(cached)
@@ -0,0 +1,135 @@
+#COSA FA: Cache asincrona in memoria per chiamate verso servizi esterni.
+#
+# - TTL: una voce è "fresca" per 'ttl' secondi;
+# - stale-while-revalidate: per altri 'stale_ttl' secondi la voce scaduta viene
+#   servita subito mentre un task in background la aggiorna;
+# - single-flight: richieste concorrenti per la stessa chiave attendono lo stesso
+#   fetch (1000 richieste sulla stessa cella -> 1 chiamata upstream);
+# - memoria limitata: al massimo 'max_entries' voci, eviction LRU.
+# peek/put/ttl_left possono essere chiamati anche da thread (servizi sync).
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class AsyncTTLCache:
+    def __init__(
+        self,
+        name: str,
+        ttl: float,
+        stale_ttl: float = 0.0,
+        max_entries: int = 1024,
+        cache_if: Optional[Callable[[Any], bool]] = None,
+    ):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        # Risultati "vuoti" (es. {} in caso di errore) non vengono memorizzati
+        self.cache_if = cache_if or bool
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()   # key -> (value, fresh_until, stale_until)
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "fetches": 0, "errors": 0, "evicted": 0}
+
+    def _store(self, key: Hashable, value: Any):
+        if not self.cache_if(value):
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (value, now + self.ttl, now + self.ttl + self.stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evicted"] += 1
+
+    def _start_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        fut = self._inflight.get(key)
+        if fut is not None:
+            return fut
+
+        async def runner():
+            self._stats["fetches"] += 1
+            try:
+                value = await fetch()
+            except Exception:
+                self._stats["errors"] += 1
+                raise
+            finally:
+                self._inflight.pop(key, None)
+            self._store(key, value)
+            return value
+
+        fut = asyncio.ensure_future(runner())
+        # Evita "Task exception was never retrieved" per i refresh in background
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = fut
+        return fut
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Ritorna il valore per 'key'; 'fetch' (coroutine function senza argomenti)
+        viene chiamata al più una volta per chiave anche con richieste concorrenti.
+        """
+        state = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, fresh_until, stale_until = entry
+                now = time.monotonic()
+                if now < stale_until:
+                    self._entries.move_to_end(key)
+                    state = "fresh" if now < fresh_until else "stale"
+                else:
+                    del self._entries[key]
+        if state == "fresh":
+            self._stats["hits"] += 1
+            return value
+        if state == "stale":
+            self._stats["stale_hits"] += 1
+            self._start_fetch(key, fetch)
+            return value
+
+        if key in self._inflight:
+            self._stats["coalesced"] += 1
+        else:
+            self._stats["misses"] += 1
+        # shield: la cancellazione di un chiamante non annulla il fetch condiviso
+        return await asyncio.shield(self._start_fetch(key, fetch))
+
+    def peek(self, key: Hashable) -> Any:
+        """Valore in cache (fresco o ancora servibile) senza avviare fetch; None se assente."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() >= entry[2]:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def ttl_left(self, key: Hashable) -> float:
+        """Secondi di validità rimasti (0 se assente o già scaduta)."""
+        entry = self._entries.get(key)
+        return max(0.0, entry[1] - time.monotonic()) if entry else 0.0
+
+    def put(self, key: Hashable, value: Any):
+        """Inserisce un valore ottenuto altrove (es. fetch a blocchi di più chiavi)."""
+        self._store(key, value)
+
+    def invalidate(self, key: Hashable = None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            **self._stats,
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "max_entries": self.max_entries,
+        }
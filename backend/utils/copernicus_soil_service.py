@@ -1,8 +1,7 @@
 import os
 import time
 from typing import Optional, Dict, Any
-import httpx
-from datetime import datetime
+from utils.open_meteo_forecast import forecast_bundles
 
 # Cache in memoria
 _SOIL_CACHE: Dict[str, Dict[str, Any]] = {}
@@ -11,42 +10,10 @@ _SOIL_CACHE: Dict[str, Dict[str, Any]] = {}
 _SOIL_TTL_SECONDS = int(os.getenv("SOIL_TTL_SECONDS", "1800"))          # 30 min
 _SOIL_GRID_PRECISION = int(os.getenv("SOIL_GRID_PRECISION", "2"))       # 0.01° ≈ ~1km
 
-OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
-HOURLY_VARS = "soil_moisture_0_to_7cm,soil_moisture_7_to_28cm"
-
 def _grid_key(lat: float, lng: float, precision: int = None) -> str:
     p = _SOIL_GRID_PRECISION if precision is None else precision
     return f"{round(lat, p)}:{round(lng, p)}"
 
-def _expired(entry: Dict[str, Any]) -> bool:
-    return time.time() > entry.get("expires_at", 0)
-
-def _parse_om_time(t: str) -> Optional[datetime]:
-    """Gestisce anche eventuale suffisso 'Z'."""
-    if not t:
-        return None
-    try:
-        return datetime.fromisoformat(t.replace('Z', ''))
-    except Exception:
-        return None
-
-def _find_start_index(times: list) -> int:
-    """
-    Trova l'indice della prima ora >= adesso nella lista times (ISO stringhe).
-    Se fallisce, torna 0.
-    """
-    if not times:
-        return 0
-    now_utc = datetime.utcnow()
-    try:
-        for i, t in enumerate(times):
-            dt = _parse_om_time(t)
-            if dt and dt >= now_utc:
-                return i
-    except Exception:
-        pass
-    return 0
-
 def _to_percent(vol: Optional[float]) -> Optional[float]:
     """
     Converte m3/m3 (0..1) → percentuale 0..100, clamp e round(1).
@@ -57,7 +24,15 @@ def _to_percent(vol: Optional[float]) -> Optional[float]:
     pct = max(0.0, min(100.0, float(vol) * 100.0))
     return round(pct, 1)
 
-def get_soil_moisture(lat: float, lng: float) -> Optional[Dict[str, Any]]:
+def _ttl_left(entry: Dict[str, Any]) -> float:
+    return entry.get("expires_at", 0) - time.time()
+
+def cache_ttl_left(lat: float, lng: float) -> float:
+    """Secondi di validità rimasti per la cella in cache (0 = da scaricare)."""
+    entry = _SOIL_CACHE.get(_grid_key(lat, lng))
+    return max(0.0, _ttl_left(entry)) if entry else 0.0
+
+def get_soil_moisture(lat: float, lng: float, min_ttl: float = 0) -> Optional[Dict[str, Any]]:
     """
     Ritorna l'umidità del suolo derivata da ERA5-Land via Open-Meteo (senza token):
       {
@@ -72,55 +47,52 @@ def get_soil_moisture(lat: float, lng: float) -> Optional[Dict[str, Any]]:
         }
       }
     Se errore → None (l'aggregator farà fallback su stima da RH aria).
+    'min_ttl': rinnova in anticipo la voce in cache se scade entro min_ttl secondi (prefetch).
     """
     # Guardia geo
     if lat is None or lng is None:
         return None
 
     key = _grid_key(lat, lng)
-    if key in _SOIL_CACHE and not _expired(_SOIL_CACHE[key]):
+    if key in _SOIL_CACHE and _ttl_left(_SOIL_CACHE[key]) > min_ttl:
         return _SOIL_CACHE[key]["value"]
 
-    params = {
-        "latitude": lat,
-        "longitude": lng,
-        "hourly": HOURLY_VARS,
-        "forecast_days": 2,
-        "timezone": "UTC",
-    }
-
-    try:
-        with httpx.Client(timeout=6.0) as cli:
-            r = cli.get(OPEN_METEO_URL, params=params)
-            r.raise_for_status()
-            j = r.json()
-    except Exception:
+    # Stessa richiesta /v1/forecast di weather_service e WeatherController
+    bundle = forecast_bundles.get(lat, lng, min_ttl=min_ttl)
+    if bundle is None:
         return None
+    return _store(key, _from_bundle(bundle))
 
-    hourly = j.get("hourly", {}) or {}
-    times = hourly.get("time", []) or []
-    sm0_list = hourly.get("soil_moisture_0_to_7cm", []) or []
-    sm7_list = hourly.get("soil_moisture_7_to_28cm", []) or []
+async def get_soil_moisture_async(lat: float, lng: float) -> Optional[Dict[str, Any]]:
+    """Come get_soil_moisture, senza bloccare il ciclo di eventi (stesse cache)."""
+    if lat is None or lng is None:
+        return None
 
-    idx = _find_start_index(times)
+    key = _grid_key(lat, lng)
+    if key in _SOIL_CACHE and _ttl_left(_SOIL_CACHE[key]) > 0:
+        return _SOIL_CACHE[key]["value"]
 
-    raw0 = None
-    raw7 = None
-    t_str = None
+    bundle = await forecast_bundles.get_async(lat, lng)
+    if bundle is None:
+        return None
+    return _store(key, _from_bundle(bundle))
 
-    # Prendi il valore all'ora "corrente" (fallback 0)
-    if sm0_list and 0 <= idx < len(sm0_list):
-        v0 = sm0_list[idx]
-        if isinstance(v0, (int, float)):
-            raw0 = float(v0)
+def _store(key: str, value: Dict[str, Any]) -> Dict[str, Any]:
+    _SOIL_CACHE[key] = {
+        "value": value,
+        "expires_at": time.time() + _SOIL_TTL_SECONDS,
+    }
+    return value
 
-    if sm7_list and 0 <= idx < len(sm7_list):
-        v7 = sm7_list[idx]
-        if isinstance(v7, (int, float)):
-            raw7 = float(v7)
+def _from_bundle(bundle: Dict[str, Any]) -> Dict[str, Any]:
+    """Umidità del suolo all'ora corrente dal bundle /v1/forecast."""
+    hourly = bundle["hourly"]
 
-    if times and 0 <= idx < len(times):
-        t_str = times[idx]
+    # Valori all'ora "corrente" (fallback 0)
+    idx = hourly.start_index()
+    raw0 = hourly.value_at("soil_moisture_0_to_7cm", idx)
+    raw7 = hourly.value_at("soil_moisture_7_to_28cm", idx)
+    t_str = hourly.time_at(idx)
 
     value = {
         "soilMoisture0to7cm": _to_percent(raw0),
@@ -133,9 +105,4 @@ def get_soil_moisture(lat: float, lng: float) -> Optional[Dict[str, Any]]:
             "time": t_str
         }
     }
-
-    _SOIL_CACHE[key] = {
-        "value": value,
-        "expires_at": time.time() + _SOIL_TTL_SECONDS,
-    }
-    return value
\ No newline at end of file
+    return value
@@ -0,0 +1,140 @@
+#COSA FA: Cache persistente di geocoding (città -> coordinate) e reverse geocoding
+# (coordinate -> nome località).
+#
+# - Tier 1: AsyncTTLCache in memoria (LRU + single-flight);
+# - Tier 2: collection Mongo 'geocode_cache' condivisa tra worker e riavvii,
+#   con scadenza per documento (indice TTL su 'expiresAt').
+# Chiavi normalizzate: "fwd:<testo senza accenti/maiuscole/spazi doppi>" e
+# "rev:<lat>:<lng>" arrotondati a GEOCODE_REVERSE_PRECISION decimali.
+# Anche i "non trovato" vengono memorizzati (TTL più breve); gli errori di rete no.
+
+import asyncio
+import os
+import re
+import unicodedata
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional, Tuple
+
+from database import db
+from utils.async_cache import AsyncTTLCache
+
+GEOCODE_TTL_DAYS = int(os.getenv("GEOCODE_TTL_DAYS", "180"))
+GEOCODE_NEGATIVE_TTL_DAYS = int(os.getenv("GEOCODE_NEGATIVE_TTL_DAYS", "7"))
+GEOCODE_MEMORY_SIZE = int(os.getenv("GEOCODE_MEMORY_SIZE", "10000"))
+GEOCODE_REVERSE_PRECISION = int(os.getenv("GEOCODE_REVERSE_PRECISION", "3"))   # ~100 m
+
+geocode_collection = db["geocode_cache"]
+
+
+def normalize_query(text: str) -> str:
+    """'  Bisceglie,  BT ' e 'bisceglie, bt' -> stessa chiave."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"\s*,\s*", ",", text.casefold())
+    return re.sub(r"\s+", " ", text).strip(" ,")
+
+
+def forward_key(query: str) -> str:
+    return f"fwd:{normalize_query(query)}"
+
+
+def reverse_key(lat: float, lng: float) -> str:
+    p = GEOCODE_REVERSE_PRECISION
+    return f"rev:{round(float(lat), p)}:{round(float(lng), p)}"
+
+
+class GeocodeCache:
+    def __init__(self):
+        # In memoria al più per il TTL più breve (negativi), poi si rilegge da Mongo
+        self._memory = AsyncTTLCache(
+            "geocode", ttl=GEOCODE_NEGATIVE_TTL_DAYS * 86400, max_entries=GEOCODE_MEMORY_SIZE
+        )
+
+    def ensure_indexes(self):
+        try:
+            geocode_collection.create_index("expiresAt", expireAfterSeconds=0, name="ttl_geocode")
+        except Exception as e:
+            print(f"[WARN] geocode cache indexes: {e}")
+
+    @staticmethod
+    def _load(key: str) -> Optional[dict]:
+        try:
+            doc = geocode_collection.find_one({"_id": key})
+        except Exception as e:
+            print(f"[WARN] geocode cache read: {e}")
+            return None
+        if doc and doc.get("expiresAt") and doc["expiresAt"] < datetime.utcnow():
+            return None  # il monitor TTL di Mongo passa ogni 60 s
+        return doc
+
+    @staticmethod
+    def _save(key: str, kind: str, query: str, value: dict):
+        now = datetime.utcnow()
+        ttl_days = GEOCODE_TTL_DAYS if value.get("found") else GEOCODE_NEGATIVE_TTL_DAYS
+        try:
+            geocode_collection.update_one(
+                {"_id": key},
+                {"$set": {**value, "kind": kind, "query": query, "createdAt": now,
+                          "expiresAt": now + timedelta(days=ttl_days)}},
+                upsert=True,
+            )
+        except Exception as e:
+            print(f"[WARN] geocode cache write: {e}")
+
+    async def _lookup(self, key: str, kind: str, query: str, fetch: Callable[[], Awaitable[dict]]) -> dict:
+        async def load_or_fetch():
+            doc = await asyncio.to_thread(self._load, key)
+            if doc is not None:
+                return {k: doc.get(k) for k in ("found", "lat", "lng", "name")}
+            value = await fetch()          # solleva in caso di errore di rete: niente cache
+            await asyncio.to_thread(self._save, key, kind, query, value)
+            return value
+
+        return await self._memory.get_or_fetch(key, load_or_fetch)
+
+    async def forward(self, query: str, fetch: Callable[[], Awaitable[Optional[Tuple[float, float]]]]):
+        """
+        Coordinate di 'query'. 'fetch' interroga il geocoder: ritorna (lat, lng),
+        None se non trovato, solleva un'eccezione in caso di errore.
+        Ritorna (lat, lng) oppure (None, None).
+        """
+        if not normalize_query(query):
+            return None, None
+
+        async def fetch_doc():
+            coords = await fetch()
+            if not coords:
+                return {"found": False, "lat": None, "lng": None, "name": None}
+            return {"found": True, "lat": coords[0], "lng": coords[1], "name": None}
+
+        value = await self._lookup(forward_key(query), "forward", query, fetch_doc)
+        return (value["lat"], value["lng"]) if value.get("found") else (None, None)
+
+    async def reverse(self, lat: float, lng: float, fetch: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        """Nome della località per (lat, lng); 'fetch' come in forward (ritorna il nome o None)."""
+
+        async def fetch_doc():
+            name = await fetch()
+            return {"found": bool(name), "lat": lat, "lng": lng, "name": name}
+
+        value = await self._lookup(reverse_key(lat, lng), "reverse", f"{lat},{lng}", fetch_doc)
+        return value.get("name") if value.get("found") else None
+
+    async def reverse_cached(self, lat: float, lng: float) -> Optional[str]:
+        """Come reverse, ma solo dalla cache (memoria o Mongo): nessuna richiesta al geocoder."""
+        key = reverse_key(lat, lng)
+        value = self._memory.peek(key)
+        if value is None:
+            doc = await asyncio.to_thread(self._load, key)
+            if doc is None:
+                return None
+            value = {k: doc.get(k) for k in ("found", "lat", "lng", "name")}
+            self._memory.put(key, value)
+        return value.get("name") if value.get("found") else None
+
+    def stats(self) -> dict:
+        return self._memory.stats()
+
+
+# Istanza globale
+geocode_cache = GeocodeCache()
@@ -1,6 +1,23 @@
-import httpx
+import asyncio
+import os
+import time
 from typing import Optional, Dict
 
+from utils.http_clients import get_async_client
+
+# Nominatim: al più una richiesta al secondo (usage policy), per tutto il processo
+NOMINATIM_MIN_INTERVAL = float(os.getenv("NOMINATIM_MIN_INTERVAL", "1.0"))
+_nominatim_next = 0.0   # prossimo istante (monotonic) libero
+
+async def nominatim_slot():
+    """Attende il proprio turno: richieste Nominatim distanziate di NOMINATIM_MIN_INTERVAL secondi."""
+    global _nominatim_next
+    now = time.monotonic()
+    slot = max(now, _nominatim_next)
+    _nominatim_next = slot + NOMINATIM_MIN_INTERVAL
+    if slot > now:
+        await asyncio.sleep(slot - now)
+
 async def get_coordinates_from_city(city: str) -> Optional[Dict[str, float]]:
     """
     Usa Nominatim (OpenStreetMap) per convertire 'Bari, IT' → lat/lng
@@ -10,16 +27,17 @@ async def get_coordinates_from_city(city: str) -> Optional[Dict[str, float]]:
         params = {"q": city, "format": "json", "limit": 1}
         headers = {"User-Agent": "HomeGardeningApp"}
 
-        async with httpx.AsyncClient(timeout=6.0) as client:
-            response = await client.get(url, params=params, headers=headers)
-            response.raise_for_status()
-            data = response.json()
+        await nominatim_slot()
+        client = get_async_client("nominatim")
+        response = await client.get(url, params=params, headers=headers)
+        response.raise_for_status()
+        data = response.json()
 
-            if not data:
-                return None
+        if not data:
+            return None
 
-            lat = float(data[0]["lat"])
-            lng = float(data[0]["lon"])
-            return {"lat": lat, "lng": lng}
+        lat = float(data[0]["lat"])
+        lng = float(data[0]["lon"])
+        return {"lat": lat, "lng": lng}
     except Exception:
         return None
\ No newline at end of file
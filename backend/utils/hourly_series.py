@@ -0,0 +1,91 @@
+#COSA FA: Serie orarie Open-Meteo in forma colonnare (NumPy).
+#
+# La risposta 'hourly' viene parsata una sola volta:
+#   - orari -> array datetime64[s] in UTC (utc_offset_seconds sottratto);
+#   - ogni variabile -> array float64 con NaN per i valori mancanti (null).
+# Le finestre ("prossime 24h", "prossime 6h") si trovano con searchsorted e le
+# riduzioni sono vettoriali, senza fromisoformat per riga né controlli isinstance.
+
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class HourlySeries:
+    __slots__ = ("times", "columns")
+
+    def __init__(self, times: np.ndarray, columns: Dict[str, np.ndarray]):
+        self.times = times
+        self.columns = columns
+
+    @classmethod
+    def from_open_meteo(cls, hourly: dict, utc_offset_seconds: int = 0) -> "HourlySeries":
+        hourly = hourly or {}
+        try:
+            times = np.array(hourly.get("time") or [], dtype="datetime64[s]")
+        except ValueError:
+            times = np.array([], dtype="datetime64[s]")
+        if utc_offset_seconds:
+            times = times - np.timedelta64(int(utc_offset_seconds), "s")
+
+        n = len(times)
+        columns = {}
+        for name, values in hourly.items():
+            if name == "time" or not isinstance(values, list):
+                continue
+            try:
+                col = np.array(values, dtype=np.float64)   # None -> NaN
+            except (TypeError, ValueError):
+                continue
+            if len(col) == n:
+                columns[name] = col
+        return cls(times, columns)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def start_index(self, now: Optional[datetime] = None) -> int:
+        """Indice della prima ora >= adesso (UTC); 0 se la serie è vuota o tutta nel passato."""
+        if not len(self.times):
+            return 0
+        i = int(np.searchsorted(self.times, np.datetime64(now or datetime.utcnow(), "s"), side="left"))
+        return i if i < len(self.times) else 0
+
+    def window(self, name: str, hours: int, start: Optional[int] = None) -> np.ndarray:
+        """Valori di 'name' per 'hours' ore da 'start' (default: ora corrente). Vuoto se la variabile manca."""
+        col = self.columns.get(name)
+        if col is None:
+            return np.empty(0)
+        i = self.start_index() if start is None else start
+        return col[i:i + hours]
+
+    @staticmethod
+    def _complete(values: np.ndarray, require_complete: bool) -> bool:
+        return bool(len(values)) and not (require_complete and np.isnan(values).any())
+
+    def window_sum(self, name: str, hours: int, start: Optional[int] = None, require_complete: bool = True) -> Optional[float]:
+        """Somma sulla finestra; None se vuota o (require_complete) con valori mancanti."""
+        values = self.window(name, hours, start)
+        if not self._complete(values, require_complete) or np.isnan(values).all():
+            return None
+        return float(np.nansum(values))
+
+    def window_mean(self, name: str, hours: int, start: Optional[int] = None, require_complete: bool = True) -> Optional[float]:
+        """Media sulla finestra; None se vuota o (require_complete) con valori mancanti."""
+        values = self.window(name, hours, start)
+        if not self._complete(values, require_complete) or np.isnan(values).all():
+            return None
+        return float(np.nanmean(values))
+
+    def value_at(self, name: str, index: int) -> Optional[float]:
+        col = self.columns.get(name)
+        if col is None or not (0 <= index < len(col)) or np.isnan(col[index]):
+            return None
+        return float(col[index])
+
+    def time_at(self, index: int) -> Optional[str]:
+        """Orario UTC in ISO (minuti), come nelle risposte Open-Meteo."""
+        if not (0 <= index < len(self.times)):
+            return None
+        return str(np.datetime_as_string(self.times[index], unit="m"))
@@ -0,0 +1,147 @@
+#COSA FA: Registro dei client HTTP condivisi per tutte le integrazioni esterne.
+#
+# Un client per integrazione (Open-Meteo, Nominatim, NASA POWER, Trefle, LLM...):
+#   - pool di connessioni keep-alive -> niente handshake TCP/TLS a ogni chiamata;
+#   - limiti di connessioni per integrazione (quindi per host);
+#   - timeout specifici per integrazione;
+#   - HTTP/2 se il pacchetto 'h2' è installato (pip install httpx[http2]).
+# I client async vivono nel ciclo di vita dell'app (startup/shutdown in main.py);
+# quelli sync sono usati dai servizi chiamati da thread o script.
+
+import asyncio
+import importlib.util
+import os
+import threading
+from typing import Dict, Optional
+
+import httpx
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+HTTP_HTTP2 = os.getenv("HTTP_HTTP2", "1").lower() in ("1", "true", "yes") and HTTP2_AVAILABLE
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+USER_AGENT = "GreenfieldAdvisorApp/1.0"
+
+# Configurazione per integrazione: timeout (lettura, connessione), connessioni massime, header fissi
+INTEGRATIONS: Dict[str, dict] = {
+    "open_meteo": {"timeout": 6.0, "connect": 3.0},
+    "nominatim": {"timeout": 5.0, "connect": 3.0, "max_connections": 2},  # policy Nominatim: max 1 req/s
+    "nasa_power": {"timeout": float(os.getenv("NASA_POWER_TIMEOUT", "6")), "connect": 3.0},
+    "trefle": {"timeout": 12.0, "connect": 4.0},
+    "llm": {"timeout": 45.0, "connect": 5.0, "max_connections": 8},
+}
+
+
+def _config(name: str) -> dict:
+    if name not in INTEGRATIONS:
+        raise KeyError(f"Integrazione HTTP sconosciuta: {name}")
+    return INTEGRATIONS[name]
+
+
+def _client_kwargs(name: str, headers: Optional[dict] = None) -> dict:
+    cfg = _config(name)
+    max_conn = cfg.get("max_connections", HTTP_MAX_CONNECTIONS)
+    return {
+        "timeout": httpx.Timeout(cfg["timeout"], connect=cfg["connect"]),
+        "limits": httpx.Limits(
+            max_connections=max_conn,
+            max_keepalive_connections=min(HTTP_MAX_KEEPALIVE, max_conn),
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "headers": {"User-Agent": USER_AGENT, **(headers or {})},
+        "http2": HTTP_HTTP2,
+    }
+
+
+class HttpClients:
+    """
+    Client creati alla prima richiesta e riutilizzati. Gli header passati alla
+    prima get_* (es. Authorization) restano fissi per quel client.
+    Un client async è legato al ciclo di eventi in cui è stato creato: se il
+    ciclo cambia il vecchio client viene chiuso nel suo ciclo (se è ancora in
+    esecuzione) e ricreato. Un ciclo già terminato non permette più di chiudere
+    le connessioni: gli script con più asyncio.run devono chiamare
+    'await http_clients.aclose()' prima della fine di ogni ciclo, altrimenti
+    la get_async successiva solleva RuntimeError per segnalare le connessioni
+    rimaste aperte (il client orfano viene comunque scartato).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._async: Dict[str, httpx.AsyncClient] = {}
+        self._async_loops: Dict[str, asyncio.AbstractEventLoop] = {}
+        self._sync: Dict[str, httpx.Client] = {}
+
+    def get_async(self, name: str, headers: Optional[dict] = None) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async.get(name)
+            old_loop = self._async_loops.get(name)
+            if client is not None and not client.is_closed and old_loop is not loop:
+                del self._async[name], self._async_loops[name]
+                self._close_on_loop(name, client, old_loop)
+                client = None
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(**_client_kwargs(name, headers))
+                self._async[name] = client
+                self._async_loops[name] = loop
+            return client
+
+    @staticmethod
+    def _close_on_loop(name: str, client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop):
+        """Chiude un client async nel ciclo che lo possiede (es. un altro thread)."""
+        if loop is None or loop.is_closed() or not loop.is_running():
+            raise RuntimeError(
+                f"Client HTTP '{name}' non chiuso prima della fine del suo ciclo di eventi: "
+                "chiamare 'await http_clients.aclose()' prima di chiudere il ciclo."
+            )
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+    def get_sync(self, name: str, headers: Optional[dict] = None) -> httpx.Client:
+        with self._lock:
+            client = self._sync.get(name)
+            if client is None or client.is_closed:
+                client = httpx.Client(**_client_kwargs(name, headers))
+                self._sync[name] = client
+            return client
+
+    def start(self, names=None):
+        """Crea in anticipo i client async (da chiamare nello startup dell'app)."""
+        for name in names or INTEGRATIONS:
+            self.get_async(name)
+
+    async def aclose(self):
+        with self._lock:
+            async_clients = list(self._async.values())
+            sync_clients = list(self._sync.values())
+            self._async.clear()
+            self._async_loops.clear()
+            self._sync.clear()
+        for client in async_clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                print(f"[WARN] chiusura client HTTP: {e}")
+        for client in sync_clients:
+            client.close()
+
+    def stats(self) -> dict:
+        return {
+            "http2": HTTP_HTTP2,
+            "async": sorted(self._async),
+            "sync": sorted(self._sync),
+        }
+
+
+# Istanza globale
+http_clients = HttpClients()
+
+
+def get_async_client(name: str, headers: Optional[dict] = None) -> httpx.AsyncClient:
+    return http_clients.get_async(name, headers)
+
+
+def get_sync_client(name: str, headers: Optional[dict] = None) -> httpx.Client:
+    return http_clients.get_sync(name, headers)
@@ -0,0 +1,157 @@
+#COSA FA: Storage delle immagini indirizzato per contenuto (deduplicato).
+#
+# Chiave = sha256 dell'originale + parametri di ridimensionamento/encoding. Ogni file WEBP
+# (main + thumbnail) esiste una sola volta su disco, in uploads/cas/<aa>/, con un
+# contatore di riferimenti nella collection 'image_blobs':
+#   - upload duplicato: $inc refs, nessun encoding e nessuna scrittura su disco;
+#   - delete: $inc refs -1, i file vengono eliminati solo all'ultimo riferimento.
+# L'ultimo rilascio marca il blob con 'deleting' prima di cancellare i file: finché il
+# marcatore c'è nessun upload può riprenderlo, quindi i file di un riferimento appena
+# acquisito non vengono mai rimossi da un rilascio concorrente.
+
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import db
+from utils.images import save_image_bytes, encode_profile_name
+
+blobs_collection = db["image_blobs"]
+
+CAS_SUBDIR = "cas"
+CAS_DELETE_POLL_S = 0.02        # attesa tra due tentativi mentre un rilascio elimina i file
+CAS_DELETING_STALE_S = 30       # marcatore 'deleting' più vecchio: rilascio interrotto, si riprende il blob
+
+
+def ensure_image_store_indexes():
+    try:
+        blobs_collection.create_index("abs", name="idx_blob_abs")
+    except Exception as e:
+        print(f"[WARN] image store indexes: {e}")
+
+
+def _blob_key(digest: str, max_side: int, thumb_side: int, webp_quality: int, profile: str) -> str:
+    return f"{digest}:{max_side}:{thumb_side}:{webp_quality}:{profile}"
+
+
+def _base_name(digest: str, max_side: int, thumb_side: int, webp_quality: int, profile: str) -> str:
+    # Tutte le componenti della chiave: parametri diversi non condividono mai i file
+    return f"{digest[:32]}-{max_side}-{thumb_side}-q{webp_quality}-{profile}"
+
+
+def _paths(blob: dict) -> Dict[str, str]:
+    return {k: blob[k] for k in ("url", "thumbUrl", "rel", "relThumb", "abs", "absThumb")}
+
+
+def store_image_bytes(
+    data: bytes,
+    digest: Optional[str] = None,
+    max_side: int = 1280,
+    thumb_side: int = 384,
+    webp_quality: int = 82,
+    profile: Optional[str] = None,
+) -> Dict[str, str]:
+    """
+    Come save_image_bytes (stesso dizionario di ritorno + "sha256" e "dedup"),
+    ma salva ogni contenuto una sola volta. 'digest' (sha256 esadecimale) può
+    essere passato se già calcolato durante l'upload.
+    """
+    digest = digest or hashlib.sha256(data).hexdigest()
+    profile = encode_profile_name(profile)
+    key = _blob_key(digest, max_side, thumb_side, webp_quality, profile)
+
+    def save() -> Dict[str, str]:
+        # Nome deterministico: upload concorrenti dello stesso contenuto producono gli stessi file,
+        # scritti in modo atomico (file temporaneo + os.replace) da save_image_bytes
+        return save_image_bytes(
+            data=data,
+            subdir=f"{CAS_SUBDIR}/{digest[:2]}",
+            base_name=_base_name(digest, max_side, thumb_side, webp_quality, profile),
+            max_side=max_side,
+            thumb_side=thumb_side,
+            webp_quality=webp_quality,
+            profile=profile,
+        )
+
+    while True:
+        # Contenuto già presente (e non in eliminazione): solo un riferimento in più
+        blob = blobs_collection.find_one_and_update(
+            {"_id": key, "deleting": {"$exists": False}}, {"$inc": {"refs": 1}}, return_document=ReturnDocument.AFTER
+        )
+        if blob:
+            if _files_exist(blob):
+                return {**_paths(blob), "sha256": digest, "dedup": True}
+            # Documento presente ma file mancanti (es. rimossi a mano): rigenerati, riferimento già contato
+            saved = save()
+            blobs_collection.update_one({"_id": key}, {"$set": saved})
+            return {**saved, "sha256": digest, "dedup": False}
+
+        pending = blobs_collection.find_one({"_id": key})
+        if pending is not None:
+            if "deleting" not in pending:
+                continue  # appena creato da un upload concorrente
+            # Un rilascio sta eliminando i file: si attende che finisca
+            if datetime.utcnow() - pending["deleting"] > timedelta(seconds=CAS_DELETING_STALE_S):
+                blobs_collection.delete_one({"_id": key, "deleting": pending["deleting"]})
+            else:
+                time.sleep(CAS_DELETE_POLL_S)
+            continue
+
+        saved = save()
+        try:
+            blobs_collection.update_one(
+                {"_id": key, "deleting": {"$exists": False}},
+                {"$setOnInsert": {**saved, "sha256": digest, "createdAt": datetime.utcnow()}, "$inc": {"refs": 1}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            continue  # blob comparso e già in eliminazione nel frattempo
+        # Un rilascio del blob precedente può aver rimosso i file appena scritti prima di
+        # cancellare il documento: ora il riferimento è contato, nessuno li elimina più
+        if not _files_exist(saved):
+            saved = save()
+        return {**saved, "sha256": digest, "dedup": False}
+
+
+def _files_exist(blob: dict) -> bool:
+    return os.path.exists(blob["abs"]) and os.path.exists(blob["absThumb"])
+
+
+def release_image_files(abs_path: Optional[str], abs_thumb: Optional[str] = None) -> bool:
+    """
+    Rilascia un riferimento. Ritorna True se i file sono stati eliminati.
+    I file non gestiti dallo storage (upload precedenti, nomi uuid) vengono eliminati direttamente.
+    """
+    if not abs_path:
+        return False
+    blob = blobs_collection.find_one_and_update(
+        {"abs": abs_path, "refs": {"$gt": 0}}, {"$inc": {"refs": -1}}, return_document=ReturnDocument.AFTER
+    )
+    if blob is None:
+        if blobs_collection.count_documents({"abs": abs_path}, limit=1):
+            return False  # contatore già a zero: eliminazione in corso altrove
+        for f in (abs_path, abs_thumb):
+            if f and os.path.exists(f):
+                os.remove(f)
+        return True
+    if blob["refs"] > 0:
+        return False
+
+    # Ultimo riferimento: marcatore 'deleting' solo se nel frattempo nessuno l'ha ripreso;
+    # da qui gli upload dello stesso contenuto attendono la fine dell'eliminazione
+    marker = datetime.utcnow()
+    marked = blobs_collection.update_one(
+        {"_id": blob["_id"], "refs": {"$lte": 0}, "deleting": {"$exists": False}}, {"$set": {"deleting": marker}}
+    )
+    if marked.modified_count != 1:
+        return False
+    for f in (blob["abs"], blob["absThumb"]):
+        if f and os.path.exists(f):
+            os.remove(f)
+    blobs_collection.delete_one({"_id": blob["_id"], "refs": {"$lte": 0}, "deleting": marker})
+    return True
@@ -1,3 +1,7 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from uuid import uuid4
 from io import BytesIO
@@ -8,11 +12,27 @@ from config import settings
 
 ALLOWED_FORMATS = {"JPEG", "PNG", "WEBP", "JPG"}
 
+# Profili di encoding WEBP: 'method' è lo sforzo dell'encoder (0 = veloce, 6 = massima compressione).
+# method=6 costa molto di più di method=4 per pochi punti percentuali di dimensione in meno.
+ENCODE_PROFILES = {
+    "fast": {"method": 2},
+    "balanced": {"method": 4},
+    "best": {"method": 6},
+}
+IMAGE_ENCODE_PROFILE = os.getenv("IMAGE_ENCODE_PROFILE", "balanced").strip().lower()
+# Thread per decode/resize/encode: Pillow rilascia il GIL in queste operazioni
+IMAGE_ENCODE_WORKERS = int(os.getenv("IMAGE_ENCODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_encode_executor: Optional[ThreadPoolExecutor] = None
+
 def _ensure_dir(path: Path):
     path.mkdir(parents=True, exist_ok=True)
 
-def _open_image(data: bytes) -> Image.Image:
+def _open_image(data: bytes, max_side: Optional[int] = None) -> Image.Image:
     img = Image.open(BytesIO(data))
+    if max_side and img.format == "JPEG":
+        # Decodifica JPEG già ridotta (1/2, 1/4, 1/8) ma mai sotto max_side
+        img.draft("RGB", (max_side, max_side))
     img.load()
     img = ImageOps.exif_transpose(img)
     return img
@@ -22,7 +42,27 @@ def _resize_max(img: Image.Image, max_side: int) -> Image.Image:
     if max(w, h) <= max_side:
         return img
     scale = max_side / float(max(w, h))
-    return img.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
+    # reducing_gap: riduzione preliminare a box + LANCZOS finale (molto più veloce, stessa qualità visiva)
+    return img.resize((int(w * scale), int(h * scale)), Image.LANCZOS, reducing_gap=3.0)
+
+def encode_profile_name(profile: Optional[str] = None) -> str:
+    """Nome del profilo effettivamente usato (default IMAGE_ENCODE_PROFILE, sconosciuti -> balanced)."""
+    name = (profile or IMAGE_ENCODE_PROFILE).lower()
+    return name if name in ENCODE_PROFILES else "balanced"
+
+def _encode_options(profile: Optional[str]) -> dict:
+    return ENCODE_PROFILES[encode_profile_name(profile)]
+
+def _save_webp_atomic(img: Image.Image, path: Path, **options):
+    """Scrive su un file temporaneo nella stessa cartella e lo rinomina: chi legge non vede mai file a metà."""
+    tmp = path.with_name(f".{path.name}.{uuid4().hex[:8]}.tmp")
+    try:
+        img.save(tmp, format="WEBP", **options)
+        os.replace(tmp, path)
+    except BaseException:
+        if tmp.exists():
+            tmp.unlink()
+        raise
 
 def save_image_bytes(
     data: bytes,
@@ -30,10 +70,13 @@ def save_image_bytes(
     base_name: Optional[str] = None,
     max_side: int = 1280,
     thumb_side: int = 384,
-    webp_quality: int = 82
+    webp_quality: int = 82,
+    profile: Optional[str] = None
 ) -> Dict[str, str]:
     """
     Salva immagine in WEBP.
+    Una sola decodifica: la thumbnail è ricavata dall'immagine principale già ridotta.
+    'profile' (fast | balanced | best) sceglie lo sforzo dell'encoder; default IMAGE_ENCODE_PROFILE.
     Ritorna sia URL pubblici, sia path relativi/assoluti per eventuale delete.
     """
     root = Path(settings.UPLOAD_DIR).resolve()
@@ -45,7 +88,7 @@ def save_image_bytes(
 
     # Apertura & validazione
     try:
-        img = _open_image(data)
+        img = _open_image(data, max_side)
     except Exception:
         raise ValueError("File non riconosciuto come immagine valida")
 
@@ -58,15 +101,17 @@ def save_image_bytes(
     main_name = f"{uid}.webp"
     thumb_name = f"{uid}_sm.webp"
 
+    encode = _encode_options(profile)
+
     # Main
     main_img = _resize_max(img, max_side)
     main_path = target_dir / main_name
-    main_img.save(main_path, format="WEBP", quality=webp_quality, method=6)
+    _save_webp_atomic(main_img, main_path, quality=webp_quality, **encode)
 
-    # Thumb
-    th_img = _resize_max(img, thumb_side)
+    # Thumb (dalla main: ridimensiona ~1MP invece dell'originale)
+    th_img = _resize_max(main_img, thumb_side)
     thumb_path = target_dir / thumb_name
-    th_img.save(thumb_path, format="WEBP", quality=webp_quality, method=6)
+    _save_webp_atomic(th_img, thumb_path, quality=webp_quality, **encode)
 
     # Percorsi relativi
     rel_main = f"uploads/{subdir}/{main_name}"
@@ -84,4 +129,29 @@ def save_image_bytes(
         "relThumb": rel_thumb,
         "abs": str(main_path),
         "absThumb": str(thumb_path),
-    }
\ No newline at end of file
+    }
+
+
+def _get_encode_executor() -> ThreadPoolExecutor:
+    global _encode_executor
+    if _encode_executor is None:
+        _encode_executor = ThreadPoolExecutor(max_workers=max(1, IMAGE_ENCODE_WORKERS), thread_name_prefix="img-encode")
+    return _encode_executor
+
+
+async def run_in_image_pool(fn, *args, **kwargs):
+    """Esegue un lavoro sulle immagini (decode/resize/encode + I/O) fuori dall'event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_encode_executor(), partial(fn, *args, **kwargs))
+
+
+async def save_image_bytes_async(data: bytes, subdir: str, **kwargs) -> Dict[str, str]:
+    """Versione per gli handler async di save_image_bytes (stessi argomenti)."""
+    return await run_in_image_pool(save_image_bytes, data=data, subdir=subdir, **kwargs)
+
+
+def shutdown_image_pool():
+    global _encode_executor
+    if _encode_executor is not None:
+        _encode_executor.shutdown(wait=False)
+        _encode_executor = None
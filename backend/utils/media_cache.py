@@ -0,0 +1,154 @@
+#COSA FA: Varianti ridimensionate delle immagini generate su richiesta (/media/{id}?w=...)
+# e conservate in una cache su disco con eviction LRU sul totale dei byte.
+#
+# - Larghezze ammesse: MEDIA_WIDTHS (nessuna variante arbitraria -> cache limitata e riutilizzabile).
+# - Sorgente: la thumbnail se basta, altrimenti l'immagine principale (mai l'originale).
+# - ETag forte: dipende dalla sorgente (sha256, mtime+size) e dai parametri di encoding.
+# - Cache fuori da UPLOAD_DIR: le varianti non sono raggiungibili dal mount statico /uploads.
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from utils.images import ENCODE_PROFILES, encode_profile_name
+
+MEDIA_WIDTHS = tuple(sorted(int(w) for w in os.getenv("MEDIA_WIDTHS", "160,320,480,640,960,1280").split(",")))
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", str(Path(__file__).resolve().parent.parent / ".cache" / "media"))
+MEDIA_CACHE_MAX_MB = float(os.getenv("MEDIA_CACHE_MAX_MB", "512"))
+MEDIA_MAX_AGE = int(os.getenv("MEDIA_MAX_AGE", str(7 * 24 * 3600)))     # Cache-Control max-age (s)
+MEDIA_WEBP_QUALITY = int(os.getenv("MEDIA_WEBP_QUALITY", "80"))
+MEDIA_ENCODE_PROFILE = encode_profile_name(os.getenv("MEDIA_ENCODE_PROFILE", "balanced"))
+MEDIA_EVICT_GRACE = float(os.getenv("MEDIA_EVICT_GRACE", "30"))   # varianti servite da poco: mai eliminate (s)
+
+
+def pick_width(requested: Optional[int]) -> Optional[int]:
+    """La più piccola larghezza ammessa >= richiesta (None = originale)."""
+    if not requested:
+        return None
+    for w in MEDIA_WIDTHS:
+        if w >= requested:
+            return w
+    return MEDIA_WIDTHS[-1]
+
+
+def make_etag(source_key: str, width: Optional[int]) -> str:
+    digest = hashlib.sha1(
+        f"{source_key}:{width}:{MEDIA_WEBP_QUALITY}:{MEDIA_ENCODE_PROFILE}".encode()
+    ).hexdigest()
+    return f'"{digest}"'
+
+
+def source_key(path: str, sha256: Optional[str] = None) -> str:
+    # mtime+size del file servito: cambia se la sorgente viene ricodificata con altri parametri
+    st = os.stat(path)
+    return f"{sha256 or ''}-{st.st_mtime_ns}-{st.st_size}"
+
+
+class VariantCache:
+    """
+    Cache su disco delle varianti. L'indice LRU (path -> [byte, ultimo accesso]) è in
+    memoria e viene ricostruito all'avvio dall'mtime dei file; a ogni hit l'mtime viene aggiornato.
+    """
+
+    def __init__(self, root: str = MEDIA_CACHE_DIR, max_mb: float = MEDIA_CACHE_MAX_MB):
+        self.root = Path(root)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        self._total = 0
+        self._scanned = False
+        self._stats = {"hits": 0, "misses": 0, "evicted": 0}
+
+    def _scan(self):
+        if self._scanned:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        files = []
+        for p in self.root.rglob("*.webp"):
+            try:
+                st = p.stat()
+                files.append((st.st_mtime, str(p), st.st_size))
+            except OSError:
+                continue
+        for _, path, size in sorted(files):
+            self._entries[path] = [size, 0.0]
+            self._total += size
+        self._scanned = True
+
+    def _path_for(self, etag: str) -> Path:
+        name = etag.strip('"')
+        return self.root / name[:2] / f"{name}.webp"
+
+    def _evict(self):
+        # La voce più recente e quelle servite negli ultimi MEDIA_EVICT_GRACE secondi (FileResponse
+        # forse ancora da aprire) non vengono eliminate: il totale può superare il limite per poco
+        cutoff = time.monotonic() - MEDIA_EVICT_GRACE
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            path, (size, last_access) = next(iter(self._entries.items()))
+            if last_access > cutoff:
+                break   # ordine LRU: anche le successive sono recenti
+            del self._entries[path]
+            self._total -= size
+            self._stats["evicted"] += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_or_create(self, source_path: str, width: int, etag: str) -> Tuple[str, bool]:
+        """
+        Ritorna (path della variante, hit). Sincrona: chiamarla nel pool immagini.
+        La scrittura è atomica (file temporaneo + os.replace).
+        """
+        path = self._path_for(etag)
+        key = str(path)
+        with self._lock:
+            self._scan()
+            if key in self._entries and path.exists():
+                self._entries[key][1] = time.monotonic()
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+                return key, True
+            self._stats["misses"] += 1
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with Image.open(source_path) as img:
+            img = img.convert("RGB")
+            w, h = img.size
+            if w > width:
+                img = img.resize((width, max(1, round(h * width / w))), Image.LANCZOS, reducing_gap=3.0)
+            tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+            img.save(tmp, format="WEBP", quality=MEDIA_WEBP_QUALITY, **ENCODE_PROFILES[MEDIA_ENCODE_PROFILE])
+        os.replace(tmp, path)
+
+        size = path.stat().st_size
+        with self._lock:
+            if key in self._entries:
+                self._total -= self._entries[key][0]
+            self._total += size
+            self._entries[key] = [size, time.monotonic()]
+            self._entries.move_to_end(key)
+            self._evict()
+        return key, False
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "entries": len(self._entries),
+            "total_mb": round(self._total / 1e6, 1),
+            "max_mb": round(self.max_bytes / 1e6, 1),
+        }
+
+
+# Istanza globale
+variant_cache = VariantCache()
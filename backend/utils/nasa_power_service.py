@@ -1,11 +1,18 @@
 import os
+import time
 from typing import Optional, Dict, Any
-import httpx
+from utils.http_clients import get_async_client, get_sync_client
 from datetime import datetime, timezone
 import math
 
 NASA_POWER_BASE = os.getenv("NASA_POWER_BASE_URL", "https://power.larc.nasa.gov")
 NASA_TIMEOUT = float(os.getenv("NASA_POWER_TIMEOUT", "6"))
+# Cache in memoria per cella + giorno (dati giornalieri: TTL lungo)
+NASA_TTL_SECONDS = int(os.getenv("NASA_POWER_TTL_SECONDS", "21600"))
+NASA_GRID_PRECISION = int(os.getenv("NASA_POWER_GRID_PRECISION", "2"))
+NASA_CACHE_MAX = int(os.getenv("NASA_POWER_CACHE_MAX", "5000"))
+
+_NASA_CACHE: Dict[str, Dict[str, Any]] = {}
 
 SENTINELS = {-999, -999.0, -9999, -9999.0}
 
@@ -56,55 +63,107 @@ def _first_value(d: Optional[Dict[str, Any]]) -> Optional[float]:
 def _san(v):
     return None if (v is None or v in SENTINELS) else float(v)
 
-def get_daily_point(lat: float, lng: float, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+def _cache_key(lat: float, lng: float, ymd: str) -> str:
+    p = NASA_GRID_PRECISION
+    return f"{round(lat, p)}:{round(lng, p)}:{ymd}"
+
+def cache_ttl_left(lat: float, lng: float, now: Optional[datetime] = None) -> float:
+    """Secondi di validità rimasti per (cella, giorno) in cache (0 = da scaricare)."""
+    now = now or datetime.utcnow().replace(tzinfo=timezone.utc)
+    entry = _NASA_CACHE.get(_cache_key(lat, lng, now.strftime("%Y%m%d")))
+    return max(0.0, entry["expires_at"] - time.time()) if entry else 0.0
+
+def _cached(key: str, min_ttl: float = 0) -> Optional[Dict[str, Any]]:
+    entry = _NASA_CACHE.get(key)
+    if entry and entry["expires_at"] - time.time() > min_ttl:
+        return entry["value"]
+    return None
+
+def _store(key: str, value: Optional[Dict[str, Any]]):
+    if value is None:
+        return
+    if len(_NASA_CACHE) >= NASA_CACHE_MAX:
+        # le chiavi includono il giorno: le voci scadute dei giorni passati vengono rimosse
+        t = time.time()
+        for k in [k for k, e in _NASA_CACHE.items() if e["expires_at"] < t]:
+            del _NASA_CACHE[k]
+    _NASA_CACHE[key] = {"value": value, "expires_at": time.time() + NASA_TTL_SECONDS}
+
+def _daily_point_url(lat: float, lng: float, ymd: str) -> str:
+    params = ",".join([
+        "T2M", "T2M_MIN", "T2M_MAX",
+        "RH2M", "WS2M",
+        "ALLSKY_SFC_SW_DWN",
+        "PRECTOTCORR"
+    ])
+    return (
+        f"{NASA_POWER_BASE}/api/temporal/daily/point"
+        f"?parameters={params}&start={ymd}&end={ymd}"
+        f"&latitude={lat}&longitude={lng}&community=AG&format=JSON"
+    )
+
+def _parse_daily_point(j: Dict[str, Any], lat: float, now: datetime, ymd: str) -> Dict[str, Any]:
+    data = j.get("properties", {}).get("parameter", {})
+    t_mean = _san(_first_value(data.get("T2M")))
+    t_min  = _san(_first_value(data.get("T2M_MIN")))
+    t_max  = _san(_first_value(data.get("T2M_MAX")))
+    rh     = _san(_first_value(data.get("RH2M")))
+    ws     = _san(_first_value(data.get("WS2M")))
+    rs     = _san(_first_value(data.get("ALLSKY_SFC_SW_DWN")))  # MJ/m2/day
+    pr     = _san(_first_value(data.get("PRECTOTCORR")))        # mm/day
+
+    et0 = None
+    if t_min is not None and t_max is not None and t_mean is not None:
+        et0 = compute_et0_hargreaves(lat, t_min, t_max, t_mean, now=now)
+
+    return {
+        "temp": t_mean if isinstance(t_mean, float) else None,
+        "tempMin": t_min if isinstance(t_min, float) else None,
+        "tempMax": t_max if isinstance(t_max, float) else None,
+        "humidity": rh if isinstance(rh, float) else None,
+        "wind": ws if isinstance(ws, float) else None,
+        "solarRadiation": rs if isinstance(rs, float) else None,
+        "precipDaily": pr if isinstance(pr, float) else None,
+        "et0": et0 if isinstance(et0, float) else None,
+        "source": "NASA_POWER",
+        "ymd": ymd,
+    }
+
+def get_daily_point(lat: float, lng: float, now: Optional[datetime] = None, min_ttl: float = 0) -> Optional[Dict[str, Any]]:
     """
     Chiama NASA POWER (community=AG) per il giorno 'now' (UTC) e restituisce parametri giornalieri
     + calcola ET0 con Hargreaves quando possibile.
+    Risultati in cache per cella e giorno; 'min_ttl': rinnova in anticipo se la voce
+    scade entro min_ttl secondi (prefetch). Versione sync (script, thread).
     """
+    now = now or datetime.utcnow().replace(tzinfo=timezone.utc)
+    ymd = now.strftime("%Y%m%d")
+    key = _cache_key(lat, lng, ymd)
+    cached = _cached(key, min_ttl)
+    if cached is not None:
+        return cached
     try:
-        now = now or datetime.utcnow().replace(tzinfo=timezone.utc)
-        ymd = now.strftime("%Y%m%d")
-        params = ",".join([
-            "T2M", "T2M_MIN", "T2M_MAX",
-            "RH2M", "WS2M",
-            "ALLSKY_SFC_SW_DWN",
-            "PRECTOTCORR"
-        ])
-        url = (
-            f"{NASA_POWER_BASE}/api/temporal/daily/point"
-            f"?parameters={params}&start={ymd}&end={ymd}"
-            f"&latitude={lat}&longitude={lng}&community=AG&format=JSON"
-        )
-
-        with httpx.Client(timeout=NASA_TIMEOUT) as cli:
-            r = cli.get(url)
-            r.raise_for_status()
-            j = r.json()
-
-        data = j.get("properties", {}).get("parameter", {})
-        t_mean = _san(_first_value(data.get("T2M")))
-        t_min  = _san(_first_value(data.get("T2M_MIN")))
-        t_max  = _san(_first_value(data.get("T2M_MAX")))
-        rh     = _san(_first_value(data.get("RH2M")))
-        ws     = _san(_first_value(data.get("WS2M")))
-        rs     = _san(_first_value(data.get("ALLSKY_SFC_SW_DWN")))  # MJ/m2/day
-        pr     = _san(_first_value(data.get("PRECTOTCORR")))        # mm/day
-
-        et0 = None
-        if t_min is not None and t_max is not None and t_mean is not None:
-            et0 = compute_et0_hargreaves(lat, t_min, t_max, t_mean, now=now)
-
-        return {
-            "temp": t_mean if isinstance(t_mean, float) else None,
-            "tempMin": t_min if isinstance(t_min, float) else None,
-            "tempMax": t_max if isinstance(t_max, float) else None,
-            "humidity": rh if isinstance(rh, float) else None,
-            "wind": ws if isinstance(ws, float) else None,
-            "solarRadiation": rs if isinstance(rs, float) else None,
-            "precipDaily": pr if isinstance(pr, float) else None,
-            "et0": et0 if isinstance(et0, float) else None,
-            "source": "NASA_POWER",
-            "ymd": ymd,
-        }
+        r = get_sync_client("nasa_power").get(_daily_point_url(lat, lng, ymd))
+        r.raise_for_status()
+        value = _parse_daily_point(r.json(), lat, now, ymd)
     except Exception:
-        return None
\ No newline at end of file
+        return None
+    _store(key, value)
+    return value
+
+async def get_daily_point_async(lat: float, lng: float, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """Come get_daily_point, senza bloccare il ciclo di eventi (stessa cache)."""
+    now = now or datetime.utcnow().replace(tzinfo=timezone.utc)
+    ymd = now.strftime("%Y%m%d")
+    key = _cache_key(lat, lng, ymd)
+    cached = _cached(key)
+    if cached is not None:
+        return cached
+    try:
+        r = await get_async_client("nasa_power").get(_daily_point_url(lat, lng, ymd))
+        r.raise_for_status()
+        value = _parse_daily_point(r.json(), lat, now, ymd)
+    except Exception:
+        return None
+    _store(key, value)
+    return value
@@ -0,0 +1,137 @@
+#COSA FA: Richiesta unica a Open-Meteo /v1/forecast per cella di griglia.
+#
+# Previsioni giornaliere (WeatherController), serie orarie meteo (weather_service) e
+# umidità del suolo (copernicus_soil_service) arrivano dalla stessa risposta:
+# una chiamata per cella invece di tre. La risposta viene parsata una volta sola
+# (serie orarie colonnari, vedi utils/hourly_series.py) e condivisa in cache tra
+# i tre consumatori.
+#
+# timezone=auto: i giorni di 'daily' sono quelli locali della posizione; gli orari
+# di 'hourly' vengono riportati in UTC con utc_offset_seconds.
+
+import os
+from typing import Any, Dict, List, Optional
+
+from utils.async_cache import AsyncTTLCache
+from utils.hourly_series import HourlySeries
+from utils.http_clients import get_async_client, get_sync_client
+from utils.weather_grid import grid_key
+
+OPEN_METEO_FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+
+HOURLY_VARS = [
+    "temperature_2m", "relativehumidity_2m", "precipitation", "windspeed_10m",
+    "soil_moisture_0_to_7cm", "soil_moisture_7_to_28cm",
+]
+DAILY_VARS = [
+    "temperature_2m_min", "temperature_2m_max", "relative_humidity_2m_max", "precipitation_sum",
+    "et0_fao_evapotranspiration", "shortwave_radiation_sum", "wind_speed_10m_max",
+]
+
+FORECAST_TTL_SECONDS = int(os.getenv("OPEN_METEO_FORECAST_TTL_SECONDS", "1800"))
+FORECAST_CACHE_MAX = int(os.getenv("OPEN_METEO_FORECAST_CACHE_MAX", "5000"))
+
+
+def _params(lat, lng) -> dict:
+    return {
+        "latitude": lat,
+        "longitude": lng,
+        "current_weather": "true",
+        "hourly": ",".join(HOURLY_VARS),
+        "daily": ",".join(DAILY_VARS),
+        "timezone": "auto",
+    }
+
+
+def parse_forecast(j: dict) -> Dict[str, Any]:
+    """
+    Risposta Open-Meteo (una località) -> bundle condiviso:
+      current_weather, daily (come da API), hourly (HourlySeries in UTC), utc_offset_seconds.
+    """
+    offset = j.get("utc_offset_seconds") or 0
+    return {
+        "current_weather": j.get("current_weather") or {},
+        "daily": j.get("daily") or {},
+        "hourly": HourlySeries.from_open_meteo(j.get("hourly") or {}, offset),
+        "utc_offset_seconds": offset,
+        "timezone": j.get("timezone"),
+    }
+
+
+def has_forecast_data(bundle: Optional[Dict[str, Any]]) -> bool:
+    """False per bundle assenti o vuoti (località senza 'daily' né 'hourly'): da non mettere in cache."""
+    return bool(bundle) and (bool(bundle["daily"]) or len(bundle["hourly"]) > 0)
+
+
+class ForecastBundleStore:
+    """
+    Cache dei bundle per cella (WEATHER_GRID_PRECISION). Versione async con
+    single-flight per il controller, versione sync per i servizi chiamati da thread.
+    """
+
+    def __init__(self):
+        self.cache = AsyncTTLCache(
+            "open_meteo_forecast", ttl=FORECAST_TTL_SECONDS, max_entries=FORECAST_CACHE_MAX, cache_if=has_forecast_data
+        )
+
+    @staticmethod
+    def _key(lat: float, lng: float):
+        return grid_key(lat, lng)
+
+    def get(self, lat: float, lng: float, min_ttl: float = 0) -> Optional[Dict[str, Any]]:
+        """Sync. None in caso di errore."""
+        key = self._key(lat, lng)
+        if self.cache.ttl_left(key) > min_ttl:
+            bundle = self.cache.peek(key)
+            if bundle is not None:
+                return bundle
+        try:
+            r = get_sync_client("open_meteo").get(OPEN_METEO_FORECAST_URL, params=_params(lat, lng))
+            r.raise_for_status()
+            bundle = parse_forecast(r.json())
+        except Exception:
+            return None
+        self.cache.put(key, bundle)
+        return bundle
+
+    async def get_async(self, lat: float, lng: float) -> Optional[Dict[str, Any]]:
+        """Async, richieste concorrenti per la stessa cella condividono la chiamata. None in caso di errore."""
+
+        async def fetch():
+            r = await get_async_client("open_meteo").get(OPEN_METEO_FORECAST_URL, params=_params(lat, lng))
+            return parse_forecast(r.json()) if r.status_code == 200 else None
+
+        return await self.cache.get_or_fetch(self._key(lat, lng), fetch)
+
+    async def get_many_async(self, points: List[tuple]) -> Optional[List[Optional[Dict[str, Any]]]]:
+        """
+        Bundle per più località [(lat, lng), ...] con una richiesta multi-località
+        (coordinate separate da virgola); ogni bundle finisce in cache per la sua cella.
+        None se la richiesta fallisce; None al posto del bundle per le località senza dati.
+        """
+        if not points:
+            return []
+        lats = ",".join(str(p[0]) for p in points)
+        lngs = ",".join(str(p[1]) for p in points)
+        r = await get_async_client("open_meteo").get(OPEN_METEO_FORECAST_URL, params=_params(lats, lngs))
+        if r.status_code != 200:
+            return None
+        j = r.json()
+        # Con una sola località Open-Meteo risponde con un oggetto, con più località con una lista
+        items = [j] if isinstance(j, dict) else j
+        bundles = []
+        for (lat, lng), item in zip(points, items):
+            bundle = parse_forecast(item or {})
+            if not has_forecast_data(bundle):
+                bundles.append(None)
+                continue
+            self.cache.put(self._key(lat, lng), bundle)
+            bundles.append(bundle)
+        return bundles
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+# Istanza globale
+forecast_bundles = ForecastBundleStore()
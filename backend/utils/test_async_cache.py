@@ -0,0 +1,106 @@
+"""
+Test di AsyncTTLCache (nessun servizio esterno).
+Esecuzione: python -m pytest utils/test_async_cache.py  (da backend/)
+oppure:     python utils/test_async_cache.py
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from utils.async_cache import AsyncTTLCache
+
+
+class Counter:
+    """Fetch finto: conta le chiamate e ritorna il numero della chiamata."""
+
+    def __init__(self, delay: float = 0.0):
+        self.calls = 0
+        self.delay = delay
+
+    async def __call__(self):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return {"n": self.calls}
+
+
+def test_ttl_expiry():
+    async def run():
+        cache = AsyncTTLCache("test", ttl=0.05)
+        fetch = Counter()
+        assert (await cache.get_or_fetch("k", fetch))["n"] == 1
+        assert (await cache.get_or_fetch("k", fetch))["n"] == 1      # fresco: nessun fetch
+        await asyncio.sleep(0.08)
+        assert (await cache.get_or_fetch("k", fetch))["n"] == 2      # scaduto: nuovo fetch
+        assert fetch.calls == 2
+        assert cache.stats()["hits"] == 1
+
+    asyncio.run(run())
+
+
+def test_single_flight():
+    async def run():
+        cache = AsyncTTLCache("test", ttl=10)
+        fetch = Counter(delay=0.05)
+        results = await asyncio.gather(*(cache.get_or_fetch("cella", fetch) for _ in range(100)))
+        assert fetch.calls == 1
+        assert all(r["n"] == 1 for r in results)
+        stats = cache.stats()
+        assert stats["misses"] == 1 and stats["coalesced"] == 99 and stats["inflight"] == 0
+
+    asyncio.run(run())
+
+
+def test_stale_while_revalidate():
+    async def run():
+        cache = AsyncTTLCache("test", ttl=0.05, stale_ttl=5)
+        fetch = Counter(delay=0.02)
+        assert (await cache.get_or_fetch("k", fetch))["n"] == 1
+        await asyncio.sleep(0.08)
+        # Scaduto ma servibile: valore vecchio subito, aggiornamento in background
+        assert (await cache.get_or_fetch("k", fetch))["n"] == 1
+        assert cache.stats()["stale_hits"] == 1
+        await asyncio.sleep(0.05)
+        assert (await cache.get_or_fetch("k", fetch))["n"] == 2
+        assert fetch.calls == 2
+
+    asyncio.run(run())
+
+
+def test_empty_results_not_cached():
+    async def run():
+        cache = AsyncTTLCache("test", ttl=10)
+        calls = []
+
+        async def empty():
+            calls.append(1)
+            return {}
+
+        await cache.get_or_fetch("k", empty)
+        await cache.get_or_fetch("k", empty)
+        assert len(calls) == 2
+        assert cache.peek("k") is None
+
+    asyncio.run(run())
+
+
+def test_lru_eviction_and_put():
+    cache = AsyncTTLCache("test", ttl=10, max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.peek("a") == 1           # "a" diventa la più recente
+    cache.put("c", 3)
+    assert cache.peek("b") is None and cache.peek("a") == 1 and cache.peek("c") == 3
+    assert cache.stats()["evicted"] == 1
+    assert 9 < cache.ttl_left("a") <= 10
+    assert cache.ttl_left("assente") == 0.0
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"  ✔︎ {name}")
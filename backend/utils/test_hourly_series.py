@@ -0,0 +1,85 @@
+"""
+Test di HourlySeries (serie orarie Open-Meteo colonnari).
+Esecuzione: python -m pytest utils/test_hourly_series.py  (da backend/)
+oppure:     python utils/test_hourly_series.py
+"""
+
+import math
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from utils.hourly_series import HourlySeries
+
+BASE = datetime(2026, 10, 19, 0, 0)   # ora locale della prima riga
+
+
+def _hourly(n: int = 48, **columns) -> dict:
+    hourly = {"time": [(BASE + timedelta(hours=i)).strftime("%Y-%m-%dT%H:%M") for i in range(n)]}
+    hourly.update(columns)
+    return hourly
+
+
+def test_start_index_utc_offset():
+    # UTC+2: la riga locale 06:00 è 04:00 UTC
+    series = HourlySeries.from_open_meteo(_hourly(precipitation=[0.0] * 48), utc_offset_seconds=7200)
+    i = series.start_index(datetime(2026, 10, 19, 3, 30))
+    assert i == 6
+    assert series.time_at(i) == "2026-10-19T04:00"
+    # Ora esatta: la prima ora >= adesso è quella stessa
+    assert series.start_index(datetime(2026, 10, 19, 4, 0)) == 6
+
+
+def test_start_index_fallbacks():
+    series = HourlySeries.from_open_meteo(_hourly(precipitation=[0.0] * 48))
+    assert series.start_index(datetime(2030, 1, 1)) == 0          # tutta nel passato
+    assert series.start_index(datetime(2020, 1, 1)) == 0
+    assert HourlySeries.from_open_meteo({}).start_index() == 0    # serie vuota
+    assert HourlySeries.from_open_meteo({"time": ["non-una-data"], "x": [1]}).start_index() == 0
+
+
+def test_window_sum_and_mean():
+    series = HourlySeries.from_open_meteo(_hourly(
+        precipitation=[0.5] * 48,
+        relativehumidity_2m=[60 + i for i in range(48)],
+    ))
+    assert series.window_sum("precipitation", 24, 6) == 12.0
+    assert series.window_mean("relativehumidity_2m", 6, 6) == 68.5
+    # Finestra oltre la fine: solo le ore disponibili
+    assert series.window_sum("precipitation", 24, 40) == 4.0
+    # Variabile assente
+    assert series.window_sum("assente", 24, 0) is None
+    assert series.window_mean("assente", 6, 0) is None
+
+
+def test_nan_handling():
+    series = HourlySeries.from_open_meteo(_hourly(
+        windspeed_10m=[None] + [3.0] * 47,
+        soil_moisture_0_to_7cm=[None] * 48,
+    ))
+    # Un valore mancante nella finestra: None (come i controlli isinstance originali)
+    assert series.window_mean("windspeed_10m", 6, 0) is None
+    assert series.window_mean("windspeed_10m", 6, 1) == 3.0
+    # Senza require_complete i mancanti vengono ignorati, ma una finestra tutta NaN resta None
+    assert series.window_mean("windspeed_10m", 6, 0, require_complete=False) == 3.0
+    assert series.window_sum("soil_moisture_0_to_7cm", 6, 0, require_complete=False) is None
+    assert series.value_at("windspeed_10m", 0) is None
+    assert series.value_at("windspeed_10m", 1) == 3.0
+    assert series.value_at("windspeed_10m", 99) is None
+    assert math.isnan(series.columns["windspeed_10m"][0])
+
+
+def test_mismatched_columns_dropped():
+    series = HourlySeries.from_open_meteo(_hourly(n=4, precipitation=[1, 2, 3], temperature_2m=[1, 2, 3, 4]))
+    assert "precipitation" not in series.columns
+    assert series.value_at("temperature_2m", 3) == 4.0
+    assert len(series) == 4
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"  ✔︎ {name}")
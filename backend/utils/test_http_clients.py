@@ -0,0 +1,103 @@
+"""
+Test del registro dei client HTTP condivisi (nessuna richiesta di rete).
+Esecuzione: python -m pytest utils/test_http_clients.py  (da backend/)
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+pytest.importorskip("httpx")
+
+from utils.http_clients import HttpClients, INTEGRATIONS
+
+
+def test_async_client_reused_within_loop():
+    clients = HttpClients()
+
+    async def run():
+        a = clients.get_async("open_meteo")
+        b = clients.get_async("open_meteo")
+        assert a is b
+        assert not a.follow_redirects
+        assert a.timeout.read == INTEGRATIONS["open_meteo"]["timeout"]
+        await clients.aclose()
+        assert a.is_closed
+
+    asyncio.run(run())
+
+
+def test_client_recreated_after_aclose_in_new_loop():
+    clients = HttpClients()
+
+    async def first():
+        client = clients.get_async("nominatim")
+        await clients.aclose()
+        return client
+
+    async def second():
+        client = clients.get_async("nominatim")
+        await clients.aclose()
+        return client
+
+    old = asyncio.run(first())
+    assert old.is_closed
+    assert asyncio.run(second()) is not old
+
+
+def test_client_of_finished_loop_fails_loudly():
+    clients = HttpClients()
+
+    async def leak():
+        return clients.get_async("nasa_power")    # nessuna aclose() prima della fine del ciclo
+
+    async def reuse():
+        with pytest.raises(RuntimeError):
+            clients.get_async("nasa_power")
+        # Il client orfano è stato scartato: la richiesta successiva ne crea uno nuovo
+        client = clients.get_async("nasa_power")
+        await clients.aclose()
+        return client
+
+    old = asyncio.run(leak())
+    assert asyncio.run(reuse()) is not old
+
+
+async def _get(clients, name):
+    return clients.get_async(name)
+
+
+def test_client_of_running_loop_closed_there():
+    clients = HttpClients()
+    other = asyncio.new_event_loop()
+    thread = threading.Thread(target=other.run_forever, daemon=True)
+    thread.start()
+    try:
+        old = asyncio.run_coroutine_threadsafe(_get(clients, "trefle"), other).result(timeout=5)
+
+        async def run():
+            client = clients.get_async("trefle")
+            await clients.aclose()
+            return client
+
+        assert asyncio.run(run()) is not old
+        for _ in range(50):
+            if old.is_closed:
+                break
+            time.sleep(0.02)
+        assert old.is_closed                            # chiuso nel ciclo che lo possiede
+    finally:
+        other.call_soon_threadsafe(other.stop)
+        thread.join(timeout=5)
+        other.close()
+
+
+def test_unknown_integration():
+    with pytest.raises(KeyError):
+        HttpClients().get_sync("sconosciuta")
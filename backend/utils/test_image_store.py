@@ -0,0 +1,219 @@
+"""
+Test dei riferimenti dello storage per contenuto (utils/image_store.py), con una
+collection in memoria al posto di 'image_blobs' e file finti al posto dei WEBP.
+Esecuzione: python -m pytest utils/test_image_store.py  (da backend/)
+"""
+
+import copy
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+pytest.importorskip("pymongo")
+
+from pymongo.errors import DuplicateKeyError
+
+from utils import image_store
+
+
+class FakeBlobs:
+    """Sottoinsieme delle operazioni di Collection usate da image_store."""
+
+    def __init__(self):
+        self.docs = {}
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def _match(doc, flt):
+        for field, cond in flt.items():
+            value = doc.get(field)
+            if isinstance(cond, dict):
+                if "$gt" in cond and not (value is not None and value > cond["$gt"]):
+                    return False
+                if "$lte" in cond and not (value is not None and value <= cond["$lte"]):
+                    return False
+                if "$exists" in cond and (field in doc) != cond["$exists"]:
+                    return False
+            elif value != cond:
+                return False
+        return True
+
+    def _find(self, flt):
+        return next((d for d in self.docs.values() if self._match(d, flt)), None)
+
+    @staticmethod
+    def _apply(doc, update):
+        doc.update(update.get("$set", {}))
+        for k, v in update.get("$inc", {}).items():
+            doc[k] = doc.get(k, 0) + v
+
+    def find_one(self, flt):
+        with self.lock:
+            return copy.deepcopy(self._find(flt))
+
+    def find_one_and_update(self, flt, update, return_document=None):
+        with self.lock:
+            doc = self._find(flt)
+            if doc is None:
+                return None
+            self._apply(doc, update)
+            return copy.deepcopy(doc)
+
+    def update_one(self, flt, update, upsert=False):
+        with self.lock:
+            doc = self._find(flt)
+            if doc is None:
+                if not upsert:
+                    return SimpleNamespace(modified_count=0)
+                if flt["_id"] in self.docs:
+                    raise DuplicateKeyError("E11000")
+                doc = {"_id": flt["_id"], **update.get("$setOnInsert", {})}
+                self.docs[doc["_id"]] = doc
+            self._apply(doc, update)
+            return SimpleNamespace(modified_count=1)
+
+    def count_documents(self, flt, limit=0):
+        with self.lock:
+            return sum(1 for d in self.docs.values() if self._match(d, flt))
+
+    def delete_one(self, flt):
+        with self.lock:
+            doc = self._find(flt)
+            if doc is not None:
+                del self.docs[doc["_id"]]
+            return SimpleNamespace(deleted_count=1 if doc is not None else 0)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    blobs = FakeBlobs()
+    encodes = []
+
+    def fake_save(data, subdir, base_name, **kwargs):
+        encodes.append(base_name)
+        main = tmp_path / f"{base_name}.webp"
+        thumb = tmp_path / f"{base_name}_sm.webp"
+        main.write_bytes(data)
+        thumb.write_bytes(data[:4])
+        return {"url": f"/u/{main.name}", "thumbUrl": f"/u/{thumb.name}", "rel": main.name,
+                "relThumb": thumb.name, "abs": str(main), "absThumb": str(thumb)}
+
+    monkeypatch.setattr(image_store, "blobs_collection", blobs)
+    monkeypatch.setattr(image_store, "save_image_bytes", fake_save)
+    return blobs, encodes
+
+
+def test_duplicate_upload_acquires_reference(store):
+    blobs, encodes = store
+    first = image_store.store_image_bytes(b"stessi-byte")
+    second = image_store.store_image_bytes(b"stessi-byte")
+    assert not first["dedup"] and second["dedup"]
+    assert first["abs"] == second["abs"]
+    assert len(encodes) == 1                                   # nessun secondo encoding
+    assert next(iter(blobs.docs.values()))["refs"] == 2
+
+
+def test_release_deletes_files_on_last_reference(store):
+    blobs, _ = store
+    saved = image_store.store_image_bytes(b"stessi-byte")
+    image_store.store_image_bytes(b"stessi-byte")
+
+    assert image_store.release_image_files(saved["abs"], saved["absThumb"]) is False
+    assert Path(saved["abs"]).exists()
+    assert image_store.release_image_files(saved["abs"], saved["absThumb"]) is True
+    assert not Path(saved["abs"]).exists() and not Path(saved["absThumb"]).exists()
+    assert blobs.docs == {}
+
+
+def test_different_parameters_do_not_share_files(store):
+    _, encodes = store
+    a = image_store.store_image_bytes(b"stessi-byte", thumb_side=384)
+    b = image_store.store_image_bytes(b"stessi-byte", thumb_side=256)
+    c = image_store.store_image_bytes(b"stessi-byte", webp_quality=60)
+    d = image_store.store_image_bytes(b"stessi-byte", profile="best")
+    assert len({a["abs"], b["abs"], c["abs"], d["abs"]}) == 4
+    assert len(encodes) == 4
+
+
+def test_release_unmanaged_file(store, tmp_path):
+    legacy = tmp_path / "legacy.webp"
+    legacy.write_bytes(b"x")
+    assert image_store.release_image_files(str(legacy)) is True
+    assert not legacy.exists()
+
+
+def test_release_marks_blob_before_unlinking(store, monkeypatch):
+    blobs, _ = store
+    saved = image_store.store_image_bytes(b"stessi-byte")
+    seen = []
+    real_remove = image_store.os.remove
+
+    def remove(path):
+        # Durante l'eliminazione il blob è marcato: nessun upload può riprenderlo
+        doc = next(iter(blobs.docs.values()))
+        seen.append((doc["refs"], "deleting" in doc))
+        real_remove(path)
+
+    monkeypatch.setattr(image_store.os, "remove", remove)
+    assert image_store.release_image_files(saved["abs"], saved["absThumb"]) is True
+    assert seen == [(0, True), (0, True)]
+    assert blobs.docs == {}
+
+
+def test_upload_waits_for_pending_deletion(store, monkeypatch):
+    blobs, encodes = store
+    monkeypatch.setattr(image_store, "CAS_DELETE_POLL_S", 0.005)
+    saved = image_store.store_image_bytes(b"stessi-byte")
+    key = next(iter(blobs.docs))
+    # Rilascio in corso: ultimo riferimento tolto, file in eliminazione
+    blobs.docs[key].update(refs=0, deleting=datetime.utcnow())
+
+    result = {}
+    upload = threading.Thread(target=lambda: result.update(image_store.store_image_bytes(b"stessi-byte")))
+    upload.start()
+    time.sleep(0.05)
+    assert upload.is_alive()                                  # non riprende un blob in eliminazione
+    Path(saved["abs"]).unlink()
+    Path(saved["absThumb"]).unlink()
+    blobs.delete_one({"_id": key})                            # il rilascio termina
+    upload.join(timeout=5)
+
+    assert not result["dedup"] and Path(result["abs"]).exists()
+    assert blobs.docs[key]["refs"] == 1 and "deleting" not in blobs.docs[key]
+    assert len(encodes) == 2
+
+
+def test_stale_deletion_marker_is_taken_over(store):
+    blobs, _ = store
+    image_store.store_image_bytes(b"stessi-byte")
+    key = next(iter(blobs.docs))
+    stale = datetime.utcnow() - timedelta(seconds=image_store.CAS_DELETING_STALE_S + 1)
+    blobs.docs[key].update(refs=0, deleting=stale)
+
+    saved = image_store.store_image_bytes(b"stessi-byte")
+    assert Path(saved["abs"]).exists()
+    assert blobs.docs[key]["refs"] == 1 and "deleting" not in blobs.docs[key]
+
+
+def test_files_removed_before_insert_are_rewritten(store, tmp_path, monkeypatch):
+    blobs, encodes = store
+    real_update = blobs.update_one
+
+    def update_one(flt, update, upsert=False):
+        if upsert:
+            # Un rilascio del blob precedente elimina i file appena scritti
+            for f in tmp_path.glob("*.webp"):
+                f.unlink()
+        return real_update(flt, update, upsert)
+
+    monkeypatch.setattr(blobs, "update_one", update_one)
+    saved = image_store.store_image_bytes(b"stessi-byte")
+    assert Path(saved["abs"]).exists() and Path(saved["absThumb"]).exists()
+    assert len(encodes) == 2
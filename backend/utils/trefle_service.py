@@ -3,6 +3,8 @@ from typing import Any, Dict, List, Optional, Union
 import httpx
 from functools import lru_cache
 
+from utils.http_clients import get_sync_client
+
 TREFLE_TOKEN = os.getenv("TREFLE_TOKEN")  # obbligatorio
 TREFLE_BASE_URL = (os.getenv("TREFLE_BASE_URL", "https://trefle.io/api/v1") or "").rstrip("/")
 DEFAULT_TIMEOUT = 12.0
@@ -22,14 +24,15 @@ def _ensure_token():
 
 def _client() -> httpx.Client:
     """
-    Client HTTP con Authorization: Bearer e timeout.
+    Client HTTP condiviso (keep-alive) con Authorization: Bearer e timeout.
+    Non va chiuso dal chiamante: è gestito dal registro in utils.http_clients.
     """
     headers = {
         "Authorization": f"Bearer {TREFLE_TOKEN}",
         "Accept": "application/json",
         "User-Agent": "HomeGardening/1.0 (+https://example.com)",
     }
-    return httpx.Client(timeout=DEFAULT_TIMEOUT, headers=headers)
+    return get_sync_client("trefle", headers=headers)
 
 
 def _get(path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
@@ -40,11 +43,10 @@ def _get(path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     _ensure_token()
     url = f"{TREFLE_BASE_URL}/{path.lstrip('/')}"
     try:
-        with _client() as cli:
-            r = cli.get(url, params=params or {})
-            if r.status_code >= 400:
-                raise TrefleError(f"HTTP {r.status_code} – {r.text}")
-            return r.json()
+        r = _client().get(url, params=params or {})
+        if r.status_code >= 400:
+            raise TrefleError(f"HTTP {r.status_code} – {r.text}")
+        return r.json()
     except httpx.RequestError as e:
         raise TrefleError(f"Errore di rete verso Trefle: {str(e)}")
 
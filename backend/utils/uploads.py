@@ -0,0 +1,90 @@
+import hashlib
+import os
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+from config import MAX_UPLOAD_MB, IMAGE_UPLOAD_MAX_MB
+
+# Lettura a blocchi: il limite viene applicato durante la lettura, non dopo
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_KB", "256")) * 1024
+# Limite sul corpo della richiesta (Content-Length), verificato prima del parsing multipart.
+# Deve coprire il limite più alto tra le route di upload (foto da analizzare: IMAGE_UPLOAD_MAX_MB) + overhead multipart.
+UPLOAD_REQUEST_MAX_MB = float(os.getenv("UPLOAD_REQUEST_MAX_MB", str(max(MAX_UPLOAD_MB, IMAGE_UPLOAD_MAX_MB, 8) + 1)))
+
+
+class UploadedImage:
+    """
+    Contenuto di un upload letto a blocchi.
+    'data' è un bytearray preallocato alla dimensione dichiarata (nessuna copia
+    intermedia); 'sha256' è calcolato durante la lettura.
+    """
+    __slots__ = ("data", "size", "sha256", "filename", "content_type")
+
+    def __init__(self, data: bytearray, sha256: str, filename: Optional[str], content_type: Optional[str]):
+        self.data = data
+        self.size = len(data)
+        self.sha256 = sha256
+        self.filename = filename
+        self.content_type = content_type
+
+
+def _too_large(max_mb: float) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Immagine troppo grande (max {max_mb:g}MB)")
+
+
+async def read_upload(file: UploadFile, max_mb: float = MAX_UPLOAD_MB, require_image: bool = True) -> UploadedImage:
+    """
+    Legge un UploadFile a blocchi di UPLOAD_CHUNK_SIZE:
+    - rifiuta subito (413) se la dimensione dichiarata supera max_mb, senza leggere nulla;
+    - interrompe la lettura appena i byte letti superano max_mb;
+    - calcola sha256 in modo incrementale (usato come chiave della cache CNN).
+    La memoria per upload resta limitata a max_mb.
+    """
+    if require_image and not (file.content_type or "").startswith("image/"):
+        raise HTTPException(status_code=400, detail="File non valido")
+
+    limit = int(max_mb * 1024 * 1024)
+    declared = getattr(file, "size", None)
+    if declared is not None and declared > limit:
+        raise _too_large(max_mb)
+
+    buf = bytearray(declared or 0)
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        end = size + len(chunk)
+        if end > limit:
+            raise _too_large(max_mb)
+        digest.update(chunk)
+        if end <= len(buf):
+            buf[size:end] = chunk
+        else:
+            # dimensione non dichiarata (o errata): crescita del buffer
+            del buf[size:]
+            buf += chunk
+        size = end
+    del buf[size:]
+
+    if not size:
+        raise HTTPException(status_code=400, detail="File vuoto")
+    return UploadedImage(buf, digest.hexdigest(), file.filename, file.content_type)
+
+
+async def limit_request_size(request, call_next):
+    """
+    Middleware HTTP: rifiuta con 413 le richieste con Content-Length oltre
+    UPLOAD_REQUEST_MAX_MB prima che il corpo venga letto e parsato.
+    """
+    if request.method in ("POST", "PUT", "PATCH"):
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > UPLOAD_REQUEST_MAX_MB * 1024 * 1024:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"Richiesta troppo grande (max {UPLOAD_REQUEST_MAX_MB:g}MB)"},
+            )
+    return await call_next(request)
@@ -0,0 +1,11 @@
+#COSA FA: Celle di griglia meteo (lat/lng arrotondati a WEATHER_GRID_PRECISION decimali).
+# Modulo foglia (nessun import interno): chiave comune a weather_service, bundle
+# Open-Meteo, WeatherController e prefetch.
+
+import os
+
+WEATHER_GRID_PRECISION = int(os.getenv("WEATHER_GRID_PRECISION", "2"))
+
+def grid_key(lat: float, lng: float, precision: int = None) -> str:
+    p = WEATHER_GRID_PRECISION if precision is None else precision
+    return f"{round(lat, p)}:{round(lng, p)}"
@@ -0,0 +1,126 @@
+#COSA FA: Job in background che mantiene calde le cache meteo per le celle in cui ci sono piante.
+#
+# Ogni WEATHER_PREFETCH_INTERVAL secondi:
+#   1. enumera le celle di griglia distinte di tutte le piante con coordinate (aggregazione Mongo);
+#   2. per le celle la cui voce scade entro WEATHER_PREFETCH_MARGIN secondi (o assente) aggiorna
+#      - meteo Open-Meteo (previsioni + storico, richieste multi-località a blocchi),
+#      - NASA POWER e umidità del suolo (una richiesta per cella);
+#   3. rispetta WEATHER_PREFETCH_RPS richieste/secondo verso gli upstream, con jitter.
+# Così il click su "analizza" trova i dati già in cache.
+# Da attivare su un solo processo (WEATHER_PREFETCH_ENABLED=1): le cache sono in memoria del processo.
+
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Dict, Tuple
+
+from database import db
+from controllers.weather_controller import weatherController, WEATHER_BATCH_CHUNK
+from utils.weather_grid import grid_key, WEATHER_GRID_PRECISION
+from utils import nasa_power_service, copernicus_soil_service
+
+logger = logging.getLogger(__name__)
+
+WEATHER_PREFETCH_ENABLED = os.getenv("WEATHER_PREFETCH_ENABLED", "0").strip().lower() in ("1", "true", "yes", "on")
+WEATHER_PREFETCH_INTERVAL = int(os.getenv("WEATHER_PREFETCH_INTERVAL", "600"))     # pausa tra due passate (s)
+WEATHER_PREFETCH_MARGIN = int(os.getenv("WEATHER_PREFETCH_MARGIN", "900"))         # anticipo sulla scadenza (s)
+WEATHER_PREFETCH_RPS = float(os.getenv("WEATHER_PREFETCH_RPS", "2"))               # richieste upstream/s
+WEATHER_PREFETCH_JITTER = float(os.getenv("WEATHER_PREFETCH_JITTER", "0.3"))       # ±30% sulle pause
+WEATHER_PREFETCH_SOURCES = {
+    s.strip() for s in os.getenv("WEATHER_PREFETCH_SOURCES", "weather,nasa,soil").split(",") if s.strip()
+}
+
+
+class WeatherPrefetcher:
+    def __init__(self, plants_collection=None):
+        self.plants = plants_collection if plants_collection is not None else db["piante"]
+        self._stats = {"runs": 0, "cells": 0, "weather": 0, "nasa": 0, "soil": 0, "errors": 0,
+                       "last_run_at": None, "last_run_s": None}
+
+    def active_cells(self) -> Dict[str, Tuple[float, float]]:
+        """Celle di griglia distinte delle piante con coordinate: {cella: (lat, lon)}."""
+        p = WEATHER_GRID_PRECISION
+        pipeline = [
+            {"$match": {"geoLat": {"$type": "number"}, "geoLng": {"$type": "number"}}},
+            {"$group": {"_id": {"lat": {"$round": ["$geoLat", p]}, "lng": {"$round": ["$geoLng", p]}}}},
+        ]
+        cells = {}
+        for doc in self.plants.aggregate(pipeline):
+            lat, lng = doc["_id"]["lat"], doc["_id"]["lng"]
+            cells[grid_key(lat, lng)] = (lat, lng)
+        return cells
+
+    async def _throttle(self, requests: int):
+        if WEATHER_PREFETCH_RPS <= 0:
+            return
+        delay = requests / WEATHER_PREFETCH_RPS
+        await asyncio.sleep(delay * random.uniform(1 - WEATHER_PREFETCH_JITTER, 1 + WEATHER_PREFETCH_JITTER))
+
+    async def _refresh_weather(self, cells: Dict[str, Tuple[float, float]]):
+        due = {k: c for k, c in cells.items() if weatherController.ttl_left(*c) <= WEATHER_PREFETCH_MARGIN}
+        keys = list(due)
+        for i in range(0, len(keys), WEATHER_BATCH_CHUNK):
+            chunk = {k: due[k] for k in keys[i:i + WEATHER_BATCH_CHUNK]}
+            try:
+                self._stats["weather"] += await weatherController.refresh_cells(chunk)
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.warning(f"[METEO PREFETCH] meteo: {e}")
+            await self._throttle(2)   # previsioni + storico
+
+    async def _refresh_point(self, name: str, ttl_left, fn, lat: float, lng: float) -> bool:
+        """Rinnova la voce della cella se scade entro il margine. True se ha fatto una richiesta."""
+        if ttl_left(lat, lng) > WEATHER_PREFETCH_MARGIN:
+            return False
+        try:
+            if await asyncio.to_thread(fn, lat, lng, min_ttl=WEATHER_PREFETCH_MARGIN) is not None:
+                self._stats[name] += 1
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning(f"[METEO PREFETCH] {name} {lat},{lng}: {e}")
+        return True
+
+    async def run_once(self) -> dict:
+        t0 = time.perf_counter()
+        cells = await asyncio.to_thread(self.active_cells)
+        if "weather" in WEATHER_PREFETCH_SOURCES:
+            await self._refresh_weather(cells)
+
+        # NASA e suolo: una richiesta per cella, solo per le voci in scadenza
+        sources = [
+            ("nasa", nasa_power_service.cache_ttl_left, nasa_power_service.get_daily_point),
+            ("soil", copernicus_soil_service.cache_ttl_left, copernicus_soil_service.get_soil_moisture),
+        ]
+        sources = [src for src in sources if src[0] in WEATHER_PREFETCH_SOURCES]
+        for lat, lng in cells.values():
+            fetched = 0
+            for name, ttl_left, fn in sources:
+                fetched += await self._refresh_point(name, ttl_left, fn, lat, lng)
+            if fetched:
+                await self._throttle(fetched)
+
+        self._stats["runs"] += 1
+        self._stats["cells"] = len(cells)
+        self._stats["last_run_at"] = time.time()
+        self._stats["last_run_s"] = round(time.perf_counter() - t0, 1)
+        return self.stats()
+
+    async def run_forever(self, interval: int = WEATHER_PREFETCH_INTERVAL):
+        """Loop in background: prima passata dopo una pausa casuale (più processi non partono insieme)."""
+        await asyncio.sleep(random.uniform(0, min(30, interval) * WEATHER_PREFETCH_JITTER))
+        while True:
+            try:
+                report = await self.run_once()
+                logger.info(f"[METEO PREFETCH] Passata completata: {report}")
+            except Exception as e:
+                logger.error(f"[METEO PREFETCH] Errore: {e}")
+            await asyncio.sleep(interval * random.uniform(1 - WEATHER_PREFETCH_JITTER, 1 + WEATHER_PREFETCH_JITTER))
+
+    def stats(self) -> dict:
+        return {**self._stats, "enabled": WEATHER_PREFETCH_ENABLED}
+
+
+# Istanza globale
+weather_prefetcher = WeatherPrefetcher()
@@ -25,6 +25,8 @@ export async function getImagesList(filters = {}) {
   if (filters.planttype) params.planttype = filters.planttype;
   if (filters.processed !== undefined) params.processed = filters.processed;
   if (filters.only_uploads) params.only_uploads = true;
+  if (filters.cursor) params.cursor = filters.cursor; // nextCursor della pagina precedente
+  if (filters.view) params.view = filters.view;       // "full" | "summary"
 
   const { data } = await api.get("/api/images/list", { params });
   return data;